@@ -0,0 +1,251 @@
+# analytics.py
+import time
+
+import numpy as np
+
+from database import iter_history_schemas
+from main import from_cents
+
+FETCH_SIZE = 50000  # 每次 fetchmany 的行数
+WEEKDAY_NAMES = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+DIMENSIONS = ("month", "category", "weekday", "type")
+TYPE_NAMES = ("expense", "income")  # type 编码: 0=expense, 1=income
+SPLIT_BITS = 24  # 整数求和时低位部分的位数，见 _sum_by
+
+# 汇总表的总笔数与总金额，刷新时先比较它，不符再逐键比较
+LEDGER_TOTALS_SQL = "SELECT COALESCE(SUM(count), 0), COALESCE(SUM(total), 0) FROM monthly_totals"
+
+
+def _sum_by(keys, values, minlength=0):
+    """
+    按 keys 分组对 int64 的 values 精确求和（bincount 的权重按 float64 累加，
+    金额较大或行数较多时会丢失精度，所以拆成高低两部分分别 bincount 后在 int64 中合并；
+    低位部分每项小于 2**SPLIT_BITS，各分组累加值保持在 float64 可精确表示的范围内）
+    """
+    low = np.bincount(keys, weights=values & ((1 << SPLIT_BITS) - 1), minlength=minlength)
+    high = np.bincount(keys, weights=values >> SPLIT_BITS, minlength=minlength)
+    return (high.astype(np.int64) << SPLIT_BITS) + low.astype(np.int64)
+
+
+def _checksum(days, months, types, amounts, categories):
+    """ 给定各列按 LedgerArrays._ledger_checksum 的口径计算的校验和（bincount 向量化汇总）"""
+    if not len(days):
+        return {}, {}
+    signed = np.where(types == 1, amounts, -amounts)
+
+    base_month = int(months.min())
+    size = int(categories.max()) + 1
+    keys = ((months - base_month).astype(np.intp) * size + categories) * 2 + types
+    counts = np.bincount(keys)
+    totals = _sum_by(keys, amounts)
+    monthly = {}
+    for key in np.flatnonzero(counts):
+        rest, code = divmod(int(key), 2)
+        month, category = divmod(rest, size)
+        monthly[(str(np.datetime64(base_month + month, 'M')), TYPE_NAMES[code], category)] = \
+            (int(counts[key]), int(totals[key]))
+
+    base_day = int(days.min())
+    day_keys = (days - base_day).astype(np.intp)
+    counts = np.bincount(day_keys)
+    nets = _sum_by(day_keys, signed)
+    daily = {str(np.datetime64(base_day + int(day), 'D')): (int(counts[day]), int(nets[day]))
+             for day in np.flatnonzero(counts)}
+    return monthly, daily
+
+
+def _months_of(days):
+    """ 距 1970-01-01 的天数 -> 距 1970-01 的月数 """
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int32)
+
+
+class LedgerArrays:
+    """
+    交易表的列式内存副本，用于跨月份的多维统计
+    - days: int32，距 1970-01-01 的天数
+    - amounts: int64，金额（分）
+    - types: int8，0=expense，1=income
+    - categories: int32，分类 id（即 categories 表主键，category_names[id] 为分类名）
+    各列按日期排序，日期过滤是 searchsorted 得到的切片（不复制数据）；
+    所有分组统计都是对整列的向量化归约，不逐行遍历
+    """
+
+    def __init__(self):
+        self.ids = np.empty(0, np.int64)
+        self.days = np.empty(0, np.int32)
+        self.months = np.empty(0, np.int32)  # 距 1970-01 的月数，由 days 派生
+        self.amounts = np.empty(0, np.int64)
+        self.types = np.empty(0, np.int8)
+        self.categories = np.empty(0, np.int32)
+        self.weekdays = np.empty(0, np.int8)
+        self.category_names = {}
+        self.last_id = 0
+        self._checksum = ({}, {})  # 内存副本的校验和，随新增记录增量更新
+        self._totals = (0, 0)  # 内存副本的 (总笔数, 总金额)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # === 加载 ===
+    def load(self, conn):
+        """ 全量加载交易表（含各归档库，按年份从早到晚依次读取）"""
+        self.__init__()
+        self._append_rows(conn, 0, iter_history_schemas(conn))
+        self._checksum = self._local_checksum()
+        self._totals = (len(self), int(self.amounts.sum()))
+        return self
+
+    def refresh(self, conn):
+        """
+        增量刷新：只读取 id 大于上次加载的新记录（新记录只会写入主库）
+        若发现有删除或修改（汇总表校验和与内存不符）则退回全量加载；
+        先比较总笔数与总金额，相符时再按 (月份, 类型, 分类) 和日期两级逐键比较，
+        改动日期、分类的修改同样能发现；内存一侧的校验和只累加新增记录，不重新汇总全部数据
+        返回: 新增行数（全量重载时为总行数）
+        """
+        before = len(self)
+        added = self._append_rows(conn, self.last_id)
+        if added is not None:
+            count, total = self._totals
+            self._totals = (count + len(added[0]), total + int(added[3].sum()))
+            for table, extra in zip(self._checksum, _checksum(*added)):
+                for key, (more_count, more_total) in extra.items():
+                    old_count, old_total = table.get(key, (0, 0))
+                    table[key] = (old_count + more_count, old_total + more_total)
+        if conn.execute(LEDGER_TOTALS_SQL).fetchone() != self._totals or \
+                self._ledger_checksum(conn) != self._checksum:
+            self.load(conn)
+            return len(self)
+        return len(self) - before
+
+    def _append_rows(self, conn, after_id, schemas=('main',)):
+        """ 追加 id 大于 after_id 的记录；返回新记录的 (days, months, types, amounts, categories)，没有时返回 None """
+        cur = conn.cursor()
+        self.category_names = dict(cur.execute("SELECT id, name FROM categories"))
+        chunks = []
+        for schema in schemas:
+            cur.execute(f'''SELECT id, date, type, amount, category_id FROM {schema}.transactions
+                            WHERE id > ? ORDER BY id''', (after_id,))
+            while True:
+                rows = cur.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                ids, dates, types, amounts, categories = zip(*rows)
+                chunks.append((
+                    np.array(ids, np.int64),
+                    np.array(dates, 'datetime64[D]').astype(np.int32),
+                    np.array([t == 'income' for t in types], np.int8),
+                    np.array(amounts, np.int64),
+                    np.array(categories, np.int32),
+                ))
+        if not chunks:
+            return None
+
+        columns = list(zip(*chunks))
+        last_day = self.days[-1] if len(self) else None
+        self.ids = np.concatenate([self.ids, *columns[0]])
+        self.days = np.concatenate([self.days, *columns[1]])
+        self.types = np.concatenate([self.types, *columns[2]])
+        self.amounts = np.concatenate([self.amounts, *columns[3]])
+        self.categories = np.concatenate([self.categories, *columns[4]])
+        self.last_id = int(self.ids.max())
+
+        new_days, new_types, new_amounts, new_categories = \
+            (np.concatenate(column) for column in columns[1:])
+        # 新记录通常都在末尾日期之后，此时无需重新排序
+        if last_day is None or new_days.min() < last_day or np.any(np.diff(new_days) < 0):
+            order = np.argsort(self.days, kind='stable')
+            for name in ('ids', 'days', 'types', 'amounts', 'categories'):
+                setattr(self, name, getattr(self, name)[order])
+
+        # 派生列
+        self.months = _months_of(self.days)
+        self.weekdays = ((self.days + 3) % 7).astype(np.int8)  # 1970-01-01 是周四
+        return new_days, _months_of(new_days), new_types, new_amounts, new_categories
+
+    @staticmethod
+    def _ledger_checksum(conn):
+        """
+        从触发器维护的汇总表读取校验和，用于发现删除和修改：
+        monthly_totals 的 {(月份, 类型, 分类): (笔数, 合计)} 与 daily_balances 的 {日期: (笔数, 净额)}
+        """
+        cur = conn.cursor()
+        cur.execute('''SELECT month, type, category_id, count, total FROM monthly_totals
+                       WHERE count > 0''')
+        monthly = {(month, t, category): (count, total) for month, t, category, count, total in cur}
+        cur.execute("SELECT date, count, net FROM daily_balances WHERE count > 0")
+        daily = {date: (count, net) for date, count, net in cur}
+        return monthly, daily
+
+    def _local_checksum(self):
+        """ 按内存中的全部记录重新计算校验和（全量加载时使用，刷新时增量累加）"""
+        return _checksum(self.days, self.months, self.types, self.amounts, self.categories)
+
+    # === 统计 ===
+    def _range(self, start=None, end=None):
+        """ 日期区间 [start, end)（'YYYY-MM-DD'）对应的切片 """
+        lo = np.searchsorted(self.days, np.datetime64(start, 'D').astype(np.int32)) if start else 0
+        hi = np.searchsorted(self.days, np.datetime64(end, 'D').astype(np.int32)) if end else len(self)
+        return slice(lo, hi)
+
+    def _keys(self, dimension, rows):
+        """ 返回 (分组键数组, 键 -> 显示名 的函数) """
+        if dimension == "month":
+            months = self.months[rows]
+            base = int(months[0]) if len(months) else 0
+            return months - base, lambda k: str(np.datetime64(base + k, 'M'))
+        if dimension == "category":
+            return self.categories[rows], lambda k: self.category_names[k]
+        if dimension == "weekday":
+            return self.weekdays[rows], lambda k: WEEKDAY_NAMES[k]
+        if dimension == "type":
+            return self.types[rows], lambda k: TYPE_NAMES[k]
+        raise ValueError(f"不支持的分组维度: {dimension}（可选: {', '.join(DIMENSIONS)}）")
+
+    def group_by(self, dimension, start=None, end=None):
+        """
+        按维度分组统计收入/支出
+        返回: {分组名: {"income": 元, "expense": 元, "count": 笔数}}，按分组键排序
+              dimension="type" 时分组为 expense / income
+        """
+        rows = self._range(start, end)
+        keys, label = self._keys(dimension, rows)
+        if not len(keys):
+            return {}
+        # 组合键：分组键 * 2 + 类型，一次 bincount 同时得到收入和支出
+        combined = keys.astype(np.intp) * 2 + self.types[rows]
+        size = (int(keys.max()) + 1) * 2
+        totals = _sum_by(combined, self.amounts[rows], minlength=size).reshape(-1, 2)
+        counts = np.bincount(combined, minlength=size)
+        counts = counts.reshape(-1, 2)
+
+        result = {}
+        for key in np.flatnonzero(counts.sum(axis=1)):
+            result[label(int(key))] = {
+                "income": from_cents(int(totals[key, 1])),
+                "expense": from_cents(int(totals[key, 0])),
+                "count": int(counts[key].sum()),
+            }
+        return result
+
+    def report(self, start=None, end=None):
+        """ 完整报表：按月、分类、星期、类型四个维度的分组统计及耗时 """
+        started = time.perf_counter()
+        report = {dimension: self.group_by(dimension, start, end) for dimension in DIMENSIONS}
+        rows = self._range(start, end)
+        report["rows"] = rows.stop - rows.start
+        report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return report
+
+
+def load_ledger(conn):
+    """ 便捷函数：全量加载并返回 LedgerArrays """
+    return LedgerArrays().load(conn)
+
+
+if __name__ == "__main__":
+    import json
+    from database import get_connection
+
+    ledger = load_ledger(get_connection())
+    print(json.dumps(ledger.report(), ensure_ascii=False, indent=2))
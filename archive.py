@@ -0,0 +1,308 @@
+# archive.py
+import argparse
+import datetime
+import os
+import sqlite3
+import tempfile
+import time
+
+from backup import check_integrity
+from database import (archive_dir, clear_category_cache, database_file, get_archived_years,
+                      get_connection, close_all_connections, create_tables, print_progress)
+from instrumentation import timed
+from query_cache import TRANSACTION_TABLES, flush_writes, note_write
+
+ARCHIVE_GRACE_DAYS = 90          # 年份结束后多少天才视为已结账（留出补录上一年账目的时间）
+ARCHIVE_FILE = "finance-{year}.db"
+# 归档库为自包含的只读文件：交易表保留原 id，并附带归档时的分类字典，单独打开也能读懂
+ARCHIVE_SCHEMA_SQL = """
+    CREATE TABLE categories (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE transactions (
+        id INTEGER PRIMARY KEY,
+        date TEXT NOT NULL,
+        type TEXT NOT NULL,
+        amount INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        description TEXT
+    );
+    CREATE INDEX idx_transactions_date_id ON transactions(date, id);
+    """
+YEAR_STATS_SQL = "SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM {schema}transactions {where}"
+YEAR_WHERE = "WHERE date >= ? AND date < ?"
+# 归档时不经过汇总类触发器：月度汇总、每日余额、预算进度中这些年份的数据原样保留，
+# 历史报表和余额查询不需要打开归档库；全文索引照常由删除触发器同步（搜索只覆盖主库）
+ROLLUP_DELETE_TRIGGERS = ("trg_monthly_totals_delete", "trg_daily_balances_delete",
+                          "trg_budget_spend_delete")
+
+
+def year_range(year):
+    """ 年份 -> 日期区间 [start, end) """
+    return f"{year}-01-01", f"{int(year) + 1:04d}-01-01"
+
+
+def closed_years(conn, today=None, grace_days=ARCHIVE_GRACE_DAYS):
+    """
+    主库中可以归档的年份（从早到晚）：该年结束已超过 grace_days 天
+    只需按日期索引取最早的日期，不扫描交易表
+    """
+    today = today or datetime.date.today()
+    first = conn.execute("SELECT MIN(date) FROM transactions").fetchone()[0]
+    if first is None:
+        return []
+    last_closed = (today - datetime.timedelta(days=grace_days)).year - 1
+    years = []
+    for year in range(int(first[:4]), last_closed + 1):
+        if conn.execute("SELECT 1 FROM transactions WHERE date >= ? AND date < ? LIMIT 1",
+                        year_range(f"{year:04d}")).fetchone():
+            years.append(f"{year:04d}")
+    return years
+
+
+def _year_stats(conn, year, schema=""):
+    """ 某年的 (行数, 金额合计分)，用于核对归档库与主库 """
+    where, params = (YEAR_WHERE, year_range(year)) if year else ("", ())
+    return tuple(conn.execute(YEAR_STATS_SQL.format(schema=schema, where=where), params).fetchone())
+
+
+def _copy_year(main_path, path, year):
+    """
+    把一年的交易记录复制到新的归档库文件：先写临时文件，核对通过后才改名
+    使用独立连接，复制期间主库照常读写
+    返回: (行数, 金额合计分)
+    """
+    fd, temp_path = tempfile.mkstemp(suffix=".db.part", dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        target = sqlite3.connect(temp_path)
+        try:
+            target.executescript(ARCHIVE_SCHEMA_SQL)
+            target.execute("ATTACH DATABASE ? AS hot", (main_path,))
+            with target:
+                target.execute("INSERT INTO categories SELECT id, name FROM hot.categories")
+                # 按 (date, id) 顺序写入，日期索引紧凑
+                target.execute(f"""
+                    INSERT INTO transactions
+                    SELECT id, date, type, amount, category_id, description
+                    FROM hot.transactions {YEAR_WHERE} ORDER BY date, id""", year_range(year))
+            source_stats = _year_stats(target, year, "hot.")
+            target.execute("DETACH DATABASE hot")
+            stats = _year_stats(target, None)
+            integrity = check_integrity(target)
+        finally:
+            target.close()
+        if integrity != "ok":
+            raise sqlite3.DatabaseError(f"归档库完整性检查失败: {integrity}")
+        if stats != source_stats:
+            raise sqlite3.DatabaseError(f"归档库与主库不一致: {stats} != {source_stats}")
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return stats
+
+
+@timed("archive_year")
+def archive_year(conn, year, progress=None, writer=None):
+    """
+    把已结账的一年移到归档库 archive/finance-YYYY.db
+    1. 复制到新的归档库文件并核对行数、金额合计和完整性（独立连接，不占用写锁）
+    2. register_archive 在一个写事务内删除主库中的记录并登记；
+       提供 writer（DBWriter）时交给写线程执行，与界面的其他写操作串行
+    复制失败或核对不一致时主库不变；写库步骤失败时回滚并删除归档库文件
+    年份必须从早到晚依次归档
+    返回: {"year", "path", "rows", "total"}
+    """
+    archived = [y for y, _ in get_archived_years(conn)]
+    if archived and year <= archived[-1]:
+        raise ValueError(f"{year} 年不晚于已归档的 {archived[-1]} 年")
+    start, _ = year_range(year)
+    if conn.execute("SELECT 1 FROM transactions WHERE date < ? LIMIT 1", (start,)).fetchone():
+        raise ValueError(f"主库中还有 {year} 年之前的记录，请先归档更早的年份")
+
+    directory = archive_dir(conn)
+    os.makedirs(directory, exist_ok=True)
+    name = ARCHIVE_FILE.format(year=year)
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        raise FileExistsError(f"归档库已存在: {path}")
+
+    if progress:
+        progress(f"归档 {year} 年", 0, 2)
+    rows, total = _copy_year(database_file(conn), path, year)
+    if progress:
+        progress(f"归档 {year} 年", 1, 2)
+
+    try:
+        if writer:
+            writer.call(register_archive, year, name, rows, total, commit=False)
+        else:
+            register_archive(conn, year, name, rows, total)
+    except BaseException:
+        os.remove(path)
+        raise
+    if progress:
+        progress(f"归档 {year} 年", 2, 2)
+    return {"year": year, "path": path, "rows": rows, "total": total}
+
+
+def register_archive(conn, year, name, rows, total, commit=True):
+    """
+    归档的写库步骤（一个写事务内）：核对主库中该年的数据与归档库一致，
+    删除这些记录（跳过汇总类触发器），登记到 archived_years；此后触发器拒绝写入该年及之前的日期
+    触发器的删除与重建和删除记录在同一事务中，其他连接看不到缺少触发器的中间状态
+    commit=False 时由调用方（写线程）负责事务
+    """
+    if not conn.in_transaction:
+        # DROP TRIGGER 不会隐式开启事务，先显式开启并取得写锁
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        if _year_stats(conn, year) != (rows, total):
+            raise sqlite3.DatabaseError(f"{year} 年的记录在归档期间有变化，请重试")
+        triggers = conn.execute(
+            f"""SELECT sql FROM sqlite_master WHERE type = 'trigger'
+                AND name IN ({", ".join("?" * len(ROLLUP_DELETE_TRIGGERS))})""",
+            ROLLUP_DELETE_TRIGGERS).fetchall()
+        for trigger in ROLLUP_DELETE_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        conn.execute(f"DELETE FROM transactions {YEAR_WHERE}", year_range(year))
+        for (sql,) in triggers:
+            conn.execute(sql)
+        conn.execute("INSERT INTO archived_years(year, path, rows, total, archived_at) "
+                     "VALUES (?, ?, ?, ?, ?)",
+                     (year, name, rows, total, datetime.datetime.now().isoformat(timespec="seconds")))
+        note_write(*TRANSACTION_TABLES, "archived_years")
+        if commit:
+            conn.commit()
+            flush_writes()
+    except Exception:
+        if commit:
+            conn.rollback()
+            clear_category_cache()
+            flush_writes()
+        raise
+    return rows
+
+
+def optimize_search_index(conn, commit=True):
+    """ 合并全文索引的段（大量删除之后执行） """
+    conn.execute("INSERT INTO transactions_fts(transactions_fts) VALUES ('optimize')")
+    note_write("transactions_fts")
+    if commit:
+        conn.commit()
+        flush_writes()
+
+
+def compact(conn, progress=None, writer=None):
+    """
+    归档后整理主库：合并全文索引的段并 VACUUM，释放的页还给文件系统
+    VACUUM 不能在事务中执行，无法交给写线程；它只是一条语句，期间写线程按 busy_timeout 等待
+    """
+    if progress:
+        progress("整理主库", 0, 1)
+    if writer:
+        writer.call(optimize_search_index, commit=False)
+    else:
+        optimize_search_index(conn)
+    conn.execute("VACUUM")
+    # WAL 模式下 VACUUM 的结果先写入 -wal，检查点之后主库文件才变小
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    if progress:
+        progress("整理主库", 1, 1)
+
+
+def archive_closed_years(conn, today=None, grace_days=ARCHIVE_GRACE_DAYS, vacuum=True,
+                         progress=None, writer=None):
+    """
+    归档所有已结账的年份（从早到晚），有归档时再整理主库
+    writer: 界面的 DBWriter，写库步骤交给写线程执行（命令行单独运行时不需要）
+    返回: {"archived": [archive_year 的结果, ...], "bytes_before", "bytes_after", "elapsed_s"}
+    """
+    started = time.perf_counter()
+    main_path = database_file(conn)
+    bytes_before = os.path.getsize(main_path)
+    archived = [archive_year(conn, year, progress, writer)
+                for year in closed_years(conn, today, grace_days)]
+    if archived and vacuum:
+        compact(conn, progress, writer)
+    return {
+        "archived": archived,
+        "bytes_before": bytes_before,
+        "bytes_after": os.path.getsize(main_path),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }
+
+
+def verify_archives(conn):
+    """
+    校验各归档库：文件完整性，以及行数、金额合计与 archived_years 的登记一致
+    返回: 问题列表 [(year, 描述), ...]，为空表示全部正常
+    """
+    problems = []
+    cur = conn.execute("SELECT year, rows, total FROM archived_years ORDER BY year")
+    expected = {year: (rows, total) for year, rows, total in cur}
+    for year, path in get_archived_years(conn):
+        if not os.path.exists(path):
+            problems.append((year, f"缺少归档库 {path}"))
+            continue
+        archive = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            integrity = check_integrity(archive)
+            stats = _year_stats(archive, None)
+        finally:
+            archive.close()
+        if integrity != "ok":
+            problems.append((year, f"完整性检查失败: {integrity}"))
+        elif stats != expected[year]:
+            problems.append((year, f"行数/金额合计 {stats} 与登记的 {expected[year]} 不一致"))
+    return problems
+
+
+def main(argv=None):
+    """ 命令行入口: python archive.py [--grace-days N] [--no-vacuum] [--verify] """
+    parser = argparse.ArgumentParser(description="把已结账的年份移到按年的归档库")
+    parser.add_argument("--grace-days", type=int, default=ARCHIVE_GRACE_DAYS,
+                        help=f"年份结束后多少天才归档（默认 {ARCHIVE_GRACE_DAYS}）")
+    parser.add_argument("--year", help="只归档指定年份（须早于所有未归档的年份）")
+    parser.add_argument("--no-vacuum", action="store_true", help="归档后不 VACUUM 主库")
+    parser.add_argument("--verify", action="store_true", help="只校验已有的归档库")
+    parser.add_argument("--quiet", action="store_true", help="不显示进度")
+    args = parser.parse_args(argv)
+    progress = None if args.quiet else print_progress
+
+    conn = get_connection()
+    try:
+        create_tables(conn, progress)
+        if args.verify:
+            problems = verify_archives(conn)
+            for year, problem in problems:
+                print(f"{year}: {problem}")
+            print("归档库全部正常" if not problems else f"{len(problems)} 个归档库有问题")
+            return problems
+        if args.year:
+            result = {"archived": [archive_year(conn, args.year, progress)]}
+            if not args.no_vacuum:
+                compact(conn, progress)
+        else:
+            result = archive_closed_years(conn, grace_days=args.grace_days,
+                                          vacuum=not args.no_vacuum, progress=progress)
+    except (sqlite3.Error, OSError, ValueError) as e:
+        parser.exit(1, f"归档失败: {e}\n")
+    finally:
+        close_all_connections()
+
+    if not result["archived"]:
+        print("没有需要归档的年份")
+    for item in result["archived"]:
+        print(f"已归档 {item['year']} 年 {item['rows']} 条记录到 {item['path']}")
+    if "bytes_after" in result:
+        print(f"主库 {result['bytes_before']} -> {result['bytes_after']} 字节，"
+              f"耗时 {result['elapsed_s']} 秒")
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+# backup.py
+import argparse
+import datetime
+import glob
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import database
+from database import BUSY_TIMEOUT_MS, print_progress
+from instrumentation import timed
+from query_cache import invalidate
+
+BACKUP_DIR = "data/backups"   # 快照保存目录
+BACKUP_KEEP = 7               # 轮转保留的快照个数
+BACKUP_PAGES = 256            # 每步复制的页数（默认页大小下约 1MB）
+BACKUP_SLEEP = 0.005          # 每步之间让出的秒数，写线程可在间隙拿到锁
+BACKUP_MAX_RESTARTS = 3       # 分步复制被写入打断重来的次数上限，超过后改为一步复制
+BACKUP_INTERVAL_HOURS = 24    # 定时快照的间隔
+BACKUP_GZIP_LEVEL = 6         # 压缩级别（9 的体积只小一点，耗时却多数倍）
+SNAPSHOT_PREFIX = "finance-"
+SNAPSHOT_PATTERNS = ("finance-*.db", "finance-*.db.gz")
+MANIFEST_SUFFIX = ".json"     # 快照清单：快照文件名加此后缀，记录快照引用的归档库
+# 归档库（archive/finance-YYYY.db）写成后不再改变，各快照共用备份目录下同名子目录中的一份副本
+ARCHIVE_BACKUP_DIR = database.ARCHIVE_DIR_NAME
+
+
+def snapshot_path(directory=BACKUP_DIR, compress=False, now=None):
+    """ 按时间生成快照文件名，如 data/backups/finance-20240131-083000.db.gz """
+    now = now or datetime.datetime.now()
+    name = f"{SNAPSHOT_PREFIX}{now:%Y%m%d-%H%M%S}.db" + (".gz" if compress else "")
+    return os.path.join(directory, name)
+
+
+@timed("backup_database")
+def backup_database(path=None, compress=False, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP,
+                    progress=None, source_path=None):
+    """
+    用 SQLite 在线备份接口复制数据库，写入过程中复制也不会得到残缺文件
+    - 使用独立的源连接，按 pages 页一步复制，步与步之间释放锁并 sleep，
+      Python 在每一步中释放 GIL，放在工作线程执行时界面不会卡顿
+    - 复制期间其他连接有写入时，SQLite 会从头重新复制，结果始终是某一时刻的一致快照；
+      写入频繁导致反复重来超过 BACKUP_MAX_RESTARTS 次时改为一步复制
+      （WAL 模式下一步复制只持有读快照，不阻塞写线程）
+    - 快照先写入临时文件，integrity_check 通过后才（压缩并）改名为最终文件
+    - 快照引用的归档库复制到备份目录的 archive 子目录（已有副本时跳过），
+      连同快照一起记录在清单文件（快照路径 + .json）中，restore_snapshot 据此恢复
+    参数:
+        path: 快照路径，None 时在 BACKUP_DIR 下按时间命名
+        compress: 是否 gzip 压缩（文件名以 .gz 结尾）
+        progress: progress(描述, 已复制页数, 总页数)
+    返回: {"path", "pages", "bytes", "elapsed_s", "integrity", "archives"}
+    """
+    started = time.perf_counter()
+    source_path = source_path or database.DB_PATH
+    path = path or snapshot_path(compress=compress)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(suffix=".db.part", dir=directory)
+    os.close(fd)
+
+    source = sqlite3.connect(source_path, timeout=BUSY_TIMEOUT_MS / 1000)
+    try:
+        target = sqlite3.connect(temp_path)
+        try:
+            if progress:
+                progress("备份数据库", 0, 0)
+            _copy_pages(source, target, pages, sleep, progress)
+            total_pages = target.execute("PRAGMA page_count").fetchone()[0]
+            # 快照为单个自包含文件，不带 -wal
+            target.execute("PRAGMA journal_mode=DELETE")
+            integrity = check_integrity(target)
+            archives = _archived_files(target)
+        finally:
+            target.close()
+        if integrity != "ok":
+            raise sqlite3.DatabaseError(f"快照完整性检查失败: {integrity}")
+        archives = _backup_archives(archives, _archive_dir_of(source_path),
+                                    os.path.join(directory, ARCHIVE_BACKUP_DIR))
+
+        if compress:
+            with open(temp_path, "rb") as src, \
+                    gzip.open(temp_path + ".gz", "wb", compresslevel=BACKUP_GZIP_LEVEL) as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(temp_path)
+            temp_path += ".gz"
+        _write_manifest(path, archives)
+        os.replace(temp_path, path)
+    except BaseException:
+        for leftover in (temp_path, temp_path + ".gz", path + MANIFEST_SUFFIX):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    finally:
+        source.close()
+
+    return {
+        "path": path,
+        "pages": total_pages,
+        "bytes": os.path.getsize(path),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "integrity": integrity,
+        "archives": [entry["file"] for entry in archives],
+    }
+
+
+def _archive_dir_of(db_path):
+    """ 数据库文件对应的归档库目录（与 database.archive_dir 相同的约定）"""
+    return os.path.join(os.path.dirname(db_path) or ".", database.ARCHIVE_DIR_NAME)
+
+
+def _archived_files(conn):
+    """ 快照中登记的归档库 [(year, 文件名), ...]；归档目录表尚未创建的旧库返回空列表 """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                        "AND name = 'archived_years'").fetchone():
+        return []
+    return conn.execute(database.ARCHIVED_YEARS_SQL).fetchall()
+
+
+def _copy_file(source, target):
+    """ 先复制到临时文件再改名，中断时不会留下残缺的目标文件 """
+    fd, temp_path = tempfile.mkstemp(suffix=".part", dir=os.path.dirname(target) or ".")
+    os.close(fd)
+    try:
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, target)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _backup_archives(archives, source_dir, target_dir):
+    """
+    把归档库复制到 target_dir（归档库不再改变，大小一致的已有副本直接复用）
+    返回清单条目 [{"year", "file", "bytes"}, ...]
+    """
+    entries = []
+    for year, name in archives:
+        source = os.path.join(source_dir, name)
+        target = os.path.join(target_dir, name)
+        size = os.path.getsize(source)
+        if not os.path.exists(target) or os.path.getsize(target) != size:
+            os.makedirs(target_dir, exist_ok=True)
+            _copy_file(source, target)
+        entries.append({"year": year, "file": name, "bytes": size})
+    return entries
+
+
+def _write_manifest(path, archives):
+    with open(path + MANIFEST_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump({"snapshot": os.path.basename(path), "archives": archives}, f,
+                  ensure_ascii=False, indent=2)
+
+
+def read_manifest(path):
+    """ 快照的清单；没有清单（旧快照）时视为不引用归档库 """
+    try:
+        with open(path + MANIFEST_SUFFIX, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"snapshot": os.path.basename(path), "archives": []}
+
+
+@timed("restore_snapshot")
+def restore_snapshot(path, target_path=None):
+    """
+    用快照替换数据库文件，并把清单中的归档库放回数据库旁的 archive 目录
+    需在没有任何连接打开数据库时执行（程序退出后从命令行运行）；
+    快照先完整解压/复制并通过 integrity_check，再替换原文件，并删除原库遗留的 -wal/-shm
+    返回: {"path", "archives"}
+    """
+    target_path = target_path or database.DB_PATH
+    manifest = read_manifest(path)
+    backup_archive_dir = os.path.join(os.path.dirname(path) or ".", ARCHIVE_BACKUP_DIR)
+    missing = [entry["file"] for entry in manifest["archives"]
+               if not os.path.exists(os.path.join(backup_archive_dir, entry["file"]))]
+    if missing:
+        raise FileNotFoundError(f"快照引用的归档库副本缺失: {', '.join(missing)}")
+
+    directory = os.path.dirname(target_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(suffix=".db.part", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as dst, \
+                (gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")) as src:
+            shutil.copyfileobj(src, dst)
+        conn = sqlite3.connect(temp_path)
+        try:
+            integrity = check_integrity(conn)
+        finally:
+            conn.close()
+        if integrity != "ok":
+            raise sqlite3.DatabaseError(f"快照完整性检查失败: {integrity}")
+
+        archive_dir = _archive_dir_of(target_path)
+        for entry in manifest["archives"]:
+            os.makedirs(archive_dir, exist_ok=True)
+            _copy_file(os.path.join(backup_archive_dir, entry["file"]),
+                       os.path.join(archive_dir, entry["file"]))
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(target_path + suffix):
+                os.remove(target_path + suffix)
+        os.replace(temp_path, target_path)
+        invalidate()
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return {"path": target_path, "archives": [entry["file"] for entry in manifest["archives"]]}
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _copy_pages(source, target, pages, sleep, progress=None):
+    """ 分步复制；已复制页数回退说明备份被其他连接的写入打断并重新开始 """
+    state = {"copied": 0, "restarts": 0}
+
+    def on_step(status, remaining, total):
+        copied = total - remaining
+        if copied < state["copied"]:
+            state["restarts"] += 1
+            if state["restarts"] > BACKUP_MAX_RESTARTS:
+                raise _TooManyRestarts()
+        state["copied"] = copied
+        if progress:
+            progress("备份数据库", copied, total)
+
+    try:
+        source.backup(target, pages=pages, progress=on_step, sleep=sleep)
+    except _TooManyRestarts:
+        source.backup(target, pages=-1)
+        if progress:
+            total = target.execute("PRAGMA page_count").fetchone()[0]
+            progress("备份数据库", total, total)
+
+
+def check_integrity(conn):
+    """ PRAGMA integrity_check，全部正常时返回 "ok"，否则返回问题描述 """
+    rows = conn.execute("PRAGMA integrity_check").fetchall()
+    return "; ".join(row[0] for row in rows)
+
+
+def verify_snapshot(path):
+    """ 校验已有快照（.gz 快照先解压到临时文件）；返回 integrity_check 结果 """
+    temp_path = None
+    try:
+        if path.endswith(".gz"):
+            fd, temp_path = tempfile.mkstemp(suffix=".db")
+            with os.fdopen(fd, "wb") as dst, gzip.open(path, "rb") as src:
+                shutil.copyfileobj(src, dst)
+        conn = sqlite3.connect(f"file:{temp_path or path}?mode=ro", uri=True)
+        try:
+            return check_integrity(conn)
+        finally:
+            conn.close()
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+
+
+def list_snapshots(directory=BACKUP_DIR):
+    """ 目录中的快照，按时间从旧到新排列（文件名中的时间戳可直接按字符串排序）"""
+    paths = [p for pattern in SNAPSHOT_PATTERNS for p in glob.glob(os.path.join(directory, pattern))]
+    return sorted(paths, key=os.path.basename)
+
+
+def rotate_snapshots(directory=BACKUP_DIR, keep=BACKUP_KEEP):
+    """ 只保留最新的 keep 个快照，返回被删除的路径 """
+    snapshots = list_snapshots(directory)
+    removed = snapshots[:-keep] if keep > 0 else snapshots
+    for path in removed:
+        os.remove(path)
+        if os.path.exists(path + MANIFEST_SUFFIX):
+            os.remove(path + MANIFEST_SUFFIX)
+    return removed
+
+
+def backup_due(directory=BACKUP_DIR, interval_hours=BACKUP_INTERVAL_HOURS, now=None):
+    """ 距最新快照超过 interval_hours（或还没有快照）时返回 True """
+    snapshots = list_snapshots(directory)
+    if not snapshots:
+        return True
+    now = now or time.time()
+    return now - os.path.getmtime(snapshots[-1]) >= interval_hours * 3600
+
+
+def run_scheduled_backup(directory=BACKUP_DIR, keep=BACKUP_KEEP,
+                         interval_hours=BACKUP_INTERVAL_HOURS, compress=True, progress=None):
+    """
+    定时快照：到期时备份并轮转，未到期返回 None
+    不写数据库（上次备份时间取自最新快照文件），可以在任何线程调用
+    """
+    if not backup_due(directory, interval_hours):
+        return None
+    result = backup_database(snapshot_path(directory, compress), compress=compress,
+                             progress=progress)
+    result["removed"] = rotate_snapshots(directory, keep)
+    return result
+
+
+def main(argv=None):
+    """
+    命令行入口: python backup.py [快照路径] [--compress] [--keep N] [--verify 快照]
+                                 [--restore 快照]
+    """
+    parser = argparse.ArgumentParser(description="在线备份数据库")
+    parser.add_argument("path", nargs="?", help=f"快照路径，默认在 {BACKUP_DIR} 下按时间命名")
+    parser.add_argument("--compress", action="store_true", help="gzip 压缩快照")
+    parser.add_argument("--keep", type=int, default=BACKUP_KEEP,
+                        help=f"只保留最新的 N 个快照（默认 {BACKUP_KEEP}，仅对默认目录生效）")
+    parser.add_argument("--scheduled", action="store_true",
+                        help=f"只在距上次快照超过 {BACKUP_INTERVAL_HOURS} 小时时备份")
+    parser.add_argument("--verify", metavar="SNAPSHOT", help="只校验已有快照")
+    parser.add_argument("--restore", metavar="SNAPSHOT",
+                        help="用快照（及其引用的归档库）恢复数据库，需先退出程序")
+    parser.add_argument("--quiet", action="store_true", help="不显示进度")
+    args = parser.parse_args(argv)
+    progress = None if args.quiet else print_progress
+
+    try:
+        if args.verify:
+            integrity = verify_snapshot(args.verify)
+            print(f"{args.verify}: {integrity}")
+            return integrity
+        if args.restore:
+            result = restore_snapshot(args.restore)
+            print(f"已从 {args.restore} 恢复到 {result['path']}"
+                  + (f"（归档库: {', '.join(result['archives'])}）" if result["archives"] else ""))
+            return result
+        if args.scheduled:
+            result = run_scheduled_backup(keep=args.keep, compress=args.compress,
+                                          progress=progress)
+            if result is None:
+                print("距上次快照未满间隔，跳过")
+                return None
+        else:
+            result = backup_database(args.path, compress=args.compress, progress=progress)
+            result["removed"] = [] if args.path else rotate_snapshots(keep=args.keep)
+    except (sqlite3.Error, OSError) as e:
+        parser.exit(1, f"备份失败: {e}\n")
+    print(f"已备份到 {result['path']}（{result['pages']} 页，{result['bytes']} 字节，"
+          f"耗时 {result['elapsed_s']} 秒，完整性: {result['integrity']}）")
+    for path in result["removed"]:
+        print(f"已删除旧快照 {path}")
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+# benchmarks
+"""
+数据层与GUI刷新查询的基准测试
+
+用法:
+    python -m benchmarks.run --sizes 10k 1m --out results.json
+    python -m benchmarks.run --sizes 10k --compare results.json
+"""
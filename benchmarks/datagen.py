@@ -0,0 +1,111 @@
+# benchmarks/datagen.py
+import datetime
+import os
+import random
+
+import database
+from main import add_recurring_rule, add_transactions_batch, set_budget_alert
+
+# 分类及其金额分布（对数正态的 mu, sigma）和每日出现概率
+EXPENSE_CATEGORIES = {
+    '餐饮': (3.2, 0.6, 0.9),
+    '交通': (2.5, 0.7, 0.6),
+    '购物': (4.5, 1.0, 0.2),
+    '娱乐': (4.0, 0.8, 0.1),
+    '住房': (7.5, 0.2, 0.03),
+    '医疗': (5.0, 1.0, 0.02),
+    '教育': (5.5, 0.9, 0.02),
+    '通讯': (4.0, 0.3, 0.03),
+    '日用': (3.5, 0.7, 0.3),
+    '旅行': (7.0, 0.8, 0.01),
+    '人情': (6.0, 0.6, 0.02),
+    '宠物': (4.2, 0.6, 0.05),
+}
+INCOME_CATEGORIES = {
+    '奖金': (8.0, 0.5, 0.01),
+    '理财': (5.0, 1.0, 0.05),
+    '兼职': (6.0, 0.6, 0.03),
+}
+DESCRIPTIONS = ['早餐', '午餐', '晚餐', '地铁', '打车', '超市', '网购', '电影', '房租',
+                '药店', '话费', '水电', '咖啡', '书籍', '礼金', '猫粮', '']
+
+
+def parse_size(text):
+    """ '10k' / '1m' / '10M' / '2500' -> 行数 """
+    text = text.strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1])
+    return int(float(text[:-1]) * scale) if scale else int(text)
+
+
+def generate_rows(rows, years=10, seed=0, end=None):
+    """
+    生成贴近真实的交易流水（字典，字段同 add_transaction 的 auto_data）
+    在 years 年内按天铺开，每天的笔数按目标行数自动调整；每月25日发工资
+    """
+    rng = random.Random(seed)
+    end = end or datetime.date.today()
+    start = end - datetime.timedelta(days=365 * years)
+    days = (end - start).days + 1
+    per_day = max(rows / days, 1)
+
+    categories = [(name, 'expense', dist) for name, dist in EXPENSE_CATEGORIES.items()] + \
+                 [(name, 'income', dist) for name, dist in INCOME_CATEGORIES.items()]
+    weights = [dist[2] for _, _, dist in categories]
+
+    produced = 0
+    day = start
+    while produced < rows:
+        date = day.isoformat()
+        if day.day == 25:
+            yield {'date': date, 'type': 'income', 'amount': 12000.0,
+                   'category': '薪资', 'description': '月度工资'}
+            produced += 1
+        count = int(per_day) + (rng.random() < per_day - int(per_day))
+        for name, trans_type, (mu, sigma, _) in rng.choices(categories, weights, k=count):
+            if produced >= rows:
+                break
+            yield {'date': date, 'type': trans_type,
+                   'amount': round(rng.lognormvariate(mu, sigma), 2),
+                   'category': name, 'description': rng.choice(DESCRIPTIONS)}
+            produced += 1
+        day += datetime.timedelta(days=1)
+        if day > end:
+            day = start  # 行数超出按天铺满的容量时从头再铺一轮
+
+
+def generate_ledger(path, rows, years=10, seed=0):
+    """
+    生成基准测试用数据库（已存在则直接复用）
+    返回: 数据库文件路径
+    """
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    database.close_all_connections()
+    database.DB_PATH = tmp_path
+    conn = database.get_connection()
+    database.create_tables(conn)
+
+    today = datetime.date.today()
+    start_date = (today - datetime.timedelta(days=365 * years)).isoformat()
+    # 薪资规则从账本起点开始，尚未生成（基准中的首次补发为全历史回溯）
+    add_recurring_rule(conn, 'income', 12000, '薪资', 'monthly', start_date, day=25,
+                       description='月度工资', kind='salary', commit=False)
+    for amount, category, description in ((15, '餐饮', '早餐'), (6, '交通', '地铁')):
+        add_recurring_rule(conn, 'expense', amount, category, 'daily', today.isoformat(),
+                           description=description, kind='daily_default', skip_existing=True,
+                           commit=False)
+    set_budget_alert(conn, 8000, commit=False)
+    add_transactions_batch(generate_rows(rows, years, seed, today), conn)
+    conn.commit()
+    database.close_all_connections()
+
+    os.replace(tmp_path, path)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(tmp_path + suffix):
+            os.remove(tmp_path + suffix)
+    return path
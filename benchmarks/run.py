@@ -0,0 +1,179 @@
+# benchmarks/run.py
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import database
+from main import (add_transaction, apply_daily_defaults, auto_add_salary, balance_at,
+                  balance_series, get_budget_alert_status, get_transactions_page,
+                  materialize_due, search_transactions, show_summary)
+from exporter import export_transactions
+from benchmarks.datagen import generate_ledger, parse_size
+
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'finance_bench')
+DEFAULT_THRESHOLD = 1.25  # 中位数超过基线 25% 视为退化
+
+
+def timeit(func, repeat):
+    """ 重复执行 func，返回各次耗时（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(samples):
+    return {
+        "runs": len(samples),
+        "min_ms": round(min(samples), 4),
+        "median_ms": round(statistics.median(samples), 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "max_ms": round(max(samples), 4),
+    }
+
+
+def run_size(rows, data_dir, repeat):
+    """ 针对一个规模的数据库跑全部基准，返回 {基准名: 统计结果} """
+    ledger = generate_ledger(os.path.join(data_dir, f'ledger-{rows}.db'), rows)
+    # 在副本上测试，写入类基准不污染缓存的数据库
+    work = os.path.join(data_dir, f'work-{rows}.db')
+    shutil.copyfile(ledger, work)
+
+    database.close_all_connections()
+    database.DB_PATH = work
+    conn = database.get_connection()
+    database.create_tables(conn)  # 缓存的数据库可能是旧版本结构，先迁移
+    today = datetime.date.today()
+    results = {}
+
+    def catch_up_defaults():
+        # 每次都模拟 30 天未打开程序
+        conn.execute("UPDATE recurring_rules SET start_date = min(start_date, :day), "
+                     "next_due = :day WHERE kind = 'daily_default'",
+                     {"day": (today - datetime.timedelta(days=30)).isoformat()})
+        conn.commit()
+        apply_daily_defaults(conn)
+
+    # 首次补发工资（全历史回溯）只能测一次，之后为幂等的重复检查
+    results["auto_add_salary_cold"] = summarize(timeit(lambda: auto_add_salary(conn), 1))
+    results["auto_add_salary"] = summarize(timeit(lambda: auto_add_salary(conn), repeat))
+    results["apply_daily_defaults"] = summarize(timeit(catch_up_defaults, repeat))
+    # 启动任务：没有到期规则时只做一次到期队列的索引查找
+    results["materialize_due_idle"] = summarize(timeit(lambda: materialize_due(conn), repeat))
+    results["show_summary"] = summarize(
+        timeit(lambda: show_summary(conn, gui_mode=True), repeat))
+    results["get_budget_alert_status"] = summarize(
+        timeit(lambda: get_budget_alert_status(conn), repeat))
+
+    # GUI 列表刷新：首页，以及翻到账本中部的一页
+    results["load_recent_transactions"] = summarize(
+        timeit(lambda: get_transactions_page(conn), repeat))
+    middle = (today - datetime.timedelta(days=365 * 5)).isoformat()
+    results["load_transactions_deep_page"] = summarize(
+        timeit(lambda: get_transactions_page(conn, after=(middle, 0)), repeat))
+
+    # 搜索框：常见词（命中大量行）与带日期过滤的短语
+    results["search_common_term"] = summarize(
+        timeit(lambda: search_transactions(conn, '餐'), repeat))
+    results["search_with_date_filter"] = summarize(
+        timeit(lambda: search_transactions(conn, '猫粮', start=middle[:4] + '-01-01',
+                                           end=middle[:4] + '-12-31'), repeat))
+
+    # 时点余额与一年的每日余额序列
+    results["balance_at"] = summarize(timeit(lambda: balance_at(conn, middle), repeat))
+    results["balance_series_year"] = summarize(
+        timeit(lambda: balance_series(conn, middle[:4] + '-01-01', middle[:4] + '-12-31'), repeat))
+
+    # 导出：一年的数据流式写入 CSV
+    export_path = os.path.join(data_dir, f'export-{rows}.csv')
+    results["export_year_csv"] = summarize(
+        timeit(lambda: export_transactions(conn, export_path, start=middle[:4] + '-01-01',
+                                           end=middle[:4] + '-12-31'), repeat))
+    os.remove(export_path)
+
+    data = {'date': today.isoformat(), 'type': 'expense', 'amount': 12.5,
+            'category': '餐饮', 'description': 'benchmark'}
+    results["add_transaction"] = summarize(
+        timeit(lambda: add_transaction(auto=True, auto_data=data), repeat))
+
+    database.close_all_connections()
+    os.remove(work)
+    return results
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    与基线结果比较中位数
+    返回: [(规模, 基准名, 基线ms, 当前ms, 倍数), ...]，仅包含超过阈值的退化项
+    """
+    regressions = []
+    for size, benches in current["results"].items():
+        for name, stats in benches.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if not base or not base["median_ms"]:
+                continue
+            ratio = stats["median_ms"] / base["median_ms"]
+            print(f"{size:>6} {name:<30} {base['median_ms']:>10.3f} -> "
+                  f"{stats['median_ms']:>10.3f} ms  x{ratio:.2f}")
+            if ratio > threshold:
+                regressions.append((size, name, base["median_ms"], stats["median_ms"], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="记账系统数据层基准测试")
+    parser.add_argument('--sizes', nargs='+', default=['10k'],
+                        help="账本规模，如 10k 1m 10m")
+    parser.add_argument('--repeat', type=int, default=20, help="每项基准的重复次数")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR,
+                        help="生成的测试数据库存放目录（可复用）")
+    parser.add_argument('--out', help="结果输出 JSON 文件（默认输出到标准输出）")
+    parser.add_argument('--compare', help="与之比较的基线 JSON 文件")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="判定退化的中位数倍数")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    for size in args.sizes:
+        rows = parse_size(size)
+        print(f"运行规模 {size} ({rows} 行)...", file=sys.stderr)
+        report["results"][size] = run_size(rows, args.data_dir, args.repeat)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"发现 {len(regressions)} 项性能退化", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
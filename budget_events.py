@@ -0,0 +1,68 @@
+# budget_events.py
+import threading
+from collections import deque
+
+MAX_EVENTS = 100  # 待界面取走的事件上限（界面长时间不取时丢弃最旧的）
+
+# 预算告警事件：由 budget_alerts 表的插入触发器经 SQL 函数 budget_alert_raised 产生，
+# 写线程提交后发布，界面调用 drain_events 取走（不访问数据库）
+_events = deque(maxlen=MAX_EVENTS)  # 已提交、待取走的事件
+_lock = threading.Lock()
+_local = threading.local()  # collecting: 当前线程是否收集事件；pending: 当前事务中产生的事件
+
+
+def collect_events(enabled=True):
+    """
+    在当前线程开启/关闭事件收集（GUI 的写线程开启）
+    未开启收集的线程（命令行等）产生的告警保持“未通知”，留待界面启动时读取
+    """
+    _local.collecting = enabled
+    _local.pending = []
+
+
+def record_alert(budget_id, category, period, period_key, threshold, spent, amount):
+    """
+    SQL 函数 budget_alert_raised 的实现（每个连接都需注册）
+    返回 1 表示已收集（告警记为已通知），0 表示当前线程未开启收集
+    """
+    if not getattr(_local, "collecting", False):
+        return 0
+    _local.pending.append({
+        "budget_id": budget_id,
+        "category": category,       # None 表示全部分类
+        "period": period,           # week / month / year
+        "period_key": period_key,   # 周一日期 / YYYY-MM / YYYY
+        "threshold": threshold,     # 百分比
+        "spent": spent / 100,       # 元
+        "amount": amount / 100,     # 元
+    })
+    return 1
+
+
+def pending_mark():
+    """ 当前事务已产生的事件数，配合 discard_events 实现保存点级别的回滚 """
+    return len(getattr(_local, "pending", ()))
+
+
+def discard_events(mark=0):
+    """ 回滚后调用：丢弃 mark 之后产生的事件（默认全部）"""
+    pending = getattr(_local, "pending", None)
+    if pending:
+        del pending[mark:]
+
+
+def publish_events():
+    """ 提交后调用：把当前线程事务中产生的事件交给界面 """
+    pending = getattr(_local, "pending", None)
+    if pending:
+        with _lock:
+            _events.extend(pending)
+        pending.clear()
+
+
+def drain_events():
+    """ 取走所有已发布的事件（只读内存，不访问数据库）"""
+    with _lock:
+        events = list(_events)
+        _events.clear()
+    return events
@@ -0,0 +1,290 @@
+# cli.py
+import argparse
+import csv
+import datetime
+import functools
+import json
+import sys
+
+import database
+from database import get_connection, close_all_connections, create_tables, print_progress
+from exporter import export_transactions
+from query_cache import flush_writes
+from main import (add_recurring_rule, add_transaction, add_transactions_batch,
+                  apply_daily_defaults, auto_add_salary, balance_at, balance_series,
+                  end_recurring_rule, get_budgets, get_recurring_rules, get_transactions_page,
+                  materialize_due, month_range, set_budget, summarize, BUDGET_PERIODS,
+                  SUMMARY_DIMENSIONS)
+from recurrence import RULE_FREQS
+
+HISTORY_COLUMNS = ("id", "date", "type", "amount", "category")
+# 迁移进度、拒收明细等提示信息写到标准错误，标准输出只有结果数据
+progress_to_stderr = functools.partial(print_progress, file=sys.stderr)
+
+
+# === 输出 ===
+def emit(records, tsv=False, out=None):
+    """
+    输出结果记录（字典列表）
+    - JSON: 每条记录一行（JSON Lines），便于 jq / 逐行处理
+    - TSV: 首行为表头；值中的制表符和换行替换为空格
+    """
+    out = out or sys.stdout
+    if not tsv:
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return
+    columns = list(records[0]) if records else []
+    if columns:
+        out.write("\t".join(columns) + "\n")
+    for record in records:
+        out.write("\t".join(_tsv_value(record.get(column)) for column in columns) + "\n")
+
+
+def _tsv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value).replace("\t", " ").replace("\n", " ")
+
+
+# === 子命令 ===
+def cmd_add(conn, args):
+    """ 添加一条记录 """
+    data = {"date": args.date or datetime.date.today().isoformat(), "type": args.type,
+            "amount": args.amount, "category": args.category, "description": args.description}
+    add_transaction(conn, auto=True, auto_data=data)
+    conn.commit()
+    flush_writes()
+    return [{"added": 1}]
+
+
+def _read_rows(f, fmt):
+    """ 逐行读取导入文件：CSV 需有表头（与导出格式相同，id 列忽略），JSONL 每行一个对象 """
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+        return
+    for line in f:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield None  # 交给批量导入记为拒收行
+
+
+def cmd_import(conn, args):
+    """ 批量导入 CSV / JSONL（单个事务，流式读取） """
+    fmt = args.format or ("jsonl" if args.path.endswith((".jsonl", ".json")) else "csv")
+    f = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8-sig", newline="")
+    try:
+        result = add_transactions_batch(_read_rows(f, fmt), conn)
+        conn.commit()
+        flush_writes()
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    for index, _, reason in result["rejected"]:
+        print(f"第 {index + 1} 条记录被拒收: {reason}", file=sys.stderr)
+    return [{"inserted": result["inserted"], "rejected": len(result["rejected"])}]
+
+
+def cmd_summary(conn, args):
+    """ 区间收支统计；未指定区间时为本月 """
+    start, end = args.start, args.end
+    if start is None and end is None and not args.all:
+        start, end = month_range(datetime.date.today().strftime("%Y-%m"))
+    group_by = tuple(dim for dim in (args.group_by or "").split(",") if dim)
+    rows = summarize(conn, start, end, group_by)
+    if not group_by and not rows:
+        rows = [{"income": 0.0, "expense": 0.0, "balance": 0.0, "count": 0}]
+    return rows
+
+
+def cmd_history(conn, args):
+    """ 最近的交易记录（新→旧） """
+    return [dict(zip(HISTORY_COLUMNS, row))
+            for row in get_transactions_page(conn, limit=args.limit)]
+
+
+def cmd_balance(conn, args):
+    """ 时点余额（--at），或区间内每天末的余额序列（--from / --to）"""
+    if args.start is None and args.end is None:
+        return [{"date": args.at or datetime.date.today().isoformat(),
+                 "balance": balance_at(conn, args.at)}]
+    end = args.end or (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+    start = args.start or (datetime.date.fromisoformat(end) - datetime.timedelta(days=30)).isoformat()
+    return [{"date": date, "balance": balance}
+            for date, balance in balance_series(conn, start, end, fill=not args.sparse)]
+
+
+def cmd_budget(conn, args):
+    """ 设置预算（--set，金额为 0 时删除），输出所有预算的本期进度 """
+    if args.set is not None:
+        set_budget(conn, args.set, args.category, args.period)
+    return get_budgets(conn)
+
+
+def cmd_rules(conn, args):
+    """ 周期性收支规则列表 """
+    return get_recurring_rules(conn, args.kind)
+
+
+def cmd_add_rule(conn, args):
+    """ 添加周期性收支规则 """
+    rule_id = add_recurring_rule(conn, args.type, args.amount, args.category, args.freq,
+                                 args.start, args.end, args.every, args.day, args.nth, args.month,
+                                 args.description)
+    return [{"id": rule_id}]
+
+
+def cmd_end_rule(conn, args):
+    """ 结束周期性收支规则 """
+    end_recurring_rule(conn, args.id, args.date)
+    return [{"id": args.id}]
+
+
+def cmd_run_rules(conn, args):
+    """ 生成到期的周期性收支（与程序启动时的任务相同） """
+    return [{"inserted": materialize_due(conn, args.today)}]
+
+
+def cmd_apply_defaults(conn, args):
+    """ 补录每日默认项 """
+    return [{"inserted": apply_daily_defaults(conn, args.start, args.end)}]
+
+
+def cmd_backfill_salary(conn, args):
+    """ 补发到期工资 """
+    today = datetime.date.fromisoformat(args.today) if args.today else None
+    return [{"inserted": auto_add_salary(conn, today)}]
+
+
+def cmd_export(conn, args):
+    """ 流式导出到文件，输出导出结果 """
+    return [export_transactions(conn, args.path, args.format, args.start, args.end,
+                                args.trans_type, args.category,
+                                progress=None if args.quiet else progress_to_stderr)]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="cli.py", description="个人记账系统命令行（非交互，适合脚本与定时任务）")
+    parser.add_argument("--db", help=f"数据库文件（默认 {database.DB_PATH}）")
+    parser.add_argument("--tsv", action="store_true", help="输出 TSV（默认每行一个 JSON 对象）")
+    parser.add_argument("--quiet", action="store_true", help="不输出进度")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="命令")
+
+    def date_range(sub, what):
+        sub.add_argument("--from", dest="start", help=f"{what}起始日期（含），YYYY-MM-DD")
+        sub.add_argument("--to", dest="end", help=f"{what}结束日期（不含），YYYY-MM-DD")
+
+    sub = commands.add_parser("add", help="添加一条记录")
+    sub.add_argument("type", choices=("income", "expense"))
+    sub.add_argument("amount", help="金额（元）")
+    sub.add_argument("category", nargs="?", default="未分类")
+    sub.add_argument("description", nargs="?", default="")
+    sub.add_argument("--date", help="日期，默认今天")
+    sub.set_defaults(func=cmd_add)
+
+    sub = commands.add_parser("import", help="批量导入 CSV / JSONL（- 表示标准输入）")
+    sub.add_argument("path")
+    sub.add_argument("--format", choices=("csv", "jsonl"), help="默认按扩展名判断")
+    sub.set_defaults(func=cmd_import)
+
+    sub = commands.add_parser("summary", help="收支统计（默认本月）")
+    date_range(sub, "统计")
+    sub.add_argument("--all", action="store_true", help="统计全部记录")
+    sub.add_argument("--group-by", help=f"逗号分隔的分组维度: {', '.join(SUMMARY_DIMENSIONS)}")
+    sub.set_defaults(func=cmd_summary)
+
+    sub = commands.add_parser("history", help="最近的交易记录")
+    sub.add_argument("--limit", type=int, default=10)
+    sub.set_defaults(func=cmd_history)
+
+    sub = commands.add_parser("balance", help="时点余额或每日余额序列")
+    sub.add_argument("--at", help="截至该日期末的余额，默认今天")
+    date_range(sub, "序列")
+    sub.add_argument("--sparse", action="store_true", help="序列只输出有交易的日期")
+    sub.set_defaults(func=cmd_balance)
+
+    sub = commands.add_parser("budget", help="预算及本期进度；--set 设置预算")
+    sub.add_argument("--set", type=float, metavar="AMOUNT", help="预算金额（元），0 表示删除")
+    sub.add_argument("--category", help="分类，默认全部分类")
+    sub.add_argument("--period", choices=BUDGET_PERIODS, default="month")
+    sub.set_defaults(func=cmd_budget)
+
+    sub = commands.add_parser("rules", help="周期性收支规则列表")
+    sub.add_argument("--kind", choices=("salary", "daily_default", "custom"))
+    sub.set_defaults(func=cmd_rules)
+
+    sub = commands.add_parser("add-rule", help="添加周期性收支规则")
+    sub.add_argument("type", choices=("income", "expense"))
+    sub.add_argument("amount", help="金额（元）")
+    sub.add_argument("category", nargs="?", default="未分类")
+    sub.add_argument("description", nargs="?", default="")
+    sub.add_argument("--freq", choices=RULE_FREQS, default="monthly")
+    sub.add_argument("--every", type=int, default=1, help="间隔（天/周/月/年），默认 1")
+    sub.add_argument("--day", type=int,
+                     help="星期（0-6，0 为周一）或日（1-31，-1 为月末），默认取自起始日期")
+    sub.add_argument("--nth", type=int, help="nth_weekday: 第几个星期（1-4，-1 为最后一个）")
+    sub.add_argument("--month", type=int, help="yearly: 月份（1-12）")
+    sub.add_argument("--from", dest="start", help="起始日期，默认今天")
+    sub.add_argument("--until", dest="end", help="结束日期（含），默认不结束")
+    sub.set_defaults(func=cmd_add_rule)
+
+    sub = commands.add_parser("end-rule", help="结束周期性收支规则")
+    sub.add_argument("id", type=int)
+    sub.add_argument("--date", help="最后可能发生的日期（含），默认昨天")
+    sub.set_defaults(func=cmd_end_rule)
+
+    sub = commands.add_parser("run-rules", help="生成到期的周期性收支")
+    sub.add_argument("--today", help="生成截至该日期（含）的记录，默认今天")
+    sub.set_defaults(func=cmd_run_rules)
+
+    sub = commands.add_parser("apply-defaults", help="补录每日默认项")
+    sub.add_argument("--from", dest="start", help="从该日期起重新补录，默认只生成到期的")
+    sub.add_argument("--to", dest="end", help="结束日期（含），默认今天")
+    sub.set_defaults(func=cmd_apply_defaults)
+
+    sub = commands.add_parser("backfill-salary", help="补发到期工资")
+    sub.add_argument("--today", help="按指定日期计算到期发薪日，默认今天")
+    sub.set_defaults(func=cmd_backfill_salary)
+
+    sub = commands.add_parser("export", help="导出交易记录（CSV / JSONL / Arrow IPC）")
+    sub.add_argument("path")
+    sub.add_argument("--format", choices=("csv", "jsonl", "arrow"), help="默认按扩展名判断")
+    date_range(sub, "导出")
+    sub.add_argument("--type", dest="trans_type", choices=("income", "expense"))
+    sub.add_argument("--category")
+    sub.set_defaults(func=cmd_export)
+    return parser
+
+
+def run(argv=None):
+    """
+    命令行入口：每次调用只打开一次数据库，不显示菜单和启动信息，不执行启动任务
+    返回退出码: 0 成功；1 执行失败（原因写到标准错误）；导入有拒收行时也返回 1
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.db:
+        database.DB_PATH = args.db
+
+    conn = get_connection()
+    try:
+        create_tables(conn, (lambda *_: None) if args.quiet else progress_to_stderr)
+        records = args.func(conn, args)
+    except Exception as e:
+        conn.rollback()
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+    finally:
+        close_all_connections()
+
+    emit(records, args.tsv)
+    return 1 if args.command == "import" and records[0]["rejected"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
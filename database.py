@@ -1,72 +1,1043 @@
 # database.py
+import calendar
+import datetime
+import os
 import sqlite3
+import threading
 from sqlite3 import Error
+from query_cache import cached_query, flush_writes, forget_connection, invalidate, note_write
+from instrumentation import instrument_connection
+from budget_events import record_alert
+from recurrence import next_occurrence
+
+DB_PATH = 'data/finance.db'  # 数据库文件保存在data目录
+BUSY_TIMEOUT_MS = 5000       # 写锁被占用时的最长等待时间
+CACHE_SIZE_KB = 16384        # 每个连接的页缓存大小（16MB）
+
+# 连接池：每个线程一个复用连接
+_pool = {}
+_pool_lock = threading.Lock()
+
+# 分类字典缓存：名称 ↔ id（进程内共享，写事务回滚后需调用 clear_category_cache）
+_category_ids = {}
+_category_names = {}
+_category_lock = threading.Lock()
 
 def create_connection():
     """ 创建数据库连接 """
     conn = None
     try:
-        conn = sqlite3.connect('data/finance.db')  # 数据库文件保存在data目录
+        conn = sqlite3.connect(DB_PATH)
+        register_functions(conn)
+        instrument_connection(conn)
         print("数据库连接成功！SQLite版本:", sqlite3.version)
     except Error as e:
         print(f"连接数据库失败: {e}")
     return conn
 
-def create_tables(conn):
-    """ 创建核心数据表 """
-    sql_create_transactions_table = """
-    CREATE TABLE IF NOT EXISTS transactions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        date TEXT NOT NULL,         -- 日期 (格式: YYYY-MM-DD)
-        type TEXT NOT NULL,         -- 类型 (income/expense)
-        amount REAL NOT NULL,       -- 金额
-        category TEXT,             -- 分类 (如餐饮、交通)
-        description TEXT           -- 备注
-    );
-    """
-
-    # 新增薪资设置表
-    sql_create_salary_table = """
+def configure_connection(conn):
+    """ 连接级性能设置：WAL 允许读写并发，NORMAL 同步在 WAL 下仍保证一致性 """
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    register_functions(conn)
+    instrument_connection(conn)
+    return conn
+
+def register_functions(conn):
+    """ 注册触发器用到的自定义 SQL 函数（每个连接都必须注册，否则写交易表会报错）"""
+    conn.create_function("fts_segment", 1, segment_text, deterministic=True)
+    conn.create_function("budget_alert_raised", 7, record_alert)
+
+def _is_cjk(ch):
+    return ('\u2e80' <= ch <= '\u9fff' or '\uac00' <= ch <= '\ud7af'
+            or '\uf900' <= ch <= '\ufaff')
+
+def segment_text(text):
+    """
+    全文索引分词预处理：中日韩字符逐字以空格隔开，其余文本原样保留
+    配合 unicode61 分词器，中文按单字建索引，多字查询用短语匹配，任意子串都能搜到
+    """
+    if not text:
+        return ''
+    return ''.join(f' {ch} ' if _is_cjk(ch) else ch for ch in text)
+
+def get_connection():
+    """
+    获取当前线程的复用连接（首次调用时创建并配置，之后直接返回）
+    注意: 不要关闭返回的连接，统一由 close_all_connections 关闭
+    """
+    thread = threading.current_thread()
+    with _pool_lock:
+        conn = _pool.get(thread)
+        if conn is not None:
+            return conn
+
+        # 顺带回收已结束线程遗留的连接
+        for dead in [t for t in _pool if not t.is_alive()]:
+            stale = _pool.pop(dead)
+            forget_connection(stale)
+            stale.close()
+
+    # check_same_thread=False 仅为了能在退出时由主线程统一关闭
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    configure_connection(conn)
+    with _pool_lock:
+        _pool[thread] = conn
+    return conn
+
+def close_connection():
+    """ 关闭当前线程的复用连接 """
+    with _pool_lock:
+        conn = _pool.pop(threading.current_thread(), None)
+    if conn is not None:
+        forget_connection(conn)
+        conn.close()
+
+def close_all_connections():
+    """ 关闭连接池中的所有连接（程序退出时调用）"""
+    with _pool_lock:
+        conns = list(_pool.values())
+        _pool.clear()
+    for conn in conns:
+        try:
+            forget_connection(conn)
+            conn.close()
+        except Error as e:
+            print(f"关闭连接失败: {e}")
+
+# 核心数据表结构（金额均以整数“分”存储，避免浮点累加误差；分类以整数 id 引用）
+TABLE_SCHEMAS = {
+    # 分类字典表
+    'categories': """
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE   -- 分类名 (如餐饮、交通)
+        );
+        """,
+
+    'transactions': """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,         -- 日期 (格式: YYYY-MM-DD)
+            type TEXT NOT NULL,         -- 类型 (income/expense)
+            amount INTEGER NOT NULL,    -- 金额（分）
+            category_id INTEGER NOT NULL REFERENCES categories(id),  -- 分类
+            description TEXT            -- 备注
+        );
+        """,
+
+    # 薪资设置表
+    'salary_settings': """
         CREATE TABLE IF NOT EXISTS salary_settings (
             id INTEGER PRIMARY KEY,
             payday INTEGER NOT NULL CHECK(payday BETWEEN 1 AND 31),  -- 发薪日（1-31日）
-            amount REAL NOT NULL,
+            amount INTEGER NOT NULL,    -- 月薪（分）
             start_date TEXT NOT NULL,   -- 生效起始日期
             is_active BOOLEAN DEFAULT 1 -- 是否生效
         );
-        """
+        """,
 
-    # 新增每日默认收支表
-    sql_create_defaults_table = """
+    # 每日默认收支表
+    'daily_defaults': """
         CREATE TABLE IF NOT EXISTS daily_defaults (
             id INTEGER PRIMARY KEY,
             type TEXT CHECK(type IN ('income', 'expense')),
-            amount REAL NOT NULL,
-            category TEXT,
+            amount INTEGER NOT NULL,    -- 金额（分）
+            category_id INTEGER NOT NULL REFERENCES categories(id),
             description TEXT,
             is_active BOOLEAN DEFAULT 1
         );
-        """
+        """,
 
-    # 新增预警设置表
-    sql_create_alert_table = """
+    # 预警设置表
+    'budget_alert': """
         CREATE TABLE IF NOT EXISTS budget_alert (
             id INTEGER PRIMARY KEY,
-            monthly_budget REAL,
-            last_alert_month TEXT  -- 上次提醒月份（防止重复提醒）
+            monthly_budget INTEGER,     -- 月度预算（分）
+            last_alert_month TEXT       -- 上次提醒月份（防止重复提醒）
+        );
+        """,
+
+    # 应用状态表（记录上次自动处理到的日期等）
+    'app_state': """
+        CREATE TABLE IF NOT EXISTS app_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
         );
+        """,
+
+    # 发薪记录表（每月一条，作为自动发薪的幂等键）
+    'salary_payments': """
+        CREATE TABLE IF NOT EXISTS salary_payments (
+            month TEXT PRIMARY KEY,     -- 发薪月份 (YYYY-MM)
+            pay_date TEXT NOT NULL      -- 实际入账日期
+        ) WITHOUT ROWID;
+        """,
+}
+
+# 旧版本以 REAL（元）存储的金额列
+CENTS_COLUMNS = {
+    'transactions': ['amount'],
+    'salary_settings': ['amount'],
+    'daily_defaults': ['amount'],
+    'budget_alert': ['monthly_budget'],
+}
+
+# 旧版本以文本存储分类的表（category 列迁移为 category_id）
+CATEGORY_TABLES = ['transactions', 'daily_defaults']
+DEFAULT_CATEGORY = '未分类'
+
+MIGRATION_CHUNK_ROWS = 50000  # 重建大表时每批复制的 rowid 跨度（每批报告一次进度）
+
+def create_tables(conn, progress=None):
+    """
+    创建/升级数据库结构（程序启动时调用）
+    结构已是最新时只读取一次 PRAGMA user_version；否则执行 migrate
+    参数:
+        progress: 进度回调 progress(描述, 已完成, 总数)，默认输出到控制台；
+                  每个迁移步骤开始时以总数 0 调用一次，大表重建/回填按批调用
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return version
+    return migrate(conn, progress or print_progress)
+
+def migrate(conn, progress=None):
+    """
+    按版本号依次执行待执行的迁移，全部在同一个事务中完成（失败则整体回滚）
+    版本号保存在 PRAGMA user_version，表示 MIGRATIONS 中已执行的条数
+    返回: 迁移后的版本号
+    """
+    try:
+        # IMMEDIATE：多个进程同时启动时只有一个执行迁移，其余等待后看到新版本
+        conn.execute("BEGIN IMMEDIATE")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, (description, step) in enumerate(MIGRATIONS[version:], version + 1):
+            if progress:
+                progress(f"[{number}/{SCHEMA_VERSION}] {description}", 0, 0)
+            step(conn, progress)
+        conn.execute(f"PRAGMA user_version = {max(version, SCHEMA_VERSION)}")
+        conn.commit()
+        # 迁移可能重建任意表，整体清空查询缓存
+        invalidate()
+        return max(version, SCHEMA_VERSION)
+    except Error as e:
+        conn.rollback()
+        clear_category_cache()
+        flush_writes()
+        print(f"数据库迁移失败: {e}")
+        raise
+
+def print_progress(description, done, total, file=None):
+    """
+    默认的迁移进度输出：total 为 0 表示开始新的迁移步骤，否则在同一行刷新百分比
+    file: 输出位置，默认为标准输出（命令行输出 JSON 时改为 sys.stderr）
+    """
+    if not total:
+        print(description, file=file)
+        return
+    print(f"\r    {description} {done * 100 // total}%", end="\n" if done >= total else "",
+          file=file, flush=True)
+
+def _run_in_chunks(conn, table, sql, description=None, progress=None):
+    """
+    按 rowid 区间分批执行 sql，用于大表的复制/回填
+    sql 中的两个占位符依次为区间下界（不含）和上界（含）
+    """
+    low, high = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table}").fetchone()
+    if low is None:
+        return
+    for start in range(low - 1, high, MIGRATION_CHUNK_ROWS):
+        stop = min(start + MIGRATION_CHUNK_ROWS, high)
+        conn.execute(sql, (start, stop))
+        if progress:
+            progress(description, stop - low + 1, high - low + 1)
+
+def create_base_tables(conn, progress=None):
+    """ 创建核心数据表（已存在的表不变）"""
+    for table in TABLE_SCHEMAS.values():
+        conn.execute(table)
+
+def column_type(conn, table, column):
+    """ 返回列的声明类型（表或列不存在时返回 None）"""
+    for row in conn.execute(f"PRAGMA table_info({table})"):
+        if row[1] == column:
+            return row[2].upper()
+    return None
+
+def migrate_legacy_schema(conn, progress=None):
+    """
+    旧数据库原地迁移（需在事务中调用，每张表最多重建一次）:
+    - 金额列由 REAL（元）改为 INTEGER（分）
+    - 文本分类列 category 改为引用 categories 表的 category_id（空分类归入“未分类”）
+    monthly_totals 结构随之变化，迁移时删除，随后由 create_rollups 重建
+    返回: bool (是否执行了迁移)
+    """
+    expressions = {}
+    for table, columns in CENTS_COLUMNS.items():
+        if column_type(conn, table, columns[0]) == 'REAL':
+            expressions.setdefault(table, {}).update({
+                column: f"CAST(ROUND({column} * 100) AS INTEGER)" for column in columns
+            })
+    category_name = f"COALESCE(NULLIF(category, ''), '{DEFAULT_CATEGORY}')"
+    legacy_categories = [table for table in CATEGORY_TABLES
+                         if column_type(conn, table, 'category') is not None]
+    for table in legacy_categories:
+        expressions.setdefault(table, {})['category_id'] = \
+            f"(SELECT id FROM categories WHERE name = {category_name})"
+
+    rollup_pending = column_type(conn, 'monthly_totals', 'total') == 'REAL' or \
+        column_type(conn, 'monthly_totals', 'category') is not None
+    if not expressions and not rollup_pending:
+        return False
+
+    for table in legacy_categories:
+        conn.execute(f"INSERT OR IGNORE INTO categories(name) "
+                     f"SELECT DISTINCT {category_name} FROM {table}")
+    for table, table_expressions in expressions.items():
+        _rebuild_table(conn, table, table_expressions, progress)
+    conn.execute("DROP TABLE IF EXISTS monthly_totals")
+    return True
+
+def _rebuild_table(conn, table, expressions, progress=None):
+    """
+    按 TABLE_SCHEMAS 中的新结构重建表并复制数据（需在事务中调用）
+    参数:
+        expressions: {新表列名: 基于旧表的转换表达式}，未列出的列按同名列原样复制
+    说明: 旧表上的索引和触发器随旧表删除，由 create_indexes / create_rollups 重新创建
+    """
+    seq = None
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'").fetchone():
+        seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+
+    conn.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+    conn.execute(TABLE_SCHEMAS[table])
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    _run_in_chunks(conn, f"{table}_old",
+                   f"INSERT INTO {table}({', '.join(columns)}) "
+                   f"SELECT {', '.join(expressions.get(c, c) for c in columns)} FROM {table}_old "
+                   f"WHERE rowid > ? AND rowid <= ? ORDER BY rowid",
+                   f"重建 {table}", progress)
+    conn.execute(f"DROP TABLE {table}_old")
+    # 保留自增序号，避免已删除记录的 id 被复用
+    if seq:
+        conn.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = ?", (seq[0], table))
+
+def create_indexes(conn, progress=None):
+    """ 为交易表创建复合索引（汇总、预警、默认项查询均按日期区间过滤）"""
+    indexes = [
+        # 按类型汇总某段日期：show_summary / get_budget_alert_status
+        "CREATE INDEX IF NOT EXISTS idx_transactions_type_date ON transactions(type, date)",
+        # 按日期查重：周期规则的 skip_existing（每日默认项）
+        "CREATE INDEX IF NOT EXISTS idx_transactions_date_type_category "
+        "ON transactions(date, type, category_id)",
+        # 交易列表键集分页：按 (date, id) 排序
+        "CREATE INDEX IF NOT EXISTS idx_transactions_date_id ON transactions(date, id)",
+    ]
+    for index in indexes:
+        conn.execute(index)
+
+def create_rollups(conn, progress=None):
+    """
+    创建按 (月份, 类型, 分类) 汇总的 monthly_totals 表及维护触发器
+    交易表的任何增删改（包括GUI右键删除）都会由触发器同步到汇总表
+    """
+    sql_create_rollup_table = """
+        CREATE TABLE IF NOT EXISTS monthly_totals (
+            month TEXT NOT NULL,        -- 月份 (YYYY-MM)
+            type TEXT NOT NULL,         -- 类型 (income/expense)
+            category_id INTEGER NOT NULL,      -- 分类 id
+            total INTEGER NOT NULL DEFAULT 0,  -- 金额合计（分）
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, type, category_id)
+        ) WITHOUT ROWID;
         """
 
-    # 执行所有建表语句
-    tables = [sql_create_salary_table, sql_create_defaults_table, sql_create_alert_table]
-    for table in tables:
-        try:
-            c = conn.cursor()
-            c.execute(table)
-            conn.commit()
-            print("数据表创建成功！")
-        except Error as e:
-            print(f"创建表失败: {e}")
+    # 增量维护：新增累加、删除扣减（计数归零的行删除）、修改视为先删后增
+    add_new = """
+            INSERT INTO monthly_totals(month, type, category_id, total, count)
+            VALUES (substr(NEW.date, 1, 7), NEW.type, NEW.category_id, NEW.amount, 1)
+            ON CONFLICT(month, type, category_id)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;
+        """
+    remove_old = """
+            UPDATE monthly_totals SET total = total - OLD.amount, count = count - 1
+            WHERE month = substr(OLD.date, 1, 7) AND type = OLD.type
+              AND category_id = OLD.category_id;
+            DELETE FROM monthly_totals
+            WHERE month = substr(OLD.date, 1, 7) AND type = OLD.type
+              AND category_id = OLD.category_id AND count <= 0;
+        """
+    triggers = [
+        "CREATE TRIGGER IF NOT EXISTS trg_monthly_totals_insert AFTER INSERT ON transactions "
+        "BEGIN" + add_new + "END",
+        "CREATE TRIGGER IF NOT EXISTS trg_monthly_totals_delete AFTER DELETE ON transactions "
+        "BEGIN" + remove_old + "END",
+        "CREATE TRIGGER IF NOT EXISTS trg_monthly_totals_update "
+        "AFTER UPDATE OF date, type, amount, category_id ON transactions "
+        "BEGIN" + remove_old + add_new + "END",
+    ]
+
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='monthly_totals'")
+    is_new = c.fetchone() is None
+    c.execute(sql_create_rollup_table)
+    for trigger in triggers:
+        c.execute(trigger)
+    # 已有数据的旧数据库：首次创建时回填一次
+    if is_new:
+        rebuild_monthly_totals(conn, progress, commit=False)
+
+def rebuild_monthly_totals(conn, progress=None, commit=True):
+    """
+    根据交易表（含全部归档库）重建 monthly_totals（用于旧数据库或修复不一致）
+    归档库逐个整体汇总，主库按 id 区间分批累加
+    """
+    archives = history_schemas(conn)[:-1]
+    conn.execute("DELETE FROM monthly_totals")
+    for schema in archives:
+        conn.execute(f"""
+            INSERT INTO monthly_totals(month, type, category_id, total, count)
+            SELECT substr(date, 1, 7), type, category_id, SUM(amount), COUNT(*)
+            FROM {schema}.transactions
+            GROUP BY 1, 2, 3
+        """)
+    _run_in_chunks(conn, "transactions", """
+        INSERT INTO monthly_totals(month, type, category_id, total, count)
+        SELECT substr(date, 1, 7), type, category_id, SUM(amount), COUNT(*)
+        FROM transactions
+        WHERE id > ? AND id <= ?
+        GROUP BY 1, 2, 3
+        ON CONFLICT(month, type, category_id)
+        DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+    """, "回填月度汇总", progress)
+    note_write("monthly_totals")
+    if commit:
+        conn.commit()
+        flush_writes()
+
+def verify_monthly_totals(conn):
+    """
+    校验 monthly_totals 与交易表（含全部归档库）实时汇总是否一致
+    返回: 不一致项列表 [(month, type, category_id, 汇总表金额, 实际金额), ...]，为空表示一致
+    """
+    attach_archives(conn)
+    cur = conn.cursor()
+    cur.execute("""
+        WITH actual AS (
+            SELECT substr(date, 1, 7) AS month, type, category_id,
+                   SUM(amount) AS total, COUNT(*) AS count
+            FROM all_transactions
+            GROUP BY 1, 2, 3
+        )
+        SELECT a.month, a.type, a.category_id, m.total, a.total
+        FROM actual a
+        LEFT JOIN monthly_totals m
+          ON m.month = a.month AND m.type = a.type AND m.category_id = a.category_id
+        WHERE m.month IS NULL OR m.count != a.count OR m.total != a.total
+        UNION ALL
+        SELECT m.month, m.type, m.category_id, m.total, NULL
+        FROM monthly_totals m
+        WHERE NOT EXISTS (SELECT 1 FROM actual a
+                          WHERE a.month = m.month AND a.type = m.type
+                            AND a.category_id = m.category_id)
+    """)
+    return cur.fetchall()
+
+def create_search_index(conn, progress=None):
+    """
+    创建交易备注/分类的 FTS5 全文索引，由触发器与交易表保持同步
+    索引为无内容表（content=''），只存倒排索引，结果按 rowid 回交易表读取；
+    删除时需提供与写入时相同的分词文本
+    """
+    segmented = """
+        fts_segment({row}.description),
+        (SELECT fts_segment(name) FROM categories WHERE id = {row}.category_id)
+        """
+    add_new = f"""
+            INSERT INTO transactions_fts(rowid, description, category)
+            VALUES (NEW.id, {segmented.format(row='NEW')});
+        """
+    remove_old = f"""
+            INSERT INTO transactions_fts(transactions_fts, rowid, description, category)
+            VALUES ('delete', OLD.id, {segmented.format(row='OLD')});
+        """
+    triggers = [
+        "CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_insert AFTER INSERT ON transactions "
+        "BEGIN" + add_new + "END",
+        "CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_delete AFTER DELETE ON transactions "
+        "BEGIN" + remove_old + "END",
+        "CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_update "
+        "AFTER UPDATE OF description, category_id ON transactions "
+        "BEGIN" + remove_old + add_new + "END",
+    ]
+
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='transactions_fts'")
+    is_new = c.fetchone() is None
+    c.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+            description, category,
+            content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    for trigger in triggers:
+        c.execute(trigger)
+    if is_new:
+        rebuild_search_index(conn, progress, commit=False)
+
+def rebuild_search_index(conn, progress=None, commit=True):
+    """ 根据交易表重建全文索引（用于旧数据库或修复不一致），按 id 区间分批写入 """
+    conn.execute("INSERT INTO transactions_fts(transactions_fts) VALUES ('delete-all')")
+    _run_in_chunks(conn, "transactions", """
+        INSERT INTO transactions_fts(rowid, description, category)
+        SELECT t.id, fts_segment(t.description), fts_segment(c.name)
+        FROM transactions t JOIN categories c ON c.id = t.category_id
+        WHERE t.id > ? AND t.id <= ?
+    """, "建立全文索引", progress)
+    note_write("transactions_fts")
+    if commit:
+        conn.commit()
+        flush_writes()
+
+# 交易对余额的影响（分）：收入为正、支出为负
+SIGNED_AMOUNT = "CASE {row}type WHEN 'income' THEN {row}amount ELSE -{row}amount END"
+
+def create_balance_index(conn, progress=None):
+    """
+    创建每日余额表 daily_balances（按日期主键）：当天净额、笔数、截至当天末的累计余额
+    由触发器增量维护：写入某天的交易时只修补该日期及之后的行（后缀），
+    新增当天的记录几乎没有后缀；补录/删除较早的记录时后缀为其后有交易的天数
+    """
+    signed_new = SIGNED_AMOUNT.format(row="NEW.")
+    signed_old = SIGNED_AMOUNT.format(row="OLD.")
+    add_new = f"""
+            INSERT INTO daily_balances(date, net, count, balance)
+            VALUES (NEW.date, {signed_new}, 1, {signed_new} + COALESCE(
+                (SELECT balance FROM daily_balances WHERE date < NEW.date
+                 ORDER BY date DESC LIMIT 1), 0))
+            ON CONFLICT(date) DO UPDATE SET net = net + excluded.net, count = count + 1,
+                                            balance = balance + excluded.net;
+            UPDATE daily_balances SET balance = balance + {signed_new} WHERE date > NEW.date;
+        """
+    remove_old = f"""
+            UPDATE daily_balances SET net = net - {signed_old}, count = count - 1
+            WHERE date = OLD.date;
+            UPDATE daily_balances SET balance = balance - {signed_old} WHERE date >= OLD.date;
+            DELETE FROM daily_balances WHERE date = OLD.date AND count <= 0;
+        """
+    triggers = [
+        "CREATE TRIGGER IF NOT EXISTS trg_daily_balances_insert AFTER INSERT ON transactions "
+        "BEGIN" + add_new + "END",
+        "CREATE TRIGGER IF NOT EXISTS trg_daily_balances_delete AFTER DELETE ON transactions "
+        "BEGIN" + remove_old + "END",
+        "CREATE TRIGGER IF NOT EXISTS trg_daily_balances_update "
+        "AFTER UPDATE OF date, type, amount ON transactions "
+        "BEGIN" + remove_old + add_new + "END",
+    ]
+
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='daily_balances'")
+    is_new = c.fetchone() is None
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS daily_balances (
+            date TEXT PRIMARY KEY,      -- 日期 (YYYY-MM-DD)，只有当天有交易才有行
+            net INTEGER NOT NULL,       -- 当天净额（分，收入减支出）
+            count INTEGER NOT NULL,     -- 当天交易笔数（归零时删除该行）
+            balance INTEGER NOT NULL    -- 截至当天末的累计余额（分）
+        ) WITHOUT ROWID
+    """)
+    for trigger in triggers:
+        c.execute(trigger)
+    if is_new:
+        rebuild_daily_balances(conn, progress, commit=False)
+
+# 按日期汇总净额后用窗口函数求前缀和（date 为 idx_transactions_date_id 前缀，分组无需排序）
+DAILY_BALANCES_SQL = f"""
+    SELECT date, net, count, SUM(net) OVER (ORDER BY date) AS balance
+    FROM (SELECT date, SUM({SIGNED_AMOUNT.format(row="")}) AS net, COUNT(*) AS count
+          FROM {{source}} GROUP BY date)
+    """
+
+def rebuild_daily_balances(conn, progress=None, commit=True):
+    """ 根据交易表（含全部归档库）重建 daily_balances（用于旧数据库或修复不一致）"""
+    if progress:
+        progress("回填每日余额", 0, 1)
+    source = "all_transactions" if len(history_schemas(conn)) > 1 else "transactions"
+    conn.execute("DELETE FROM daily_balances")
+    conn.execute("INSERT INTO daily_balances(date, net, count, balance) "
+                 + DAILY_BALANCES_SQL.format(source=source))
+    note_write("daily_balances")
+    if progress:
+        progress("回填每日余额", 1, 1)
+    if commit:
+        conn.commit()
+        flush_writes()
+
+def verify_daily_balances(conn):
+    """
+    校验 daily_balances 与交易表（含全部归档库）实时计算的结果是否一致
+    返回: 不一致项列表 [(date, 余额表的余额, 实际余额), ...]，为空表示一致
+    """
+    attach_archives(conn)
+    cur = conn.cursor()
+    cur.execute(f"""
+        WITH actual AS ({DAILY_BALANCES_SQL.format(source="all_transactions")})
+        SELECT a.date, b.balance, a.balance
+        FROM actual a LEFT JOIN daily_balances b ON b.date = a.date
+        WHERE b.date IS NULL OR b.net != a.net OR b.count != a.count OR b.balance != a.balance
+        UNION ALL
+        SELECT b.date, b.balance, NULL
+        FROM daily_balances b
+        WHERE NOT EXISTS (SELECT 1 FROM actual a WHERE a.date = b.date)
+    """)
+    return cur.fetchall()
+
+# 预算周期 -> 周期键：周为当周周一的日期，月为 YYYY-MM，年为 YYYY
+BUDGET_PERIODS = ('week', 'month', 'year')
+BUDGET_PERIOD_KEY = ("CASE {period} WHEN 'week' THEN date({date}, 'weekday 0', '-6 days') "
+                     "WHEN 'year' THEN substr({date}, 1, 4) ELSE substr({date}, 1, 7) END")
+BUDGET_THRESHOLDS = (80, 100)  # 默认提醒阈值（预算的百分比）
+# 对“当前周期”检查阈值：计数达到阈值且尚未提醒过的写入 budget_alerts（主键去重）
+# {budgets} 为筛选受影响预算的条件，b 为 budgets 表别名
+BUDGET_CHECK_SQL = f"""
+    INSERT OR IGNORE INTO budget_alerts(budget_id, period_key, threshold, spent, raised_at)
+    SELECT b.id, s.period_key, t.percent, s.spent, datetime('now', 'localtime')
+    FROM budgets b
+    JOIN budget_spend s ON s.budget_id = b.id
+     AND s.period_key = {BUDGET_PERIOD_KEY.format(period='b.period', date="date('now', 'localtime')")}
+    JOIN budget_thresholds t
+    WHERE {{budgets}} AND s.spent * 100 >= b.amount * t.percent
+    """
+
+def create_budget_engine(conn, progress=None):
+    """
+    按分类、按周期（周/月/年）的预算引擎：
+    - budgets: 预算设置，category_id = 0 表示全部分类
+    - budget_spend: 每个预算每个周期的累计支出，由交易表触发器按增量维护（每次写入 O(预算数)）
+    - budget_alerts: 已提醒的 (预算, 周期, 阈值)，主键去重，推广了原来的 last_alert_month；
+      插入时经 SQL 函数 budget_alert_raised 通知写线程（notified 记录是否已送达界面）
+    旧版 budget_alert 的月度总预算迁移为全部分类的月预算，last_alert_month 迁移为已提醒记录
+    """
+    c = conn.cursor()
+    for sql in ("""
+        CREATE TABLE IF NOT EXISTS budgets (
+            id INTEGER PRIMARY KEY,
+            category_id INTEGER NOT NULL DEFAULT 0,  -- 分类 id，0 表示全部分类
+            period TEXT NOT NULL CHECK(period IN ('week', 'month', 'year')),
+            amount INTEGER NOT NULL,                 -- 预算金额（分）
+            UNIQUE (category_id, period)
+        )""", """
+        CREATE TABLE IF NOT EXISTS budget_spend (
+            budget_id INTEGER NOT NULL,
+            period_key TEXT NOT NULL,                -- 周一日期 / YYYY-MM / YYYY
+            spent INTEGER NOT NULL DEFAULT 0,        -- 累计支出（分）
+            PRIMARY KEY (budget_id, period_key)
+        ) WITHOUT ROWID""", """
+        CREATE TABLE IF NOT EXISTS budget_alerts (
+            budget_id INTEGER NOT NULL,
+            period_key TEXT NOT NULL,
+            threshold INTEGER NOT NULL,              -- 阈值（百分比）
+            spent INTEGER NOT NULL,                  -- 触发时的累计支出（分）
+            raised_at TEXT NOT NULL,
+            notified INTEGER NOT NULL DEFAULT 0,     -- 是否已送达界面
+            PRIMARY KEY (budget_id, period_key, threshold)
+        ) WITHOUT ROWID""", """
+        CREATE TABLE IF NOT EXISTS budget_thresholds (
+            percent INTEGER PRIMARY KEY
+        )"""):
+        c.execute(sql)
+    c.executemany("INSERT OR IGNORE INTO budget_thresholds(percent) VALUES (?)",
+                  [(percent,) for percent in BUDGET_THRESHOLDS])
+
+    # 旧版全局月预算
+    if column_type(conn, 'budget_alert', 'monthly_budget') is not None:
+        for amount, last_alert_month in c.execute(
+                "SELECT monthly_budget, last_alert_month FROM budget_alert "
+                "WHERE monthly_budget IS NOT NULL ORDER BY id LIMIT 1").fetchall():
+            c.execute("INSERT OR IGNORE INTO budgets(category_id, period, amount) "
+                      "VALUES (0, 'month', ?)", (amount,))
+            budget_id = c.execute("SELECT id FROM budgets WHERE category_id = 0 "
+                                  "AND period = 'month'").fetchone()[0]
+            seed_budget_spend(conn, budget_id)
+            if last_alert_month:
+                c.execute("""
+                    INSERT OR IGNORE INTO budget_alerts(budget_id, period_key, threshold, spent,
+                                                        raised_at, notified)
+                    SELECT ?, ?, percent, COALESCE((SELECT spent FROM budget_spend
+                                                    WHERE budget_id = ? AND period_key = ?), 0),
+                           datetime('now', 'localtime'), 1
+                    FROM budget_thresholds""",
+                          (budget_id, last_alert_month, budget_id, last_alert_month))
+        c.execute("DROP TABLE budget_alert")
+
+    key = {row: BUDGET_PERIOD_KEY.format(period='b.period', date=f'{row}.date')
+           for row in ('NEW', 'OLD')}
+    add_new = f"""
+            INSERT INTO budget_spend(budget_id, period_key, spent)
+            SELECT b.id, {key['NEW']}, NEW.amount FROM budgets b
+            WHERE NEW.type = 'expense' AND b.category_id IN (0, NEW.category_id)
+            ON CONFLICT(budget_id, period_key) DO UPDATE SET spent = spent + excluded.spent;
+            {BUDGET_CHECK_SQL.format(budgets="NEW.type = 'expense' AND b.category_id IN (0, NEW.category_id)")};
+        """
+    remove_old = f"""
+            UPDATE budget_spend SET spent = spent - OLD.amount
+            WHERE OLD.type = 'expense' AND (budget_id, period_key) IN (
+                SELECT b.id, {key['OLD']} FROM budgets b
+                WHERE b.category_id IN (0, OLD.category_id));
+        """
+    notify = """
+            UPDATE budget_alerts SET notified = budget_alert_raised(
+                NEW.budget_id,
+                (SELECT c.name FROM budgets b JOIN categories c ON c.id = b.category_id
+                 WHERE b.id = NEW.budget_id),
+                (SELECT period FROM budgets WHERE id = NEW.budget_id),
+                NEW.period_key, NEW.threshold, NEW.spent,
+                (SELECT amount FROM budgets WHERE id = NEW.budget_id))
+            WHERE budget_id = NEW.budget_id AND period_key = NEW.period_key
+              AND threshold = NEW.threshold;
+        """
+    triggers = [
+        "CREATE TRIGGER IF NOT EXISTS trg_budget_spend_insert AFTER INSERT ON transactions "
+        "BEGIN" + add_new + "END",
+        "CREATE TRIGGER IF NOT EXISTS trg_budget_spend_delete AFTER DELETE ON transactions "
+        "BEGIN" + remove_old + "END",
+        "CREATE TRIGGER IF NOT EXISTS trg_budget_spend_update "
+        "AFTER UPDATE OF date, type, amount, category_id ON transactions "
+        "BEGIN" + remove_old + add_new + "END",
+        "CREATE TRIGGER IF NOT EXISTS trg_budget_alerts_notify AFTER INSERT ON budget_alerts "
+        "WHEN NEW.notified = 0 BEGIN" + notify + "END",
+    ]
+    for trigger in triggers:
+        c.execute(trigger)
+
+def seed_budget_spend(conn, budget_id):
+    """
+    按交易历史重算一个预算各周期的累计支出（新建预算或修复不一致时调用，不提交）
+    月、年预算从 monthly_totals 汇总，周预算需扫描交易表（含全部归档库）
+    """
+    period, category_id = conn.execute("SELECT period, category_id FROM budgets WHERE id = ?",
+                                       (budget_id,)).fetchone()
+    category_filter = "" if category_id == 0 else "AND category_id = :category_id"
+    if period == 'week':
+        table = "all_transactions" if len(history_schemas(conn)) > 1 else "transactions"
+        source = f"""SELECT {BUDGET_PERIOD_KEY.format(period="'week'", date='date')} AS period_key,
+                            SUM(amount) AS spent
+                     FROM {table} WHERE type = 'expense' {category_filter} GROUP BY 1"""
+    else:
+        length = 4 if period == 'year' else 7
+        source = f"""SELECT substr(month, 1, {length}) AS period_key, SUM(total) AS spent
+                     FROM monthly_totals WHERE type = 'expense' {category_filter} GROUP BY 1"""
+    conn.execute("DELETE FROM budget_spend WHERE budget_id = :budget_id",
+                 {"budget_id": budget_id})
+    conn.execute(f"INSERT INTO budget_spend(budget_id, period_key, spent) "
+                 f"SELECT :budget_id, period_key, spent FROM ({source})",
+                 {"budget_id": budget_id, "category_id": category_id})
+    note_write("budget_spend")
+
+# recurring_rules 的列（main.py 按此顺序读取规则）
+RULE_COLUMNS = ("id", "kind", "type", "amount", "category_id", "description", "freq", "every",
+                "day", "nth", "month", "start_date", "end_date", "next_due", "skip_existing")
+
+def create_recurring_rules(conn, progress=None):
+    """
+    周期性收支规则表 recurring_rules，取代 salary_settings（每月发薪）和 daily_defaults（每日默认项）
+    - 频率: 每天 / 每周 / 每月 / 每月第 n 个星期几 / 每年，可设间隔和结束日期（见 recurrence.py）
+    - next_due 为下一次尚未生成记录的日期（规则结束后为 NULL），其上的部分索引就是到期队列：
+      启动时按 next_due <= 今天做一次范围查找，只读取实际到期的规则
+    - 生成记录与推进 next_due 在同一事务中完成，next_due 本身即幂等键
+    旧表迁移:
+    - 薪资设置按生效区间转为每月规则，从已发月份（salary_payments 及旧版已录入薪资收入的月份）
+      之后开始生成；没有生效中的设置视为停发
+    - 生效中的每日默认项转为每日规则（当天已有同类型同分类记录时跳过），从上次补录日期的次日开始
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recurring_rules (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL DEFAULT 'custom',      -- salary / daily_default / custom
+            type TEXT NOT NULL CHECK(type IN ('income', 'expense')),
+            amount INTEGER NOT NULL,                  -- 金额（分）
+            category_id INTEGER NOT NULL REFERENCES categories(id),
+            description TEXT NOT NULL DEFAULT '',
+            freq TEXT NOT NULL CHECK(freq IN ('daily', 'weekly', 'monthly', 'nth_weekday', 'yearly')),
+            every INTEGER NOT NULL DEFAULT 1,         -- 间隔（天 / 周 / 月 / 年）
+            day INTEGER,                              -- 星期（0-6，0 为周一）或日（1-31，-1 为月末）
+            nth INTEGER,                              -- 第几个星期（1-4，-1 为最后一个）
+            month INTEGER,                            -- 每年规则的月份
+            start_date TEXT NOT NULL,
+            end_date TEXT,                            -- 最后可能发生的日期（含），NULL 表示不结束
+            next_due TEXT,                            -- 下一次待生成的日期，NULL 表示已结束
+            skip_existing INTEGER NOT NULL DEFAULT 0  -- 1: 当天已有同类型同分类记录时跳过
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recurring_rules_next_due "
+                 "ON recurring_rules(next_due) WHERE next_due IS NOT NULL")
+
+    insert = f"""INSERT INTO recurring_rules({', '.join(RULE_COLUMNS[1:])})
+                 VALUES ({', '.join('?' * (len(RULE_COLUMNS) - 1))})"""
+    today = datetime.date.today()
+    if column_type(conn, 'salary_settings', 'payday') is not None:
+        settings = conn.execute("""SELECT payday, amount, start_date, is_active FROM salary_settings
+                                   ORDER BY start_date, id""").fetchall()
+        if settings:
+            salary_category = get_category_id(conn, '薪资')
+            paid = {row[0] for row in conn.execute(
+                "SELECT month FROM monthly_totals WHERE type = 'income' AND category_id = ?",
+                (salary_category,))}
+            if column_type(conn, 'salary_payments', 'month') is not None:
+                paid.update(row[0] for row in conn.execute("SELECT month FROM salary_payments"))
+            # 已发的最后一个月的月末，之后的发薪日才需要生成
+            paid_until = None
+            if paid:
+                year, month = map(int, max(paid).split('-'))
+                paid_until = datetime.date(year, month, calendar.monthrange(year, month)[1])
+            active = any(is_active for *_, is_active in settings)
+            for i, (payday, amount, start_date, _) in enumerate(settings):
+                # 每条设置生效到下一条设置生效的前一天
+                if i + 1 < len(settings):
+                    end_date = (datetime.date.fromisoformat(settings[i + 1][2])
+                                - datetime.timedelta(days=1)).isoformat()
+                else:
+                    end_date = None if active else today.isoformat()
+                rule = {"freq": 'monthly', "every": 1, "day": payday, "nth": None, "month": None,
+                        "start_date": start_date, "end_date": end_date}
+                next_due = next_occurrence(rule, paid_until) if active else None
+                conn.execute(insert, ('salary', 'income', amount, salary_category, '月度工资',
+                                      'monthly', 1, payday, None, None, start_date, end_date,
+                                      next_due, 0))
+        for table in ('salary_settings', 'salary_payments'):
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+    if column_type(conn, 'daily_defaults', 'amount') is not None:
+        last_applied = get_app_state(conn, 'daily_defaults_last_applied')
+        start_date = (datetime.date.fromisoformat(last_applied) + datetime.timedelta(days=1)
+                      if last_applied else today).isoformat()
+        # 停用的默认项不迁移
+        conn.executemany(insert, [
+            ('daily_default', trans_type, amount, category_id, description, 'daily', 1, None, None,
+             None, start_date, None, start_date, 1)
+            for trans_type, amount, category_id, description in conn.execute(
+                """SELECT type, amount, category_id, COALESCE(description, '')
+                   FROM daily_defaults WHERE is_active = 1 AND amount > 0 ORDER BY id""")])
+        conn.execute("DROP TABLE daily_defaults")
+        conn.execute("DELETE FROM app_state WHERE key = 'daily_defaults_last_applied'")
+
+# 冷热分离：已结束的年份整年移到 archive/finance-YYYY.db（与主库同目录），按需只读 ATTACH
+ARCHIVE_DIR_NAME = 'archive'
+ARCHIVE_SCHEMA = 'archive_{year}'  # ATTACH 后的库名
+ARCHIVED_YEARS_SQL = "SELECT year, path FROM archived_years ORDER BY year"
+# 交易表与各归档库的合并视图（每个连接各自的 TEMP 视图，只包含已 ATTACH 的归档库，由 attach_archives 维护）
+HISTORY_VIEW_SQL = "SELECT id, date, type, amount, category_id, description FROM {schema}.transactions"
+
+def create_archive_catalog(conn, progress=None):
+    """
+    归档目录表 archived_years：已移到归档库的年份及其行数、金额合计（用于校验）
+    年份按从早到晚的顺序归档，最后一个归档年份及之前视为已结账：
+    交易表上的触发器拒绝写入这些日期的记录，保证主库中的记录都晚于归档库，
+    按年份顺序拼接各库即为按日期排序的结果
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archived_years (
+            year TEXT PRIMARY KEY,        -- YYYY
+            path TEXT NOT NULL,           -- 归档库文件名（位于主库同目录的 archive 目录下）
+            rows INTEGER NOT NULL,
+            total INTEGER NOT NULL,       -- 金额合计（分）
+            archived_at TEXT NOT NULL
+        ) WITHOUT ROWID""")
+    closed = """
+            SELECT RAISE(ABORT, '该日期所在年份已归档，不能再写入')
+            WHERE substr(NEW.date, 1, 4) <= (SELECT MAX(year) FROM archived_years);
+        """
+    for trigger in (
+            "CREATE TRIGGER IF NOT EXISTS trg_transactions_archived_insert "
+            "BEFORE INSERT ON transactions BEGIN" + closed + "END",
+            "CREATE TRIGGER IF NOT EXISTS trg_transactions_archived_update "
+            "BEFORE UPDATE OF date ON transactions BEGIN" + closed + "END"):
+        conn.execute(trigger)
+
+def database_file(conn):
+    """ 连接的主库文件路径 """
+    return next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == 'main')
+
+def archive_dir(conn):
+    """ 归档库目录：主库文件所在目录下的 archive """
+    return os.path.join(os.path.dirname(database_file(conn)) or '.', ARCHIVE_DIR_NAME)
+
+def get_archived_years(conn):
+    """ 已归档的年份及归档库的完整路径，按年份升序: [(year, path), ...] """
+    rows = cached_query(conn, ARCHIVED_YEARS_SQL, (), ("archived_years",))
+    directory = archive_dir(conn) if rows else None
+    return [(year, os.path.join(directory, path)) for year, path in rows]
+
+def archived_through(conn):
+    """ 最后一个归档年份（YYYY），该年及之前的日期不能再写入；没有归档时返回 None """
+    years = get_archived_years(conn)
+    return years[-1][0] if years else None
+
+def _archive_years_in(conn, ranges=None):
+    """ 与任一日期区间 [start, end)（None 表示不限）有交集的归档年份；ranges 为 None 时为全部 """
+    return [(year, path) for year, path in get_archived_years(conn)
+            if ranges is None or any((not start or f"{int(year) + 1:04d}-01-01" > start)
+                                     and (not end or f"{year}-01-01" < end)
+                                     for start, end in ranges)]
+
+def _attached_archives(conn):
+    prefix = ARCHIVE_SCHEMA.format(year='')
+    return {row[1] for row in conn.execute("PRAGMA database_list") if row[1].startswith(prefix)}
+
+def _attach(conn, years):
+    """
+    只读（immutable：不加锁、不检查 -wal）ATTACH 归档库，返回对应的库名
+    同时打开的库数达到 SQLite 上限时先 DETACH 用不到的；不能在事务中调用
+    """
+    attached = _attached_archives(conn)
+    wanted = {ARCHIVE_SCHEMA.format(year=year): path for year, path in years}
+    missing = [schema for schema in wanted if schema not in attached]
+    if not missing:
+        if not conn.execute("SELECT 1 FROM sqlite_temp_master WHERE name = 'all_transactions'").fetchone():
+            _refresh_history_view(conn)
+        return list(wanted)
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    if len(wanted) > limit:
+        raise sqlite3.OperationalError(
+            f"需要同时打开的归档库过多（{len(wanted)} > {limit}），请缩小日期范围")
+    if conn.in_transaction:
+        raise sqlite3.OperationalError("不能在事务中打开归档库")
+    spare = sorted(attached - set(wanted))
+    for schema in spare[:max(0, len(attached) + len(missing) - limit)]:
+        conn.execute(f"DETACH DATABASE {schema}")
+    for schema in missing:
+        conn.execute(f"ATTACH DATABASE ? AS {schema}",
+                     (f"file:{wanted[schema]}?mode=ro&immutable=1",))
+    _refresh_history_view(conn)
+    return list(wanted)
+
+def _refresh_history_view(conn):
+    """
+    重建 TEMP 视图 all_transactions = 已 ATTACH 的归档库 UNION ALL 主库交易表
+    在首次用到时才创建：TEMP 视图会妨碍迁移中重建交易表（ALTER TABLE RENAME 会检查所有视图）
+    """
+    schemas = sorted(_attached_archives(conn)) + ['main']
+    conn.execute("DROP VIEW IF EXISTS temp.all_transactions")
+    conn.execute("CREATE TEMP VIEW all_transactions AS "
+                 + " UNION ALL ".join(HISTORY_VIEW_SQL.format(schema=schema) for schema in schemas))
+
+def attach_archives(conn, ranges=None):
+    """
+    按需 ATTACH 与日期区间有交集的归档库，并更新合并视图 all_transactions
+    之后对 all_transactions 按日期过滤的查询会下推到各库，分别走各自的日期索引；
+    区间只涉及主库时不打开任何归档库
+    参数:
+        ranges: [(start, end), ...]，半开区间，None 表示不限；ranges 为 None 时打开全部归档库
+    返回: ATTACH 的库名列表（按年份升序）
+    """
+    return _attach(conn, _archive_years_in(conn, ranges))
+
+def history_schemas(conn):
+    """
+    重建汇总数据时需要读取的全部库名：ATTACH 全部归档库（按年份升序），最后是 'main'
+    有归档库尚未 ATTACH 时不能在事务中调用（写线程在开启事务前先 ATTACH）；
+    迁移中尚未创建归档目录表时只有主库
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                        "AND name = 'archived_years'").fetchone():
+        return ['main']
+    return attach_archives(conn) + ['main']
+
+def iter_history_schemas(conn, start=None, end=None, reverse=False):
+    """
+    按日期顺序逐个给出包含区间 [start, end) 数据的库名（先归档库按年份，最后是主库；reverse 时相反）
+    归档库轮到它时才 ATTACH，调用方在一个库读完后再取下一个，可以按日期顺序流式读取，
+    读到足够的行后停止迭代就不会打开更早的归档库
+    """
+    years = _archive_years_in(conn, [(start, end)])
+    if reverse:
+        yield 'main'
+        years.reverse()
+    for year in years:
+        yield _attach(conn, [year])[0]
+    if not reverse:
+        yield 'main'
+
+# 版本化迁移：按顺序追加，已发布的条目不再修改（user_version = 已执行的条数）
+# 每一步都可安全地作用于未记录版本号的旧数据库（版本 0 可能是任意旧结构）
+MIGRATIONS = [
+    ("创建基础数据表", create_base_tables),
+    ("迁移旧版金额与分类", migrate_legacy_schema),
+    ("创建交易表索引", create_indexes),
+    ("创建月度汇总表", create_rollups),
+    ("创建全文索引", create_search_index),
+    ("创建每日余额表", create_balance_index),
+    ("创建预算引擎", create_budget_engine),
+    ("合并周期性收支规则", create_recurring_rules),
+    ("创建归档目录", create_archive_catalog),
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def get_app_state(conn, key, default=None):
+    """ 读取 app_state 中的值 """
+    cur = conn.cursor()
+    cur.execute("SELECT value FROM app_state WHERE key = ?", (key,))
+    row = cur.fetchone()
+    return row[0] if row else default
+
+def set_app_state(conn, key, value):
+    """ 写入 app_state（不提交，由调用方控制事务）"""
+    conn.execute("INSERT OR REPLACE INTO app_state(key, value) VALUES(?, ?)", (key, value))
+    note_write("app_state")
+
+def _load_categories(conn):
+    """ 从 categories 表整体重新加载分类缓存 """
+    rows = conn.execute("SELECT id, name FROM categories").fetchall()
+    with _category_lock:
+        _category_ids.clear()
+        _category_names.clear()
+        for category_id, name in rows:
+            _category_ids[name] = category_id
+            _category_names[category_id] = name
+
+def get_category_id(conn, name, create=True):
+    """
+    分类名 → id（空名称归入“未分类”）
+    参数:
+        create: 分类不存在时是否新建（不提交，由调用方控制事务）
+    返回: 分类 id；不存在且 create=False 时返回 None
+    """
+    name = name or DEFAULT_CATEGORY
+    category_id = _category_ids.get(name)
+    if category_id is not None:
+        return category_id
+    row = conn.execute("SELECT id FROM categories WHERE name = ?", (name,)).fetchone()
+    if row is None:
+        if not create:
+            return None
+        row = (conn.execute("INSERT INTO categories(name) VALUES(?)", (name,)).lastrowid,)
+        note_write("categories")
+    with _category_lock:
+        _category_ids[name] = row[0]
+        _category_names[row[0]] = name
+    return row[0]
+
+def get_category_name(conn, category_id):
+    """ 分类 id → 名称，缓存未命中时整体重新加载 """
+    name = _category_names.get(category_id)
+    if name is None:
+        _load_categories(conn)
+        name = _category_names.get(category_id)
+    return name
+
+def clear_category_cache():
+    """ 清空分类缓存（新建分类的事务被回滚时调用，避免缓存指向不存在的 id） """
+    with _category_lock:
+        _category_ids.clear()
+        _category_names.clear()
+
+def explain_query_plan(conn, sql, params=()):
+    """ 返回查询计划的各步骤描述，例如 ['SEARCH transactions USING INDEX ...'] """
+    cur = conn.cursor()
+    cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+    return [row[3] for row in cur.fetchall()]
 
 # 测试数据库初始化
 if __name__ == "__main__":
@@ -0,0 +1,205 @@
+# exporter.py
+import argparse
+import csv
+import datetime
+import json
+import os
+import time
+
+from database import (get_connection, close_all_connections, create_tables, get_category_id,
+                      get_category_name, iter_history_schemas, print_progress)
+from instrumentation import timed
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow 格式为可选功能
+    pa = None
+
+EXPORT_FETCH_SIZE = 2000  # 每次 fetchmany 的行数，决定导出时的内存占用
+EXPORT_COLUMNS = ("id", "date", "type", "amount", "category", "description")
+# 文件扩展名 -> 导出格式
+EXPORT_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".arrow": "arrow", ".ipc": "arrow",
+                  ".feather": "arrow"}
+
+# 按 (date, id) 顺序读取，走 idx_transactions_date_id 索引，不需要临时排序；
+# 各归档库与主库（{schema}）依次读取，拼接后仍按日期排序
+EXPORT_SQL = '''SELECT id, date, type, amount, category_id, description FROM {schema}.transactions
+                 {where} ORDER BY date, id'''
+EXPORT_COUNT_SQL = "SELECT COUNT(*) FROM {schema}.transactions {where}"
+
+
+def _export_filters(conn, start=None, end=None, trans_type=None, category=None):
+    """ 过滤条件 -> (WHERE 子句, 参数)；日期区间为半开区间 [start, end) """
+    if trans_type not in (None, "income", "expense"):
+        raise ValueError(f"无效类型: {trans_type!r}")
+    conditions, params = [], []
+    if start:
+        conditions.append("date >= ?")
+        params.append(start)
+    if end:
+        conditions.append("date < ?")
+        params.append(end)
+    if trans_type:
+        conditions.append("type = ?")
+        params.append(trans_type)
+    if category:
+        # 不存在的分类得到 None，"category_id = NULL" 不匹配任何行
+        conditions.append("category_id = ?")
+        params.append(get_category_id(conn, category, create=False))
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    return where, params
+
+
+def iter_transactions(conn, start=None, end=None, trans_type=None, category=None,
+                      fetch_size=EXPORT_FETCH_SIZE):
+    """
+    按日期顺序分批读取交易记录的生成器
+    SQLite 游标本身逐行步进，fetchmany 每次只取出 fetch_size 行，内存占用与账本大小无关
+    日期区间涉及已归档的年份时，按年份依次读取对应的归档库，最后读主库
+    返回: 每批为 [(id, date, type, amount_cents, category, description), ...]
+    """
+    where, params = _export_filters(conn, start, end, trans_type, category)
+    for schema in iter_history_schemas(conn, start, end):
+        cur = conn.cursor()
+        cur.execute(EXPORT_SQL.format(schema=schema, where=where), params)
+        try:
+            while True:
+                rows = cur.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield [(row_id, date, t, amount, get_category_name(conn, category_id), description)
+                       for row_id, date, t, amount, category_id, description in rows]
+        finally:
+            cur.close()
+
+
+def count_transactions(conn, start=None, end=None, trans_type=None, category=None):
+    """ 符合过滤条件的行数（用于进度显示）"""
+    where, params = _export_filters(conn, start, end, trans_type, category)
+    return sum(conn.execute(EXPORT_COUNT_SQL.format(schema=schema, where=where), params).fetchone()[0]
+               for schema in iter_history_schemas(conn, start, end))
+
+
+def _write_csv(f, batches):
+    writer = csv.writer(f)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        writer.writerows((row_id, date, t, f"{amount / 100:.2f}", category, description)
+                         for row_id, date, t, amount, category, description in batch)
+        yield len(batch)
+
+
+def _write_jsonl(f, batches):
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    for batch in batches:
+        f.writelines(encode({"id": row_id, "date": date, "type": t, "amount": amount / 100,
+                             "category": category, "description": description}) + "\n"
+                     for row_id, date, t, amount, category, description in batch)
+        yield len(batch)
+
+
+def _arrow_schema():
+    return pa.schema([("id", pa.int64()), ("date", pa.date32()), ("type", pa.string()),
+                      ("amount", pa.float64()), ("category", pa.string()),
+                      ("description", pa.string())])
+
+
+def _write_arrow(f, batches):
+    schema = _arrow_schema()
+    with pa.ipc.new_file(f, schema) as writer:
+        for batch in batches:
+            ids, dates, types, amounts, categories, descriptions = zip(*batch)
+            writer.write_batch(pa.record_batch([
+                pa.array(ids, pa.int64()),
+                pa.array([datetime.date.fromisoformat(d) for d in dates], pa.date32()),
+                pa.array(types, pa.string()),
+                pa.array([a / 100 for a in amounts], pa.float64()),
+                pa.array(categories, pa.string()),
+                pa.array(descriptions, pa.string()),
+            ], schema=schema))
+            yield len(batch)
+
+
+@timed("export_transactions")
+def export_transactions(conn, path, fmt=None, start=None, end=None, trans_type=None,
+                        category=None, progress=None, fetch_size=EXPORT_FETCH_SIZE):
+    """
+    流式导出交易记录到 CSV / JSONL / Arrow IPC 文件，内存占用恒定
+    参数:
+        fmt: "csv" / "jsonl" / "arrow"，None 时按扩展名判断
+        start / end: 日期区间 [start, end)；trans_type: income / expense；category: 分类名
+        progress: progress(描述, 已完成, 总数)，提供时会先统计总行数
+    说明: 先写入临时文件，完成后再替换目标文件，失败不会留下半截文件
+    返回: {"path", "format", "rows", "elapsed_s", "rows_per_sec"}
+    """
+    fmt = fmt or EXPORT_FORMATS.get(os.path.splitext(path)[1].lower())
+    writers = {"csv": _write_csv, "jsonl": _write_jsonl, "arrow": _write_arrow}
+    if fmt not in writers:
+        raise ValueError(f"无法识别的导出格式: {fmt or path!r}（支持 csv / jsonl / arrow）")
+    if fmt == "arrow" and pa is None:
+        raise RuntimeError("导出 Arrow 格式需要安装 pyarrow")
+
+    started = time.perf_counter()
+    total = count_transactions(conn, start, end, trans_type, category) if progress else 0
+    if progress:
+        progress("导出交易记录", 0, total)
+
+    batches = iter_transactions(conn, start, end, trans_type, category, fetch_size)
+    temp_path = path + ".part"
+    done = 0
+    try:
+        if fmt == "arrow":
+            f = open(temp_path, "wb")
+        else:
+            f = open(temp_path, "w", encoding="utf-8", newline="")
+        with f:
+            for count in writers[fmt](f, batches):
+                done += count
+                if progress:
+                    progress("导出交易记录", done, max(total, done))
+        os.replace(temp_path, path)
+    except BaseException:
+        batches.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    elapsed = time.perf_counter() - started
+    return {
+        "path": path,
+        "format": fmt,
+        "rows": done,
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_sec": round(done / elapsed) if elapsed > 0 else 0,
+    }
+
+
+def main(argv=None):
+    """ 命令行入口: python exporter.py 输出文件 [--from 日期] [--to 日期] [--type] [--category] """
+    parser = argparse.ArgumentParser(description="导出交易记录（CSV / JSONL / Arrow IPC）")
+    parser.add_argument("path", help="输出文件，格式按扩展名判断（.csv / .jsonl / .arrow）")
+    parser.add_argument("--format", choices=("csv", "jsonl", "arrow"), help="指定导出格式")
+    parser.add_argument("--from", dest="start", help="起始日期（含），YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", help="结束日期（不含），YYYY-MM-DD")
+    parser.add_argument("--type", dest="trans_type", choices=("income", "expense"))
+    parser.add_argument("--category", help="分类名")
+    parser.add_argument("--quiet", action="store_true", help="不显示进度")
+    args = parser.parse_args(argv)
+
+    conn = get_connection()
+    try:
+        create_tables(conn)
+        result = export_transactions(conn, args.path, args.format, args.start, args.end,
+                                     args.trans_type, args.category,
+                                     progress=None if args.quiet else print_progress)
+    except (ValueError, RuntimeError, OSError) as e:
+        parser.exit(1, f"导出失败: {e}\n")
+    finally:
+        close_all_connections()
+    print(f"已导出 {result['rows']} 行到 {result['path']}，"
+          f"耗时 {result['elapsed_s']} 秒（{result['rows_per_sec']} 行/秒）")
+    return result
+
+
+if __name__ == "__main__":
+    main()
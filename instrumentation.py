@@ -0,0 +1,284 @@
+# instrumentation.py
+import functools
+import inspect
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# 延迟直方图的桶上界（毫秒），最后一个桶为 +Inf
+BUCKETS_MS = (0.1, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+SLOW_LOG_SIZE = 200  # 慢查询日志保留的条数
+
+# 运行时配置（用 configure 修改）
+_config = {
+    "enabled": True,
+    "sample_rate": 0.1,   # 逐条记录 SQL 的调用比例；最外层调用的计时始终开启
+    "slow_ms": 100.0,     # 调用或单条 SQL 超过该耗时记入慢查询日志
+}
+
+_calls = {}       # 函数名 -> _Histogram
+_queries = {}     # 归一化 SQL -> _Histogram
+_slow_log = deque(maxlen=SLOW_LOG_SIZE)
+_lock = threading.Lock()
+# depth: 当前线程是否处于被计时的调用中
+# trace: 当前线程被抽样的最外层调用收集到的 [(时刻, SQL), ...]
+_local = threading.local()
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+
+class _Histogram:
+    """ 固定桶的延迟直方图，附带行数与异常次数统计 """
+    __slots__ = ("counts", "count", "total_ms", "max_ms", "rows_returned", "rows_changed",
+                 "errors")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows_returned = 0
+        self.rows_changed = 0
+        self.errors = 0
+
+    def observe(self, ms, returned=0, changed=0, error=False):
+        index = 0
+        while index < len(BUCKETS_MS) and ms > BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.rows_returned += returned
+        self.rows_changed += changed
+        self.errors += error
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "rows_returned": self.rows_returned,
+            "rows_changed": self.rows_changed,
+            "errors": self.errors,
+            "buckets": dict(zip([str(b) for b in BUCKETS_MS] + ["+Inf"], self.counts)),
+        }
+
+
+def configure(enabled=None, sample_rate=None, slow_ms=None):
+    """ 修改运行时配置；未传入的项保持不变 """
+    if enabled is not None:
+        _config["enabled"] = enabled
+    if sample_rate is not None:
+        _config["sample_rate"] = min(max(sample_rate, 0.0), 1.0)
+    if slow_ms is not None:
+        _config["slow_ms"] = slow_ms
+    return dict(_config)
+
+
+def reset():
+    """ 清空所有统计 """
+    with _lock:
+        _calls.clear()
+        _queries.clear()
+        _slow_log.clear()
+
+
+# === 采集 ===
+def instrument_connection(conn):
+    """ 为连接安装 SQL 跟踪回调（没有被抽样的调用时回调立即返回）"""
+    conn.set_trace_callback(_trace)
+    return conn
+
+
+def _trace(statement):
+    trace = getattr(_local, "trace", None)
+    # "-- " 开头的是 FTS5 等内部语句，计入外层语句
+    if trace is not None and not statement.startswith("-- "):
+        trace.append((time.perf_counter(), statement))
+
+
+def timed(name):
+    """
+    计时装饰器：记录调用耗时、返回行数、写入行数（首个参数为连接时按 total_changes 计算）
+    抛出异常的调用同样计时，并计入异常次数
+    只有最外层调用计时并按 sample_rate 抽样逐条记录期间执行的 SQL；
+    嵌套的被计时调用直接执行，其耗时已包含在外层调用中，不重复统计
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _config["enabled"] or getattr(_local, "depth", 0):
+                return func(*args, **kwargs)
+
+            conn = _find_connection(args, kwargs)
+            changes = conn.total_changes if conn is not None else 0
+            sampled = random.random() < _config["sample_rate"]
+            if sampled:
+                _local.trace = []
+            _local.depth = 1
+            started = time.perf_counter()
+            return_value, error = None, True
+            try:
+                return_value = func(*args, **kwargs)
+                error = False
+                return return_value
+            finally:
+                finished = time.perf_counter()
+                _local.depth = 0
+                trace = None
+                if sampled:
+                    trace, _local.trace = _local.trace, None
+                _record_call(name, started, finished, return_value,
+                             conn.total_changes - changes if conn is not None else 0, trace, error)
+        return wrapper
+    return decorator
+
+
+def _find_connection(args, kwargs):
+    conn = kwargs.get("conn")
+    if conn is None:
+        for arg in args[:2]:
+            if isinstance(arg, sqlite3.Connection):
+                return arg
+    return conn if isinstance(conn, sqlite3.Connection) else None
+
+
+def _rows_returned(value):
+    if isinstance(value, (list, tuple)):
+        return len(value)
+    if isinstance(value, dict) and isinstance(value.get("inserted"), int):
+        return value["inserted"]
+    return 0
+
+
+def _record_call(name, started, finished, value, changed, trace, error=False):
+    ms = (finished - started) * 1000
+    statements = _split_statements(trace, finished) if trace else []
+    slow_ms = _config["slow_ms"]
+    with _lock:
+        _calls.setdefault(name, _Histogram()).observe(ms, _rows_returned(value), changed, error)
+        for statement_ms, sql in statements:
+            _queries.setdefault(normalize_sql(sql), _Histogram()).observe(statement_ms)
+        if ms > slow_ms:
+            _slow_log.append({
+                "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "function": name,
+                "ms": round(ms, 3),
+                "thread": threading.current_thread().name,
+                "error": error,
+                # 未被抽样的调用没有逐条 SQL
+                "statements": [{"ms": round(s_ms, 3), "sql": _SPACES.sub(" ", sql).strip()}
+                               for s_ms, sql in statements if s_ms > slow_ms / 10],
+            })
+
+
+def _split_statements(trace, finished):
+    """
+    跟踪回调只在语句开始时触发，单条语句的耗时取到下一条语句开始（或调用结束）为止，
+    包含取结果的时间；触发器内的子程序会以相同语句文本重复回调，合并计算
+    """
+    merged = []
+    for at, sql in trace:
+        if not merged or merged[-1][1] != sql:
+            merged.append((at, sql))
+    ends = [at for at, _ in merged[1:]] + [finished]
+    return [((end - at) * 1000, sql) for (at, sql), end in zip(merged, ends)]
+
+
+def normalize_sql(sql):
+    """ 参数值替换为 ?、空白压缩，作为直方图的键 """
+    return _SPACES.sub(" ", _LITERALS.sub("?", sql)).strip()[:300]
+
+
+def instrument_functions(namespace, module_name):
+    """
+    为模块中所有以连接为参数的公开函数加上计时（替换模块全局名，模块内部调用同样被计时）
+    纯计算的小工具函数（如金额换算）不带连接参数，不做包装以免逐行调用的开销
+    """
+    for attr, value in list(namespace.items()):
+        if attr.startswith("_") or not inspect.isfunction(value) \
+                or value.__module__ != module_name or attr == "main":
+            continue
+        if "conn" in inspect.signature(value).parameters:
+            namespace[attr] = timed(attr)(value)
+
+
+def instrument_methods(cls, exclude=()):
+    """
+    为类的公开方法加上计时（在类定义之后、实例化之前调用，界面回调绑定的即为包装后的方法）
+    exclude: 不计时的方法名，如会弹出模态对话框等待用户操作的方法（用户阅读对话框的时间不是耗时）
+    """
+    for attr, value in list(vars(cls).items()):
+        if not attr.startswith("_") and attr not in exclude and inspect.isfunction(value):
+            setattr(cls, attr, timed(f"{cls.__name__}.{attr}")(value))
+    return cls
+
+
+# === 导出 ===
+def snapshot():
+    """ 当前统计的字典形式 """
+    with _lock:
+        return {
+            "config": dict(_config),
+            "calls": {name: hist.as_dict() for name, hist in sorted(_calls.items())},
+            "queries": {sql: hist.as_dict() for sql, hist in
+                        sorted(_queries.items(), key=lambda item: -item[1].total_ms)},
+            "slow_log": list(_slow_log),
+        }
+
+
+def export_json(path=None):
+    """ 导出为 JSON 文本；提供 path 时同时写入文件 """
+    text = json.dumps(snapshot(), ensure_ascii=False, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    return text
+
+
+def export_prometheus(path=None):
+    """ 导出为 Prometheus 文本格式（耗时单位为秒）"""
+    lines = []
+
+    def histogram(metric, label, items):
+        lines.append(f"# TYPE {metric} histogram")
+        for key, hist in items:
+            key = key.replace("\\", "\\\\").replace('"', '\\"')
+            cumulative = 0
+            for bound, count in zip(list(BUCKETS_MS) + [None], hist.counts):
+                cumulative += count
+                le = "+Inf" if bound is None else repr(bound / 1000)
+                lines.append(f'{metric}_bucket{{{label}="{key}",le="{le}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{{label}="{key}"}} {hist.total_ms / 1000:.6f}')
+            lines.append(f'{metric}_count{{{label}="{key}"}} {hist.count}')
+
+    with _lock:
+        calls = sorted(_calls.items())
+        queries = sorted(_queries.items())
+        slow = len(_slow_log)
+    histogram("finance_call_duration_seconds", "function", calls)
+    histogram("finance_query_duration_seconds", "query", queries)
+    lines.append("# TYPE finance_call_rows_total counter")
+    for name, hist in calls:
+        lines.append(f'finance_call_rows_total{{function="{name}",kind="returned"}} '
+                     f'{hist.rows_returned}')
+        lines.append(f'finance_call_rows_total{{function="{name}",kind="changed"}} '
+                     f'{hist.rows_changed}')
+    lines.append("# TYPE finance_call_errors_total counter")
+    for name, hist in calls:
+        lines.append(f'finance_call_errors_total{{function="{name}"}} {hist.errors}')
+    lines.append("# TYPE finance_slow_log_entries gauge")
+    lines.append(f"finance_slow_log_entries {slow}")
+
+    text = "\n".join(lines) + "\n"
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    return text
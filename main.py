@@ -1,14 +1,183 @@
 # main.py
 import sqlite3
-from database import create_connection
+from database import (get_connection, close_all_connections, create_tables,
+                      explain_query_plan,
+                      get_category_id, get_category_name, clear_category_cache,
+                      segment_text, seed_budget_spend, archived_through, attach_archives,
+                      iter_history_schemas,
+                      BUDGET_CHECK_SQL, BUDGET_PERIODS, RULE_COLUMNS)
+from recurrence import (default_schedule, due_occurrences, next_occurrence, validate_rule,
+                        RULE_FREQS)
 import datetime
+import threading
+from query_cache import cached_query, note_write, flush_writes, TRANSACTION_TABLES
+from instrumentation import instrument_functions
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from itertools import islice
+
+BATCH_CHUNK_SIZE = 5000  # 批量导入时每次 executemany 的行数
+MAX_CENTS = 2 ** 63 - 1  # SQLite INTEGER（64 位有符号）能保存的最大金额（分）
+
+# 热点查询统一使用半开日期区间 [start, end)，保证能命中 (type, date) 等索引
+SUM_BY_TYPE_SQL = '''SELECT SUM(amount) FROM transactions
+                      WHERE type = ? AND date >= ? AND date < ?'''
+# 月度汇总直接读 monthly_totals（由触发器维护），按主键前缀查找
+MONTH_TOTALS_SQL = '''SELECT type, SUM(total) FROM monthly_totals
+                       WHERE month = ? GROUP BY type'''
+MONTH_TYPE_TOTAL_SQL = '''SELECT SUM(total) FROM monthly_totals
+                           WHERE month = ? AND type = ?'''
+# 当前薪资设置 / 全部分类的月度预算（均为单行查找，结果经 query_cache 缓存）
+ACTIVE_SALARY_SQL = '''SELECT day, amount FROM recurring_rules
+                        WHERE kind = 'salary' AND next_due IS NOT NULL
+                        ORDER BY id DESC LIMIT 1'''
+MONTHLY_BUDGET_SQL = "SELECT id, amount FROM budgets WHERE category_id = 0 AND period = 'month'"
+# 预算进度：每个预算按当前周期键（依次为周、年、月的键）查找累计支出
+CURRENT_PERIOD_KEY = "CASE b.period WHEN 'week' THEN ? WHEN 'year' THEN ? ELSE ? END"
+BUDGET_SPENT_SQL = "SELECT spent FROM budget_spend WHERE budget_id = ? AND period_key = ?"
+# 取走某预算本周期尚未送达的超支提醒（阈值 >= 100%），影响行数为 0 表示已经提醒过
+TAKE_OVER_ALERT_SQL = '''UPDATE budget_alerts SET notified = 1
+                          WHERE budget_id = ? AND period_key = ? AND threshold >= 100
+                            AND notified = 0'''
+BUDGETS_SQL = f'''SELECT b.id, b.category_id, b.period, b.amount, {CURRENT_PERIOD_KEY},
+                       COALESCE(s.spent, 0)
+                FROM budgets b
+                LEFT JOIN budget_spend s
+                  ON s.budget_id = b.id AND s.period_key = {CURRENT_PERIOD_KEY}
+                ORDER BY b.category_id, b.period'''
+# 当前周期中尚未送达界面的提醒
+PENDING_ALERTS_SQL = f'''SELECT a.budget_id, c.name, b.period, a.period_key, a.threshold,
+                              a.spent, b.amount
+                       FROM budget_alerts a JOIN budgets b ON b.id = a.budget_id
+                       LEFT JOIN categories c ON c.id = b.category_id
+                       WHERE a.notified = 0 AND a.period_key = {CURRENT_PERIOD_KEY}
+                       ORDER BY a.raised_at'''
+# 交易列表键集分页：按 (date, id) 倒序，不使用 OFFSET
+PAGE_SIZE = 100
+# 依次在主库和各归档库（{schema}）中查找，一页不满时才读下一个库
+PAGE_FIRST_SQL = '''SELECT id, date, type, amount, category_id FROM {schema}.transactions
+                     ORDER BY date DESC, id DESC LIMIT ?'''
+PAGE_AFTER_SQL = '''SELECT id, date, type, amount, category_id FROM {schema}.transactions
+                     WHERE (date, id) < (?, ?)
+                     ORDER BY date DESC, id DESC LIMIT ?'''
+PAGE_BEFORE_SQL = '''SELECT id, date, type, amount, category_id FROM {schema}.transactions
+                      WHERE (date, id) > (?, ?)
+                      ORDER BY date ASC, id ASC LIMIT ?'''
+# 全文搜索：先按 rowid 倒序（约等于录入顺序新→旧）取一个有上限的候选窗口，
+# 再在窗口内按相关度排序，常见词命中上百万行时耗时也有上界
+SEARCH_LIMIT = 100
+SEARCH_WINDOW = 2000
+SEARCH_SQL = '''SELECT id, date, type, amount, category_id, description FROM (
+                    SELECT t.id, t.date, t.type, t.amount, t.category_id, t.description,
+                           bm25(transactions_fts, 2.0, 1.0) AS score
+                    FROM transactions_fts JOIN transactions t ON t.id = transactions_fts.rowid
+                    WHERE transactions_fts MATCH ? {filters}
+                    ORDER BY transactions_fts.rowid DESC LIMIT ?)
+                ORDER BY score, date DESC, id DESC LIMIT ?'''
+# 时点余额 / 余额序列：daily_balances 主键查找与范围扫描（表由触发器维护）
+BALANCE_AT_SQL = '''SELECT balance FROM daily_balances WHERE date <= ?
+                     ORDER BY date DESC LIMIT 1'''
+BALANCE_BEFORE_SQL = '''SELECT balance FROM daily_balances WHERE date < ?
+                         ORDER BY date DESC LIMIT 1'''
+BALANCE_RANGE_SQL = '''SELECT date, balance FROM daily_balances
+                        WHERE date >= ? AND date < ? ORDER BY date'''
+# 周期规则的到期队列：next_due 部分索引上的范围查找，只读取已到期的规则
+RULE_SELECT = ", ".join(RULE_COLUMNS)
+DUE_RULES_SQL = f"SELECT {RULE_SELECT} FROM recurring_rules WHERE next_due <= ? {{kinds}}"
+# 按日去重的补录：区间内可能发生的规则（不论 next_due）
+BACKFILL_RULES_SQL = f'''SELECT {RULE_SELECT} FROM recurring_rules
+                          WHERE skip_existing = 1 AND start_date <= ?
+                            AND (end_date IS NULL OR end_date >= ?) {{kinds}}'''
+# 生成一次发生；skip_existing 的规则在当天已有同类型同分类记录时跳过（同批先写入的也算）
+OCCURRENCE_INSERT_SQL = '''INSERT INTO transactions(date, type, amount, category_id, description)
+                            SELECT :date, :type, :amount, :category_id, :description
+                            WHERE NOT :skip_existing OR NOT EXISTS (
+                                SELECT 1 FROM transactions
+                                WHERE date = :date AND type = :type
+                                  AND category_id = :category_id)'''
+
+
+def to_cents(amount):
+    """
+    金额（元，数字或字符串）转换为整数分，四舍五入到分
+    数据库中所有金额均以分存储，main.py 的函数在边界处统一转换
+    """
+    try:
+        value = Decimal(str(amount).strip())
+        if not value.is_finite():
+            raise ValueError
+        # 超出 Decimal 精度（如 1e30）时 quantize 抛出 InvalidOperation
+        cents = int((value * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"无效金额: {amount!r}")
+    if abs(cents) > MAX_CENTS:
+        raise ValueError(f"金额超出范围: {amount!r}")
+    return cents
+
+def from_cents(cents):
+    """ 整数分转换为金额（元）"""
+    return cents / 100 if cents is not None else None
+
+def month_range(month):
+    """
+    将月份转换为半开日期区间
+    参数:
+        month: 'YYYY-MM' 字符串
+    返回: ('YYYY-MM-01', 下月 'YYYY-MM-01')
+    """
+    year, mon = int(month[:4]), int(month[5:7])
+    start = datetime.date(year, mon, 1)
+    end = datetime.date(year + mon // 12, mon % 12 + 1, 1)
+    return start.isoformat(), end.isoformat()
+
+
+def _validate_transaction(data):
+    """
+    校验单条记录字典并返回可直接写库的元组
+    参数:
+        data: 包含 date/type/amount（必填）及 category/description（可选）的字典
+    返回: (date, type, amount, category, description)，其中 amount 已转换为整数分
+    异常: ValueError，说明具体的失败原因
+    """
+    try:
+        date = data['date']
+        trans_type = data['type']
+        amount = data['amount']
+    except (KeyError, TypeError):
+        raise ValueError("数据缺失必要字段")
+
+    try:
+        if len(date) != 10:
+            raise ValueError
+        datetime.date.fromisoformat(date)
+    except (TypeError, ValueError):
+        raise ValueError("日期格式必须为 YYYY-MM-DD")
+
+    if trans_type not in ('income', 'expense'):
+        raise ValueError("类型必须为 income 或 expense")
+
+    try:
+        amount = to_cents(amount)
+    except ValueError:
+        raise ValueError("金额必须为有效数字")
+    if amount <= 0:
+        raise ValueError("金额必须大于0")
+
+    category = data.get('category') or '未分类'
+    description = data.get('description') or ''
+    return date, trans_type, amount, category, description
+
+
+def _check_open_date(date, closed_through):
+    """ 已归档年份（closed_through 及之前）的日期只读，写入前先拒绝，触发器只作兜底 """
+    if closed_through and date[:4] <= closed_through:
+        raise ValueError(f"{date[:4]} 年已归档，不能再写入")
 
 
 def add_transaction(conn=None, auto=False, auto_data=None):
     """
     完整版添加记录函数（支持线程安全）
     参数:
-        conn: 可选，数据库连接对象（未提供时自动创建）
+        conn: 可选，数据库连接对象（未提供时使用当前线程的复用连接并自动提交）
         auto: 是否为自动模式
         auto_data: 自动模式数据字典
     返回: bool (是否成功)
@@ -17,7 +186,7 @@ def add_transaction(conn=None, auto=False, auto_data=None):
     try:
         # 处理数据库连接
         if not conn:
-            local_conn = create_connection()
+            local_conn = get_connection()
             conn = local_conn
 
         # === 数据验证 ===
@@ -39,7 +208,7 @@ def add_transaction(conn=None, auto=False, auto_data=None):
 
             amount_input = input("金额: ").strip()
             try:
-                amount = float(amount_input)
+                amount = to_cents(amount_input)
                 if amount <= 0:
                     print("错误：金额必须大于0")
                     return False
@@ -51,49 +220,118 @@ def add_transaction(conn=None, auto=False, auto_data=None):
             description = input("备注 (可选): ").strip()
         else:
             # 自动模式验证
-            required_keys = ['date', 'type', 'amount']
-            if not all(k in auto_data for k in required_keys):
-                raise ValueError("自动模式数据缺失必要字段")
-
-            date = auto_data['date']
-            trans_type = auto_data['type']
-            amount = auto_data['amount']
-            category = auto_data.get('category', '未分类')
-            description = auto_data.get('description', '')
-
-            # 验证自动数据
             try:
-                datetime.datetime.strptime(date, "%Y-%m-%d")
-                if trans_type not in ('income', 'expense'):
-                    raise ValueError
-                if float(amount) <= 0:
-                    raise ValueError
-            except:
-                raise ValueError("自动数据验证失败")
+                date, trans_type, amount, category, description = _validate_transaction(auto_data)
+                _check_open_date(date, archived_through(conn))
+            except ValueError as e:
+                raise ValueError(f"自动数据验证失败: {e}")
 
         # === 数据库操作 ===
-        sql = '''INSERT INTO transactions(date, type, amount, category, description)
+        sql = '''INSERT INTO transactions(date, type, amount, category_id, description)
                  VALUES(?,?,?,?,?)'''
         cur = conn.cursor()
-        cur.execute(sql, (date, trans_type, amount, category, description))
+        cur.execute(sql, (date, trans_type, amount, get_category_id(conn, category), description))
+        note_write(*TRANSACTION_TABLES)
 
         # 提交事务（如果是独立连接）
         if local_conn:
             conn.commit()
+            flush_writes()
 
         return True
 
     except sqlite3.Error as e:
         if local_conn:
             conn.rollback()
+            clear_category_cache()
+            flush_writes()
         raise Exception(f"数据库错误: {str(e)}")
     except Exception as e:
         if local_conn:
             conn.rollback()
+            clear_category_cache()
+            flush_writes()
         raise e
-    finally:
+
+def add_transactions_batch(rows, conn=None, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    批量添加记录（导入银行流水等场景）
+    参数:
+        rows: 可迭代的记录字典，字段同 add_transaction 的 auto_data
+        conn: 可选，数据库连接对象（未提供时使用当前线程的复用连接并自动提交）
+        chunk_size: 每次 executemany 写入的行数
+    返回:
+        {
+            "inserted": int,    # 成功写入的行数
+            "rejected": list    # [(行号, 原始数据, 失败原因), ...]
+        }
+    说明: 校验失败的行会被跳过并记录原因，不会中断整批导入；
+          所有合法行在同一个事务内分块写入。
+    """
+    result = {"inserted": 0, "rejected": []}
+    rejected = result["rejected"]
+
+    def valid_rows():
+        closed_through = archived_through(conn)
+        for idx, data in enumerate(rows):
+            try:
+                date, trans_type, amount, category, description = _validate_transaction(data)
+                _check_open_date(date, closed_through)
+            except ValueError as e:
+                rejected.append((idx, data, str(e)))
+                continue
+            yield date, trans_type, amount, get_category_id(conn, category), description
+
+    local_conn = None
+    try:
+        if not conn:
+            local_conn = get_connection()
+            conn = local_conn
+
+        sql = '''INSERT INTO transactions(date, type, amount, category_id, description)
+                 VALUES(?,?,?,?,?)'''
+        cur = conn.cursor()
+        pending = valid_rows()
+        while True:
+            chunk = list(islice(pending, chunk_size))
+            if not chunk:
+                break
+            cur.executemany(sql, chunk)
+            result["inserted"] += len(chunk)
+            note_write(*TRANSACTION_TABLES)
+
         if local_conn:
-            local_conn.close()
+            conn.commit()
+            flush_writes()
+
+        return result
+
+    except sqlite3.Error as e:
+        if local_conn:
+            conn.rollback()
+            clear_category_cache()
+            flush_writes()
+        raise Exception(f"数据库错误: {str(e)}")
+    except Exception:
+        # 复用连接上不能留下写了一半的事务，否则下一次提交会把它一并保存
+        if local_conn:
+            conn.rollback()
+            clear_category_cache()
+            flush_writes()
+        raise
+
+def delete_transaction(conn, record_id, commit=True):
+    """
+    删除一条记录（汇总表由触发器同步扣减）
+    返回: bool (是否删除了记录；已归档年份的记录只读，返回 False)
+    """
+    cur = conn.cursor()
+    cur.execute("DELETE FROM transactions WHERE id = ?", (record_id,))
+    note_write(*TRANSACTION_TABLES)
+    if commit:
+        conn.commit()
+        flush_writes()
+    return cur.rowcount > 0
 
 # def show_summary(conn):
 #     """ 显示本月汇总 """
@@ -119,224 +357,530 @@ def show_summary(conn, gui_mode=False):
         "balance": 0.0
     }
 
+    # 本月总收入/总支出（汇总表查找，整数分求和后再换算为元）
+    totals = {"income": 0, "expense": 0}
+    for trans_type, total in cached_query(conn, MONTH_TOTALS_SQL, (summary["month"],),
+                                          ("monthly_totals",)):
+        totals[trans_type] = total or 0
+
+    summary["income"] = from_cents(totals["income"])
+    summary["expense"] = from_cents(totals["expense"])
+    summary["balance"] = from_cents(totals["income"] - totals["expense"])
+
+    return summary if gui_mode else print_summary(summary)  # 命令行模式保持原样
+
+def print_summary(summary):
+    """ 命令行模式打印本月汇总 """
+    print(f"\n--- 本月汇总 ({summary['month']}) ---")
+    print(f"总收入: {summary['income']:.2f} 元")
+    print(f"总支出: {summary['expense']:.2f} 元")
+    print(f"当前结余: {summary['balance']:.2f} 元")
+    return summary
+
+SUMMARY_DIMENSIONS = ("month", "category", "type")
+
+def _first_of_next_month(date):
+    """ 'YYYY-MM-DD' 所在月份的下月1日；本身是1日时原样返回 """
+    return date if date[8:] == '01' else month_range(date[:7])[1]
+
+def summarize(conn, start=None, end=None, group_by=()):
+    """
+    任意日期区间、任意维度组合的收支统计（一次查询完成）
+    参数:
+        start: 起始日期 'YYYY-MM-DD'（含），None 表示不限
+        end: 结束日期 'YYYY-MM-DD'（不含），None 表示不限
+        group_by: 维度列表，可选 month / category / type，为空时只返回一行总计
+    返回: [{维度...: 值, "income": 元, "expense": 元, "balance": 元, "count": 笔数}, ...]
+    说明: 区间中的整月直接读 monthly_totals，首尾不足一个月的零头按日期区间读交易表，
+          两部分在同一条 SQL 中 UNION ALL 后统一 GROUP BY
+    """
+    for dim in group_by:
+        if dim not in SUMMARY_DIMENSIONS:
+            raise ValueError(f"不支持的分组维度: {dim}（可选: {', '.join(SUMMARY_DIMENSIONS)}）")
+
+    # 拆分为：整月部分 [full_start, full_end) + 首尾零头
+    full_start = _first_of_next_month(start) if start else None
+    full_end = end[:8] + '01' if end else None
+    raw_ranges = []
+    if full_start and full_end and full_start >= full_end:
+        raw_ranges.append((start, end))  # 区间不含完整月份
+        full_start = full_end = False
+    else:
+        if start and start != full_start:
+            raw_ranges.append((start, full_start))
+        if end and end != full_end:
+            raw_ranges.append((full_end, end))
+
+    sources, params = [], []
+    if full_start is not False:
+        where = []
+        if full_start:
+            where.append("month >= ?")
+            params.append(full_start[:7])
+        if full_end:
+            where.append("month < ?")
+            params.append(full_end[:7])
+        sources.append(f'''SELECT month, category_id AS category, type, total AS amount, count AS n
+                            FROM monthly_totals {"WHERE " + " AND ".join(where) if where else ""}''')
+    # 零头落在已归档的年份时按需打开对应的归档库，经合并视图读取
+    if raw_ranges:
+        attach_archives(conn, raw_ranges)
+    for range_start, range_end in raw_ranges:
+        sources.append('''SELECT substr(date, 1, 7) AS month, category_id AS category,
+                                 type, amount, 1 AS n
+                          FROM all_transactions WHERE date >= ? AND date < ?''')
+        params.extend([range_start, range_end])
+
+    dims = ", ".join(group_by)
+    sql = f'''SELECT {dims + "," if dims else ""}
+                   SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END),
+                   SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END),
+                   SUM(n)
+              FROM ({" UNION ALL ".join(sources)})
+              {"GROUP BY " + dims if dims else ""}'''
+
     cur = conn.cursor()
-    # 本月总收入
-    cur.execute("SELECT SUM(amount) FROM transactions WHERE type='income' AND strftime('%Y-%m', date) = ?",
-                (summary["month"],))
-    summary["income"] = cur.fetchone()[0] or 0.0
+    cur.execute(sql, params)
+    results = []
+    for row in cur.fetchall():
+        income, expense, count = (value or 0 for value in row[len(group_by):])
+        if not count:
+            continue
+        item = dict(zip(group_by, row[:len(group_by)]))
+        if "category" in item:
+            item["category"] = get_category_name(conn, item["category"])
+        item.update({
+            "income": from_cents(income),
+            "expense": from_cents(expense),
+            "balance": from_cents(income - expense),
+            "count": count,
+        })
+        results.append(item)
+    # 分类按名称排序，需在 id 转换为名称之后进行
+    results.sort(key=lambda item: tuple(item[dim] for dim in group_by))
+    return results
+
+def balance_at(conn, date=None):
+    """
+    截至某天末的余额（元，所有收入减所有支出），date 默认为今天
+    一次主键查找：取该日期及之前最近一个有交易的日期的累计余额
+    """
+    date = date or datetime.date.today().isoformat()
+    rows = cached_query(conn, BALANCE_AT_SQL, (date,), ("daily_balances",))
+    return from_cents(rows[0][0] if rows else 0)
 
-    # 本月总支出
-    cur.execute("SELECT SUM(amount) FROM transactions WHERE type='expense' AND strftime('%Y-%m', date) = ?",
-                (summary["month"],))
-    summary["expense"] = cur.fetchone()[0] or 0.0
+def balance_series(conn, start, end, fill=True):
+    """
+    日期区间 [start, end) 内每天末的余额，用于余额走势图
+    参数:
+        fill: True 时逐日返回（没有交易的日期沿用前一天的余额），False 时只返回有交易的日期
+    返回: [(date, 余额元), ...]，按日期升序
+    说明: 一次主键查找得到期初余额，一次范围扫描得到区间内各天的余额
+    """
+    cur = conn.cursor()
+    cur.execute(BALANCE_BEFORE_SQL, (start,))
+    row = cur.fetchone()
+    balance = row[0] if row else 0
+    cur.execute(BALANCE_RANGE_SQL, (start, end))
+    rows = cur.fetchall()
+    if not fill:
+        return [(date, from_cents(value)) for date, value in rows]
+
+    series = []
+    changes = iter(rows)
+    change = next(changes, None)
+    day = datetime.date.fromisoformat(start)
+    last = datetime.date.fromisoformat(end)
+    while day < last:
+        date = day.isoformat()
+        if change and change[0] == date:
+            balance = change[1]
+            change = next(changes, None)
+        series.append((date, from_cents(balance)))
+        day += datetime.timedelta(days=1)
+    return series
+
+def get_transactions_page(conn, after=None, before=None, limit=PAGE_SIZE):
+    """
+    按 (date, id) 键集分页读取交易记录（新→旧）
+    参数:
+        after: (date, id)，返回比该键更旧的一页（向下翻页）
+        before: (date, id)，返回比该键更新的一页（向上翻页）
+        均未提供时返回最新一页
+    返回: [(id, date, type, amount, category), ...]，始终按新→旧排列，金额单位为元
+    说明: 主库的记录都晚于归档库，翻过主库最早的记录后才按年份依次打开归档库
+    """
+    cur = conn.cursor()
+    reverse = False
+    if after:
+        date, row_id = after
+        sql, params = PAGE_AFTER_SQL, (date, row_id)
+        next_day = datetime.date.fromisoformat(date) + datetime.timedelta(days=1)
+        schemas = iter_history_schemas(conn, end=next_day.isoformat(), reverse=True)
+    elif before:
+        date, row_id = before
+        sql, params = PAGE_BEFORE_SQL, (date, row_id)
+        schemas = iter_history_schemas(conn, start=date)
+        reverse = True
+    else:
+        sql, params = PAGE_FIRST_SQL, ()
+        schemas = iter_history_schemas(conn, reverse=True)
+    page = []
+    for schema in schemas:
+        cur.execute(sql.format(schema=schema), (*params, limit - len(page)))
+        page.extend(cur.fetchall())
+        if len(page) >= limit:
+            break
+    rows = [(row_id, date, trans_type, from_cents(amount), get_category_name(conn, category_id))
+            for row_id, date, trans_type, amount, category_id in page]
+    return rows[::-1] if reverse else rows
 
-    summary["balance"] = summary["income"] - summary["expense"]
+def _search_expression(query):
+    """
+    用户输入 -> FTS5 查询表达式（各词之间为 AND）
+    每个词按索引相同的规则分词后作为短语匹配；以非中文结尾的词做前缀匹配，
+    例如 "牙医 den" -> '"牙 医" "den"*'
+    """
+    terms = []
+    for word in query.split():
+        phrase = " ".join(segment_text(word).split()).replace('"', '""')
+        if not phrase.strip('"'):
+            continue
+        terms.append(f'"{phrase}"' + ("" if segment_text(word[-1]).startswith(" ") else "*"))
+    return " ".join(terms)
+
+def search_transactions(conn, query, start=None, end=None, min_amount=None, max_amount=None,
+                        limit=SEARCH_LIMIT):
+    """
+    按备注和分类全文搜索交易记录
+    参数:
+        query: 搜索词，空格分隔的多个词需同时命中；中文支持任意子串，英文支持前缀
+        start / end: 日期区间 [start, end)，None 表示不限
+        min_amount / max_amount: 金额范围（元，含边界），None 表示不限
+    返回: [(id, date, type, amount, category, description), ...]，按相关度排序，金额单位为元
+    说明: 只搜索主库，已归档年份的记录不在全文索引中
+    """
+    expression = _search_expression(query)
+    if not expression:
+        return []
+
+    filters, params = [], [expression]
+    for condition, value in (("t.date >= ?", start), ("t.date < ?", end),
+                             ("t.amount >= ?", min_amount), ("t.amount <= ?", max_amount)):
+        if value is not None:
+            filters.append(condition)
+            params.append(to_cents(value) if "amount" in condition else value)
+    params.extend([SEARCH_WINDOW, limit])
 
-    return summary if gui_mode else print_summary(summary)  # 命令行模式保持原样
+    cur = conn.cursor()
+    cur.execute(SEARCH_SQL.format(filters="".join(" AND " + f for f in filters)), params)
+    return [(row_id, date, trans_type, from_cents(amount), get_category_name(conn, category_id),
+             description)
+            for row_id, date, trans_type, amount, category_id, description in cur.fetchall()]
 
-def set_salary(conn, payday, amount):
-    """ 供GUI调用的设置薪资函数 """
+def set_salary(conn, payday, amount, commit=True):
+    """
+    供GUI调用的设置薪资函数：结束当前的薪资规则，从今天起按新的发薪日和金额每月发放
+    本月已发过工资时新规则从下月开始，保证每月只发一次
+    commit=False 时由调用方（如写线程的批量提交）负责提交，失败时抛出异常由调用方回滚
+    返回: bool (commit=True 时失败返回 False)
+    """
     try:
-        cur = conn.cursor()
-        # 停用旧设置
-        cur.execute("UPDATE salary_settings SET is_active = 0 WHERE is_active = 1")
-        # 插入新记录
-        cur.execute('''INSERT INTO salary_settings(payday, amount, start_date, is_active)
-                     VALUES(?,?,?,1)''',
-                   (payday, amount, datetime.date.today().isoformat()))
-        conn.commit()
+        today = datetime.date.today()
+        yesterday = (today - datetime.timedelta(days=1)).isoformat()
+        conn.execute('''UPDATE recurring_rules
+                        SET end_date = ?, next_due = CASE WHEN next_due <= ? THEN next_due END
+                        WHERE kind = 'salary' AND next_due IS NOT NULL''', (yesterday, yesterday))
+        note_write("recurring_rules")
+        salary_category = get_category_id(conn, '薪资', create=False)
+        paid = salary_category is not None and conn.execute(
+            "SELECT 1 FROM monthly_totals WHERE month = ? AND type = 'income' AND category_id = ?",
+            (today.strftime('%Y-%m'), salary_category)).fetchone()
+        start = today
+        if paid:
+            start = (today.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+        add_recurring_rule(conn, 'income', amount, '薪资', 'monthly', start.isoformat(),
+                           day=payday, description='月度工资', kind='salary', commit=False)
+        if commit:
+            conn.commit()
+            flush_writes()
         return True
-    except sqlite3.Error as e:
+    except (sqlite3.Error, ValueError) as e:
+        if not commit:
+            # 不拥有事务：交给调用方回滚，不能只提交“结束旧规则”而没有新规则
+            raise
+        conn.rollback()
+        clear_category_cache()
+        flush_writes()
         print(f"设置薪资失败: {e}")
         return False
 
-def show_history(conn):
-    """ 查看历史记录 """
+def get_active_salary(conn):
+    """ 当前生效的薪资设置，返回 (发薪日, 月薪元) 或 None """
+    rows = cached_query(conn, ACTIVE_SALARY_SQL, (), ("recurring_rules",))
+    return (rows[0][0], from_cents(rows[0][1])) if rows else None
+
+def show_history(conn, limit=10):
+    """ 查看最近 limit 条历史记录（新→旧）"""
     print("\n--- 历史记录 ---")
-    cur = conn.cursor()
-    cur.execute("SELECT date, type, amount, category FROM transactions ORDER BY date DESC LIMIT 10")
-    records = cur.fetchall()
+    records = get_transactions_page(conn, limit=limit)
 
     if not records:
         print("暂无记录")
         return
 
-    for idx, (date, trans_type, amount, category) in enumerate(records, 1):
+    for idx, (_, date, trans_type, amount, category) in enumerate(records, 1):
         print(f"{idx}. [{date}] {trans_type.upper()} - ¥{amount:.2f} ({category})")
 
-# def manage_salary(conn):
-#     """ 薪资管理主菜单 """
-#     while True:
-#         print("\n=== 薪资管理 ===")
-#         print("1. 设置/修改发薪日")
-#         print("2. 调整本月薪资")
-#         print("3. 查看历史薪资设置")
-#         print("4. 返回主菜单")
-#         choice = input("请选择操作: ")
-#
-#         if choice == '1':
-#             set_payday(conn)
-#         elif choice == '2':
-#             adjust_current_salary(conn)
-#         elif choice == '3':
-#             show_salary_history(conn)
-#         elif choice == '4':
-#             break
-#         else:
-#             print("无效输入！")
+def manage_salary(conn):
+    """ 薪资管理主菜单 """
+    while True:
+        print("\n=== 薪资管理 ===")
+        print("1. 设置/修改发薪日")
+        print("2. 调整本月薪资")
+        print("3. 查看历史薪资设置")
+        print("4. 返回主菜单")
+        choice = input("请选择操作: ")
+
+        if choice == '1':
+            set_payday(conn)
+        elif choice == '2':
+            adjust_current_salary(conn)
+        elif choice == '3':
+            show_salary_history(conn)
+        elif choice == '4':
+            break
+        else:
+            print("无效输入！")
 
 def set_payday(conn):
     """ 设置发薪日逻辑 """
     print("\n--- 设置发薪日 ---")
 
     # 获取当前设置
-    cur = conn.cursor()
-    cur.execute("SELECT payday, amount FROM salary_settings WHERE is_active = 1")
-    current_setting = cur.fetchone()
-
+    current_setting = get_active_salary(conn)
     if current_setting:
         print(f"当前生效设置: 每月 {current_setting[0]} 号发薪，金额 {current_setting[1]} 元")
 
     # 获取新输入
     try:
         new_payday = int(input("请输入新的发薪日（1-31）: "))
-        new_amount = float(input("请输入新的月薪金额: "))
-        if not 1 <= new_payday <= 31:
+        new_amount = to_cents(input("请输入新的月薪金额: "))
+        if not 1 <= new_payday <= 31 or new_amount <= 0:
             raise ValueError
     except ValueError:
         print("输入无效！必须满足：\n- 发薪日为 1-31 的整数\n- 金额为有效数字")
         return
 
-    # 停用旧设置
-    cur.execute("UPDATE salary_settings SET is_active = 0 WHERE is_active = 1")
-
-    # 插入新记录
-    sql = '''INSERT INTO salary_settings(payday, amount, start_date, is_active)
-             VALUES(?,?,?,1)'''
-    start_date = datetime.date.today().isoformat()
-    cur.execute(sql, (new_payday, new_amount, start_date))
-    conn.commit()
-
-    print(f"已更新！新的发薪日设置为每月 {new_payday} 号，月薪 {new_amount} 元")
+    if set_salary(conn, new_payday, from_cents(new_amount)):
+        print(f"已更新！新的发薪日设置为每月 {new_payday} 号，月薪 {from_cents(new_amount)} 元")
 
 def adjust_current_salary(conn):
-    """ 调整当前生效薪资 """
+    """ 调整当前生效薪资（修改生效中薪资规则的金额，之后发放的工资按新金额）"""
     print("\n--- 调整本月薪资 ---")
 
-    # 获取当前设置
-    cur = conn.cursor()
-    cur.execute('''SELECT id, payday, amount 
-                   FROM salary_settings 
-                   WHERE is_active = 1 
-                   ORDER BY start_date DESC LIMIT 1''')
-    current = cur.fetchone()
-
+    current = conn.execute('''SELECT id, day, amount FROM recurring_rules
+                              WHERE kind = 'salary' AND next_due IS NOT NULL
+                              ORDER BY id DESC LIMIT 1''').fetchone()
     if not current:
         print("错误：请先设置发薪日！")
         return
 
-    salary_id, payday, old_amount = current
-    print(f"当前生效薪资：每月 {payday} 号发薪 {old_amount} 元")
+    rule_id, payday, old_amount = current
+    print(f"当前生效薪资：每月 {payday} 号发薪 {from_cents(old_amount)} 元")
 
     try:
-        new_amount = float(input("请输入新的本月薪资金额: "))
+        new_amount = to_cents(input("请输入新的本月薪资金额: "))
         if new_amount <= 0:
             raise ValueError
     except ValueError:
         print("错误：请输入有效的正数金额")
         return
 
-    # 创建调整记录（保留历史版本）
-    sql = '''INSERT INTO salary_settings(payday, amount, start_date, is_active)
-             VALUES(?,?,?,0)'''  # is_active=0 表示调整记录
-    adjustment_date = datetime.date.today().isoformat()
-    cur.execute(sql, (payday, new_amount, adjustment_date))
-
-    # 更新当前生效记录
-    cur.execute("UPDATE salary_settings SET amount = ? WHERE id = ?",
-                (new_amount, salary_id))
+    conn.execute("UPDATE recurring_rules SET amount = ? WHERE id = ?", (new_amount, rule_id))
+    note_write("recurring_rules")
     conn.commit()
+    flush_writes()
 
-    print(f"本月薪资已调整为 {new_amount} 元（原金额 {old_amount} 元）")
+    print(f"本月薪资已调整为 {from_cents(new_amount)} 元（原金额 {from_cents(old_amount)} 元）")
 
 def show_salary_history(conn):
     """ 显示历史薪资设置 """
-    cur = conn.cursor()
-    cur.execute('''SELECT payday, amount, start_date, 
-                   CASE WHEN is_active THEN '生效中' ELSE '历史记录' END AS status
-                 FROM salary_settings
-                 ORDER BY start_date DESC''')
-
     print("\n=== 历史薪资设置 ===")
     print("发薪日 | 金额    | 生效日期   | 状态")
     print("-" * 40)
-    for payday, amount, start_date, status in cur.fetchall():
-        print(f"{payday:6} | {amount:7.2f} | {start_date} | {status}")
+    for rule in reversed(get_recurring_rules(conn, 'salary')):
+        status = '生效中' if rule["next_due"] else '历史记录'
+        print(f"{rule['day']:6} | {rule['amount']:7.2f} | {rule['start_date']} | {status}")
 
-def auto_add_salary(conn):
-    """ 每天启动时检查是否发薪日（应添加到main函数初始化处）"""
-    today = datetime.date.today()
-    cur = conn.cursor()
+def add_recurring_rule(conn, trans_type, amount, category, freq, start_date=None, end_date=None,
+                       every=1, day=None, nth=None, month=None, description='', kind='custom',
+                       skip_existing=False, commit=True):
+    """
+    添加周期性收支规则（金额为元）
+    参数:
+        freq: daily / weekly / monthly / nth_weekday / yearly（含义见 recurrence.py）
+        start_date: 起始日期，默认今天；end_date: 最后可能发生的日期（含），None 表示不结束
+        every: 间隔（天 / 周 / 月 / 年）
+        day / nth / month: 未指定时按起始日期推断，如每月规则取起始日期的日
+        kind: salary / daily_default / custom，供薪资、每日默认项等功能筛选自己的规则
+        skip_existing: 当天已有同类型同分类记录时不再生成
+    说明: 到期的记录在下次执行 materialize_due（启动时）时生成
+    返回: 规则 id
+    """
+    if trans_type not in ('income', 'expense'):
+        raise ValueError("类型必须为 income 或 expense")
+    cents = to_cents(amount)
+    if cents <= 0:
+        raise ValueError("金额必须大于0")
+    rule = {"freq": freq, "every": every, "start_date": start_date or datetime.date.today().isoformat(),
+            "end_date": end_date}
+    if freq in RULE_FREQS:
+        rule.update(default_schedule(freq, rule["start_date"]))
+    rule.update({key: value for key, value in (("day", day), ("nth", nth), ("month", month))
+                 if value is not None})
+    validate_rule(rule)
+    try:
+        rule_id = conn.execute(
+            '''INSERT INTO recurring_rules(kind, type, amount, category_id, description, freq,
+                                         every, day, nth, month, start_date, end_date, next_due,
+                                         skip_existing)
+               VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?)''',
+            (kind, trans_type, cents, get_category_id(conn, category or '未分类'), description or '',
+             freq, every, rule["day"], rule["nth"], rule["month"], rule["start_date"], end_date,
+             next_occurrence(rule), int(bool(skip_existing)))).lastrowid
+        note_write("recurring_rules", "categories")
+        if commit:
+            conn.commit()
+            flush_writes()
+        return rule_id
+    except sqlite3.Error:
+        if commit:
+            conn.rollback()
+            clear_category_cache()
+            flush_writes()
+        raise
+
+def end_recurring_rule(conn, rule_id, end_date=None, commit=True):
+    """ 结束规则：end_date（含，默认昨天）之后不再生成记录，已生成的记录不变 """
+    end_date = end_date or (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+    conn.execute('''UPDATE recurring_rules
+                    SET end_date = min(COALESCE(end_date, :end), :end),
+                        next_due = CASE WHEN next_due <= :end THEN next_due END
+                    WHERE id = :id''', {"end": end_date, "id": rule_id})
+    note_write("recurring_rules")
+    if commit:
+        conn.commit()
+        flush_writes()
 
-    # 检查今天是否是激活的发薪日
-    cur.execute('''SELECT payday, amount FROM salary_settings 
-                 WHERE is_active = 1 AND payday = ?''', (today.day,))
-    result = cur.fetchone()
-
-    if result:
-        payday, amount = result
-        # 检查本月是否已添加
-        cur.execute('''SELECT id FROM transactions 
-                     WHERE type='income' AND category='薪资'
-                     AND strftime('%Y-%m', date) = ?''',
-                    (today.strftime('%Y-%m'),))
-        if not cur.fetchone():
-            add_transaction(conn, auto=True, auto_data={
-                'date': today.isoformat(),
-                'type': 'income',
-                'amount': amount,
-                'category': '薪资',
-                'description': '月度工资'
-            })
+def get_recurring_rules(conn, kind=None):
+    """
+    周期性收支规则（按添加顺序）
+    返回: [{RULE_COLUMNS 各列..., "category"}, ...]，金额单位为元，next_due 为 None 表示已结束
+    """
+    where = "WHERE kind = ?" if kind else ""
+    rows = cached_query(conn, f"SELECT {RULE_SELECT} FROM recurring_rules {where} ORDER BY id",
+                        (kind,) if kind else (), ("recurring_rules",))
+    rules = []
+    for row in rows:
+        rule = dict(zip(RULE_COLUMNS, row))
+        rule.update(amount=from_cents(rule["amount"]),
+                    category=get_category_name(conn, rule["category_id"]))
+        rules.append(rule)
+    return rules
+
+def materialize_due(conn, until=None, kinds=None, since=None, commit=True):
+    """
+    生成截至 until（含，默认今天）所有到期的周期性记录（在程序启动时调用）
+    - 到期规则由 next_due 索引范围查找得到，没有到期规则时只需一次索引查询
+    - 各规则的发生日期经最小堆按日期归并（recurrence.due_occurrences），用一次 executemany 写入，
+      并在同一事务中推进各规则的 next_due，重复运行不会重复生成
+    参数:
+        kinds: 只处理这些类别的规则，如 ('salary',)；None 表示全部
+        since: 从 since（含）起重新补录，只作用于按日去重（skip_existing）的规则，
+               next_due 只前进不后退
+        commit: False 时由调用方（如写线程的批量提交）负责提交和回滚
+    返回: 新增记录数
+    """
+    until = until or datetime.date.today().isoformat()
+    kind_filter = f"AND kind IN ({','.join('?' * len(kinds))})" if kinds else ""
+    if since:
+        if since > until:
+            return 0
+        sql, params = BACKFILL_RULES_SQL, [until, since]
+    else:
+        sql, params = DUE_RULES_SQL, [until]
+    rows = conn.execute(sql.format(kinds=kind_filter), params + list(kinds or ())).fetchall()
+    if not rows:
+        return 0
+
+    rules = [dict(zip(RULE_COLUMNS, row)) for row in rows]
+    due, next_due = due_occurrences(rules, until, since)
+    if since:
+        previous = {rule["id"]: rule["next_due"] for rule in rules}
+        next_due = {rule_id: None if previous[rule_id] is None or day is None
+                    else max(previous[rule_id], day)
+                    for rule_id, day in next_due.items()}
+    try:
+        cur = conn.cursor()
+        cur.executemany(OCCURRENCE_INSERT_SQL, ({
+            "date": day,
+            "type": rule["type"],
+            "amount": rule["amount"],
+            "category_id": rule["category_id"],
+            "description": rule["description"],
+            "skip_existing": rule["skip_existing"],
+        } for day, rule in due))
+        inserted = cur.rowcount if due else 0
+        cur.executemany("UPDATE recurring_rules SET next_due = ? WHERE id = ?",
+                        [(day, rule_id) for rule_id, day in next_due.items()])
+        note_write(*TRANSACTION_TABLES, "recurring_rules")
+        if commit:
+            conn.commit()
+            flush_writes()
+        return inserted
+    except Exception:
+        if commit:
+            conn.rollback()
+            flush_writes()
+        raise
+
+def auto_add_salary(conn, today=None, commit=True):
+    """
+    补发工资：生成截至 today（含）到期的薪资规则记录（materialize_due 只处理薪资规则）
+    commit=False 时由调用方（如写线程的批量提交）负责提交和回滚
+    返回: 新增工资记录数
+    """
+    today = today or datetime.date.today()
+    return materialize_due(conn, today.isoformat(), ('salary',), commit=commit)
 
 def add_daily_defaults(conn):
-    """ 添加每日默认收支项 """
+    """ 添加每日默认收支项（每日规则，当天已有同类型同分类记录时跳过）"""
     print("\n--- 设置每日默认收支 ---")
     trans_type = input("类型 (income/expense): ").lower()
-    amount = float(input("金额: "))
+    amount = input("金额: ")
     category = input("分类: ")
     desc = input("描述（如'早餐'）: ")
 
-    sql = '''INSERT INTO daily_defaults(type, amount, category, description)
-             VALUES(?,?,?,?)'''
-    cur = conn.cursor()
-    cur.execute(sql, (trans_type, amount, category, desc))
-    conn.commit()
+    try:
+        add_recurring_rule(conn, trans_type, amount, category, 'daily', description=desc,
+                           kind='daily_default', skip_existing=True)
+    except ValueError as e:
+        print(f"错误：{e}")
+        return
     print("已添加每日默认项！")
 
-def apply_daily_defaults(conn):
-    """ 应用今日默认项（在程序启动时调用）"""
-    today = datetime.date.today().isoformat()
-    cur = conn.cursor()
-
-    # 获取所有激活的默认项
-    cur.execute("SELECT * FROM daily_defaults WHERE is_active = 1")
-    defaults = cur.fetchall()
-
-    for item in defaults:
-        _, trans_type, amount, category, desc, _ = item
-        # 检查今日是否已有该类型记录
-        cur.execute('''SELECT id FROM transactions 
-                     WHERE date=? AND type=? AND category=?''',
-                    (today, trans_type, category))
-        if not cur.fetchone():
-            add_transaction(conn, auto=True, auto_data={
-                'date': today,
-                'type': trans_type,
-                'amount': amount,
-                'category': category,
-                'description': desc
-            })
+def apply_daily_defaults(conn, start_date=None, end_date=None, commit=True):
+    """
+    补录每日默认项（materialize_due 只处理每日默认项规则）
+    参数:
+        start_date: 起始日期 'YYYY-MM-DD'，给出时重新补录该日期起的区间（按日去重，不会重复）；
+                    默认只生成上次之后到期的
+        end_date: 结束日期（含），默认为今天
+        commit: False 时由调用方负责提交和回滚
+    返回: 新增记录数
+    """
+    return materialize_due(conn, end_date, ('daily_default',), since=start_date, commit=commit)
 
 # def set_budget_alert(conn):
 #     """ 设置月度预算 """
@@ -400,78 +944,263 @@ def apply_daily_defaults(conn):
 #                         (current_month,))
 #         conn.commit()
 
-def set_budget_alert(conn, amount):
-    """ 设置预警金额 """
-    cur = conn.cursor()
-    # 检查是否存在记录
-    cur.execute("SELECT id FROM budget_alert")
-    if cur.fetchone():
-        sql = "UPDATE budget_alert SET monthly_budget = ?"
-    else:
-        sql = "INSERT INTO budget_alert(monthly_budget) VALUES(?)"
-
+def set_budget(conn, amount, category=None, period='month', commit=True):
+    """
+    设置预算（元；category 为 None 表示全部分类，period 为 week / month / year）
+    新建的预算按交易历史回填各周期的累计支出，之后由触发器增量维护；
+    修改金额后重新检查当前周期：不再达到的阈值可再次提醒，已达到的阈值立即产生告警
+    amount 为 None 或 0 时删除该预算
+    返回: 预算 id（删除时为 None）
+    """
+    if period not in BUDGET_PERIODS:
+        raise ValueError(f"无效的预算周期: {period}（可选: {', '.join(BUDGET_PERIODS)}）")
+    if period == 'week' and not conn.in_transaction:
+        # 周预算回填要扫描归档库，ATTACH 不能在写入开始后执行
+        attach_archives(conn)
     try:
-        cur.execute(sql, (amount,))
+        category_id = get_category_id(conn, category, create=False) if category else 0
+        if category_id is None:
+            raise ValueError(f"分类不存在: {category}")
+        row = conn.execute("SELECT id FROM budgets WHERE category_id = ? AND period = ?",
+                           (category_id, period)).fetchone()
+        budget_id = row[0] if row else None
+        note_write("budgets", "budget_spend", "budget_alerts")
+        if not amount:
+            if budget_id is not None:
+                delete_budget(conn, budget_id, commit=False)
+            budget_id = None
+        else:
+            cents = to_cents(amount)
+            if cents <= 0:
+                raise ValueError("预算金额必须大于0")
+            if budget_id is None:
+                budget_id = conn.execute(
+                    "INSERT INTO budgets(category_id, period, amount) VALUES (?, ?, ?)",
+                    (category_id, period, cents)).lastrowid
+                seed_budget_spend(conn, budget_id)
+            else:
+                conn.execute("UPDATE budgets SET amount = ? WHERE id = ?", (cents, budget_id))
+            # 撤销按新金额不再达到的阈值的提醒记录，再检查当前周期新达到的阈值
+            conn.execute('''DELETE FROM budget_alerts
+                            WHERE budget_id = ? AND threshold * ? > 100 * COALESCE(
+                                (SELECT spent FROM budget_spend s
+                                 WHERE s.budget_id = budget_alerts.budget_id
+                                   AND s.period_key = budget_alerts.period_key), 0)''',
+                         (budget_id, cents))
+            conn.execute(BUDGET_CHECK_SQL.format(budgets="b.id = ?"), (budget_id,))
+        if commit:
+            conn.commit()
+            flush_writes()
+        return budget_id
+    except sqlite3.Error:
+        if commit:
+            conn.rollback()
+            flush_writes()
+        raise
+
+def delete_budget(conn, budget_id, commit=True):
+    """ 删除预算及其累计支出、提醒记录 """
+    for table in ("budget_alerts", "budget_spend"):
+        conn.execute(f"DELETE FROM {table} WHERE budget_id = ?", (budget_id,))
+    conn.execute("DELETE FROM budgets WHERE id = ?", (budget_id,))
+    note_write("budgets", "budget_spend", "budget_alerts")
+    if commit:
+        conn.commit()
+        flush_writes()
+
+def current_period_keys(today=None):
+    """ 当前的周、年、月周期键（与数据库中 BUDGET_PERIOD_KEY 的算法一致）"""
+    today = today or datetime.date.today()
+    week = today - datetime.timedelta(days=today.weekday())
+    return week.isoformat(), today.strftime("%Y"), today.strftime("%Y-%m")
+
+def get_budgets(conn, today=None):
+    """
+    所有预算及当前周期的进度（每个预算一次主键查找）
+    返回: [{"id", "category", "period", "period_key", "amount", "spent", "ratio"}, ...]，金额单位为元
+    """
+    keys = current_period_keys(today)
+    rows = cached_query(conn, BUDGETS_SQL, keys + keys, ("budgets", "budget_spend"))
+    return [{
+        "id": budget_id,
+        "category": get_category_name(conn, category_id) if category_id else None,
+        "period": period,
+        "period_key": period_key,
+        "amount": from_cents(amount),
+        "spent": from_cents(spent),
+        "ratio": round(spent / amount, 4) if amount else 0.0,
+    } for budget_id, category_id, period, amount, period_key, spent in rows]
+
+def take_pending_alerts(conn, commit=True):
+    """
+    取出当前周期中尚未送达界面的提醒（命令行导入等未开启事件收集时产生），并标记为已通知
+    界面启动时调用一次；之后的提醒由写线程经 budget_events 直接送达
+    返回: 与 budget_events 事件相同格式的字典列表
+    """
+    rows = conn.execute(PENDING_ALERTS_SQL, current_period_keys()).fetchall()
+    if not rows:
+        return []
+    conn.execute("UPDATE budget_alerts SET notified = 1 WHERE notified = 0")
+    note_write("budget_alerts")
+    if commit:
         conn.commit()
+        flush_writes()
+    return [{
+        "budget_id": budget_id,
+        "category": category,
+        "period": period,
+        "period_key": period_key,
+        "threshold": threshold,
+        "spent": from_cents(spent),
+        "amount": from_cents(amount),
+    } for budget_id, category, period, period_key, threshold, spent, amount in rows]
+
+def set_budget_alert(conn, amount, commit=True):
+    """ 设置全部分类的月度预算（元；commit=False 时由调用方提交）"""
+    try:
+        set_budget(conn, amount, None, 'month', commit)
         return True
     except sqlite3.Error as e:
         print(f"设置预警失败: {e}")
         return False
 
-def get_budget_alert_status(conn):
+def prompt_budget_alert(conn):
+    """ 命令行菜单：输入并设置月度预算 """
+    current = get_monthly_budget(conn)
+    if current is not None:
+        print(f"当前月度预算: {current:.2f} 元")
+    try:
+        amount = to_cents(input("请输入新的月度预算金额: "))
+        if amount <= 0:
+            raise ValueError
+    except ValueError:
+        print("输入无效！金额必须为大于0的数字")
+        return False
+    if set_budget_alert(conn, from_cents(amount)):
+        print(f"已设置月度预算为 {from_cents(amount):.2f} 元")
+        return True
+    return False
+
+def get_monthly_budget(conn):
+    """ 全部分类的月度预算（元），未设置时返回 None """
+    rows = cached_query(conn, MONTHLY_BUDGET_SQL, (), ("budgets",))
+    return from_cents(rows[0][1]) if rows else None
+
+def get_budget_alert_status(conn, commit=True):
     """
-    获取当前预算预警状态
+    全部分类月度预算的当前状态（读累计支出计数，不再扫描本月交易）
+    is_over 每月只为 True 一次：预算引擎在支出达到预算时产生的提醒尚未送达时，取走并标记为已通知；
+    已由界面（budget_events / take_pending_alerts）或之前的调用送达过则为 False
     返回格式:
         {
-            "is_over": bool,      # 是否超支
+            "is_over": bool,      # 支出是否达到预算（本月首次提示）
             "budget": float,      # 预算金额
             "current": float,     # 当前支出
             "month": str          # 当前月份 (YYYY-MM)
         }
     """
-    cur = conn.cursor()
-    cur.execute("SELECT monthly_budget, last_alert_month FROM budget_alert")
-    result = cur.fetchone()
-
     status = {
         "is_over": False,
         "budget": 0.0,
         "current": 0.0,
         "month": datetime.date.today().strftime("%Y-%m")
     }
-
-    if not result or result[0] is None:
+    rows = cached_query(conn, MONTHLY_BUDGET_SQL, (), ("budgets",))
+    if not rows:
         return status
 
-    budget, last_alert_month = result
-    status["budget"] = budget
-
-    # 计算本月支出
-    cur.execute('''SELECT SUM(amount) FROM transactions 
-                 WHERE type='expense' AND strftime('%Y-%m', date) = ?''',
-                (status["month"],))
-    total_expense = cur.fetchone()[0] or 0.0
-    status["current"] = total_expense
-
-    # 判断是否需要提示（允许首次提示或新月）
-    if (last_alert_month != status["month"]) and (total_expense > budget):
-        status["is_over"] = True
-        # 更新提醒状态（避免重复提示）
-        cur.execute("UPDATE budget_alert SET last_alert_month = ?", (status["month"],))
-        conn.commit()
-
+    budget_id, budget = rows[0]
+    spent = cached_query(conn, BUDGET_SPENT_SQL, (budget_id, status["month"]),
+                         ("budget_spend",))
+    spent = spent[0][0] if spent else 0
+    status.update(budget=from_cents(budget), current=from_cents(spent))
+    if spent >= budget:  # 与预算引擎的 100% 阈值一致：支出达到预算即提醒
+        cur = conn.execute(TAKE_OVER_ALERT_SQL, (budget_id, status["month"]))
+        if cur.rowcount:
+            status["is_over"] = True
+            note_write("budget_alerts")
+            if commit:
+                conn.commit()
+                flush_writes()
     return status
 
+# 以上所有以连接为参数的公开函数统一加上计时（instrumentation），
+# 需在 STARTUP_JOBS 等引用这些函数之前执行
+instrument_functions(globals(), __name__)
+
+# 启动任务：主界面/菜单出现后在后台依次执行，函数签名为 func(conn, commit=True)
+STARTUP_JOBS = [
+    ("生成周期性收支", materialize_due),
+]
+
+def run_startup_jobs(conn=None, progress=None):
+    """
+    依次执行启动任务，单个任务失败不影响后续任务
+    参数:
+        conn: 可选，默认使用当前线程的复用连接（命令行模式在后台线程中调用）
+        progress: 进度回调 progress(任务名, 序号, 总数)
+    返回: {任务名: 返回值或异常对象}
+    """
+    conn = conn or get_connection()
+    results = {}
+    for index, (name, job) in enumerate(STARTUP_JOBS, 1):
+        if progress:
+            progress(name, index, len(STARTUP_JOBS))
+        try:
+            results[name] = job(conn)
+        except Exception as e:
+            results[name] = e
+    return results
+
+def _report_startup_results(results):
+    """ 命令行模式：在菜单前打印后台启动任务的结果 """
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            print(f"[后台] {name}失败: {result}")
+        elif result:
+            print(f"[后台] {name}: 新增 {result} 条记录")
+
+def verify_query_plans(conn):
+    """
+    回归检查：确认汇总、预警、周期规则到期队列等热点查询走索引而不是全表扫描
+    异常: AssertionError，附带出问题的查询计划
+    """
+    month = datetime.date.today().strftime('%Y-%m')
+    start, end = month_range(month)
+    checks = [
+        ("transactions", SUM_BY_TYPE_SQL, ('expense', start, end)),
+        ("recurring_rules", DUE_RULES_SQL.format(kinds=""), (start,)),
+        ("main.transactions", PAGE_AFTER_SQL.format(schema="main"), (start, 0, PAGE_SIZE)),
+        ("main.transactions", PAGE_BEFORE_SQL.format(schema="main"), (start, 0, PAGE_SIZE)),
+        ("monthly_totals", MONTH_TOTALS_SQL, (month,)),
+        ("monthly_totals", MONTH_TYPE_TOTAL_SQL, (month, 'expense')),
+        ("t", SEARCH_SQL.format(filters=""), ('"x"*', SEARCH_WINDOW, SEARCH_LIMIT)),
+        ("daily_balances", BALANCE_AT_SQL, (start,)),
+        ("daily_balances", BALANCE_RANGE_SQL, (start, end)),
+    ]
+    for table, sql, params in checks:
+        plan = explain_query_plan(conn, sql, params)
+        if not any(step.startswith(f"SEARCH {table} USING") for step in plan) \
+                or any(step.split()[:2] == ["SCAN", table] for step in plan):
+            raise AssertionError(f"查询未使用索引:\n{sql}\n计划: {plan}")
+    return True
+
 def main():
-    conn = create_connection()
-    if not conn:
-        return
+    conn = get_connection()
+    create_tables(conn)
 
-    # 启动时自动处理
-    auto_add_salary(conn)  # 自动加薪
-    apply_daily_defaults(conn)  # 应用默认项
+    # 启动时生成到期的周期性收支，放到后台线程（使用独立连接），菜单立即可用
+    startup_results = {}
+    startup = threading.Thread(target=lambda: startup_results.update(run_startup_jobs()),
+                               name="startup-jobs")
+    startup.start()
+    reported = False
 
     while True:
+        if not reported and not startup.is_alive():
+            _report_startup_results(startup_results)
+            reported = True
+
         print("\n===== 个人记账系统 =====")
         print("1. 添加记录")
         print("2. 查看本月汇总")
@@ -494,11 +1223,14 @@ def main():
         elif choice == '5':
             add_daily_defaults(conn)
         elif choice == '6':
-            set_budget_alert(conn)
+            prompt_budget_alert(conn)
         elif choice == '7':
             break
 
-    conn.close()
+    startup.join()
+    if not reported:
+        _report_startup_results(startup_results)
+    close_all_connections()
     print("已退出系统")
 
 if __name__ == "__main__":
@@ -0,0 +1,130 @@
+# query_cache.py
+import threading
+from collections import OrderedDict
+
+MAX_ENTRIES = 256  # 缓存条目上限，超出时淘汰最久未用的条目
+
+# 交易表的写入会经触发器同时改动汇总表、全文索引、每日余额表、预算累计支出与提醒，
+# 新分类写入分类表
+TRANSACTION_TABLES = ("transactions", "monthly_totals", "transactions_fts", "daily_balances",
+                      "budget_spend", "budget_alerts", "categories")
+
+# 缓存状态（进程内共享）
+_entries = OrderedDict()  # (sql, params) -> (依赖表的版本快照, 结果行)
+_versions = {}            # 表名 -> 版本号，写入提交后递增
+_seen = {}                # id(conn) -> (上次看到的 data_version, 当时其他线程的本地提交数)
+_commits = {}             # 线程 id -> 该线程经数据层提交的次数（flush_writes 计数）
+_stats = {"hits": 0, "misses": 0, "bypassed": 0, "evictions": 0,
+          "invalidations": 0, "external_flushes": 0}
+_lock = threading.RLock()
+_local = threading.local()  # pending: 当前线程未提交事务中写过的表
+
+
+def cached_query(conn, sql, params=(), tables=()):
+    """
+    带缓存的只读查询，返回 fetchall() 的结果（行为元组，可直接共享）
+    参数:
+        tables: 查询依赖的表；这些表经数据层写入并提交后，相关条目自动失效
+    说明: 当前事务中已写过依赖表时（未提交的数据）直接查询，不读写缓存
+    """
+    params = tuple(params)
+    if _pending() & set(tables):
+        with _lock:
+            _stats["bypassed"] += 1
+        return conn.execute(sql, params).fetchall()
+
+    key = (sql, params)
+    with _lock:
+        _check_external(conn)
+        entry = _entries.get(key)
+        if entry is not None and entry[0] == _snapshot(tables):
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return list(entry[1])
+        _stats["misses"] += 1
+        # 先取版本快照再查询：查询期间若有提交，条目会因版本落后而在下次失效
+        snapshot = _snapshot(tables)
+
+    rows = conn.execute(sql, params).fetchall()
+    with _lock:
+        _entries[key] = (snapshot, tuple(rows))
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats["evictions"] += 1
+    return rows
+
+
+def note_write(*tables):
+    """ 数据层写入后调用：记录当前事务写过的表，提交后由 flush_writes 使其失效 """
+    _pending().update(tables)
+
+
+def flush_writes():
+    """ 提交（或回滚）之后调用：使当前线程事务中写过的表的缓存失效 """
+    pending = _pending()
+    if pending:
+        with _lock:
+            thread = threading.get_ident()
+            _commits[thread] = _commits.get(thread, 0) + 1
+        invalidate(*pending)
+        pending.clear()
+
+
+def invalidate(*tables):
+    """ 使依赖这些表的缓存条目失效；不传表名时清空全部缓存 """
+    with _lock:
+        _stats["invalidations"] += 1
+        if not tables:
+            _entries.clear()
+        for table in tables:
+            _versions[table] = _versions.get(table, 0) + 1
+
+
+def forget_connection(conn):
+    """ 连接关闭时调用，避免 id 被新连接复用后误判 data_version """
+    with _lock:
+        _seen.pop(id(conn), None)
+
+
+def cache_stats():
+    """ 命中/未命中等计数及当前条目数 """
+    with _lock:
+        stats = dict(_stats, size=len(_entries), max_entries=MAX_ENTRIES)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    return stats
+
+
+def _pending():
+    pending = getattr(_local, "pending", None)
+    if pending is None:
+        pending = _local.pending = set()
+    return pending
+
+
+def _snapshot(tables):
+    return tuple(_versions.get(table, 0) for table in tables)
+
+
+def _other_commits():
+    """ 本进程其他线程经数据层提交的总次数（连接按线程复用，即其他连接的本地提交）"""
+    thread = threading.get_ident()
+    return sum(count for owner, count in _commits.items() if owner != thread)
+
+
+def _check_external(conn):
+    """
+    用 PRAGMA data_version 发现外部提交（需持有 _lock）
+    data_version 不计本连接自己的提交，变化说明有其他连接提交过：
+    - 期间本进程其他线程（如 GUI 的写线程）没有经数据层提交：来自其他进程，不知道改了哪些表，整体清空
+    - 期间有本地提交：视为这些提交造成的变化，它们写过的表已由 flush_writes 按表失效，不再整体清空
+    局限: 与本进程其他线程的提交落在同一次检查间隔内的外部提交无法分辨，不会触发整体清空
+    """
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    others = _other_commits()
+    seen = _seen.get(id(conn))
+    _seen[id(conn)] = (data_version, others)
+    if seen is not None and seen[0] != data_version and seen[1] == others:
+        _entries.clear()
+        _stats["external_flushes"] += 1
@@ -0,0 +1,161 @@
+# recurrence.py
+import calendar
+import datetime
+import heapq
+
+# 周期规则的频率（recurring_rules.freq）
+# - daily: 每 every 天
+# - weekly: 每 every 周的星期 day（0 为周一）
+# - monthly: 每 every 个月的第 day 天（超过当月天数时取月末，-1 表示月末）
+# - nth_weekday: 每 every 个月的第 nth 个星期 day（nth 为 1-4，-1 表示最后一个）
+# - yearly: 每 every 年的 month 月 day 日（2 月 29 日在平年取 2 月 28 日）
+RULE_FREQS = ('daily', 'weekly', 'monthly', 'nth_weekday', 'yearly')
+LAST = -1  # day / nth 取 -1 表示月末 / 最后一个
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def _date(value):
+    return value if isinstance(value, datetime.date) else datetime.date.fromisoformat(value)
+
+
+def _month_day(year, month, day):
+    """ 某月第 day 天；超过当月天数（如 2 月 31 日）或 day = -1 时取月末 """
+    last = calendar.monthrange(year, month)[1]
+    return datetime.date(year, month, last if day == LAST else min(day, last))
+
+
+def _nth_weekday(year, month, weekday, nth):
+    """ 某月第 nth 个星期 weekday（0 为周一），nth = -1 为最后一个 """
+    if nth == LAST:
+        last = _month_day(year, month, LAST)
+        return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+    first = datetime.date(year, month, 1)
+    return first + datetime.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (nth - 1))
+
+
+def default_schedule(freq, start_date):
+    """
+    未指定 day / nth / month 时按起始日期推断，如每月规则取起始日期的日，
+    每年规则取起始日期的月、日，第 n 个星期几规则取起始日期是当月第几个星期几
+    返回: {"day", "nth", "month"}
+    """
+    start = _date(start_date)
+    if freq == 'weekly':
+        return {"day": start.weekday(), "nth": None, "month": None}
+    if freq == 'nth_weekday':
+        return {"day": start.weekday(), "nth": min((start.day - 1) // 7 + 1, 4), "month": None}
+    if freq == 'monthly':
+        return {"day": start.day, "nth": None, "month": None}
+    if freq == 'yearly':
+        return {"day": start.day, "nth": None, "month": start.month}
+    return {"day": None, "nth": None, "month": None}
+
+
+def validate_rule(rule):
+    """ 检查规则字段的取值范围，不合法时抛出 ValueError """
+    freq, day, nth, month = rule["freq"], rule["day"], rule["nth"], rule["month"]
+    if freq not in RULE_FREQS:
+        raise ValueError(f"无效的频率: {freq}（可选: {', '.join(RULE_FREQS)}）")
+    if not isinstance(rule["every"], int) or rule["every"] < 1:
+        raise ValueError("间隔必须为正整数")
+    if freq in ('weekly', 'nth_weekday') and day not in range(7):
+        raise ValueError("星期必须为 0-6（0 为周一）")
+    if freq in ('monthly', 'yearly') and day != LAST and day not in range(1, 32):
+        raise ValueError("日期必须为 1-31 或 -1（月末）")
+    # 只允许每月必然存在的第 1-4 个或最后一个，保证每个周期都有一次发生
+    if freq == 'nth_weekday' and nth != LAST and nth not in range(1, 5):
+        raise ValueError("第几个星期必须为 1-4 或 -1（最后一个）")
+    if freq == 'yearly' and month not in range(1, 13):
+        raise ValueError("月份必须为 1-12")
+    if rule["end_date"] and _date(rule["end_date"]) < _date(rule["start_date"]):
+        raise ValueError("结束日期不能早于起始日期")
+
+
+def _period_date(rule, start, offset):
+    """ 从起始周期起第 offset 个周期内的发生日期 """
+    freq = rule["freq"]
+    if freq == 'daily':
+        return start + datetime.timedelta(days=offset)
+    if freq == 'weekly':
+        monday = start - datetime.timedelta(days=start.weekday())
+        return monday + datetime.timedelta(days=7 * offset + rule["day"])
+    if freq == 'yearly':
+        return _month_day(start.year + offset, rule["month"], rule["day"])
+    year, month = divmod(start.month - 1 + offset, 12)
+    if freq == 'monthly':
+        return _month_day(start.year + year, month + 1, rule["day"])
+    return _nth_weekday(start.year + year, month + 1, rule["day"], rule["nth"])
+
+
+def iter_occurrences(rule, after=None):
+    """
+    按日期升序生成规则的发生日期（datetime.date）：不早于 start_date、晚于 after、不晚于 end_date
+    直接从 after 所在的周期开始推算，不从 start_date 逐个周期推进
+    rule: 含 freq / every / day / nth / month / start_date / end_date 的映射
+    """
+    start = _date(rule["start_date"])
+    end = _date(rule["end_date"]) if rule["end_date"] else None
+    lower = start if after is None else max(start, _date(after) + ONE_DAY)
+    freq, every = rule["freq"], rule["every"]
+    if freq == 'daily':
+        elapsed = (lower - start).days
+    elif freq == 'weekly':
+        elapsed = (lower - start).days // 7 + (lower.weekday() < start.weekday())  # 按自然周计
+    elif freq == 'yearly':
+        elapsed = lower.year - start.year
+    else:
+        elapsed = (lower.year - start.year) * 12 + lower.month - start.month
+    # 向下取整到 every 的倍数，该周期内的日期可能早于 lower，下面跳过
+    offset = elapsed // every * every
+    while True:
+        day = _period_date(rule, start, offset)
+        offset += every
+        if day < lower:
+            continue
+        if end is not None and day > end:
+            return
+        yield day
+
+
+def next_occurrence(rule, after=None):
+    """ 晚于 after 的下一次发生日期（ISO 字符串），规则已结束时返回 None """
+    day = next(iter_occurrences(rule, after), None)
+    return day.isoformat() if day else None
+
+
+def due_occurrences(rules, until, since=None):
+    """
+    多条规则截至 until（含）的全部发生日期，以 next_due 为键用最小堆归并：
+    每次弹出最早到期的规则，生成一次发生后把它的下一次发生日期放回堆中，
+    因此只推算实际到期的发生，结果按 (日期, 规则 id) 排序
+    参数:
+        rules: 含 id / next_due 及 iter_occurrences 所需字段的映射
+        since: 给出时忽略 next_due，从 since（含）开始重新推算（用于按日去重的补录）
+    返回: ([(日期, 规则), ...], {规则 id: 新的 next_due，None 表示规则已结束})
+    """
+    until = _date(until)
+    heap, next_due = [], {}
+    for rule in rules:
+        start = since or rule["next_due"]
+        occurrences = iter_occurrences(rule, _date(start) - ONE_DAY)
+        day = next(occurrences, None)
+        if day is None:
+            next_due[rule["id"]] = None
+        else:
+            # (日期, id) 已唯一，不会比较到后面的生成器和规则
+            heap.append((day, rule["id"], occurrences, rule))
+    heapq.heapify(heap)
+
+    due = []
+    while heap and heap[0][0] <= until:
+        day, rule_id, occurrences, rule = heap[0]
+        due.append((day.isoformat(), rule))
+        following = next(occurrences, None)
+        if following is None:
+            heapq.heappop(heap)
+            next_due[rule_id] = None
+        else:
+            heapq.heapreplace(heap, (following, rule_id, occurrences, rule))
+    for day, rule_id, *_ in heap:
+        next_due[rule_id] = day.isoformat()
+    return due, next_due
@@ -0,0 +1,30 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import query_cache  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """ 临时数据库文件，测试期间替换 database.DB_PATH（不碰 data/finance.db）"""
+    path = str(tmp_path / "finance.db")
+    monkeypatch.setattr(database, "DB_PATH", path)
+    yield path
+    # 分类字典与查询缓存是进程级的，不能带到下一个测试的数据库
+    database.close_all_connections()
+    database.clear_category_cache()
+    query_cache.invalidate()
+
+
+@pytest.fixture
+def conn(db_path):
+    """ 已建好最新结构的当前线程复用连接 """
+    conn = database.get_connection()
+    database.create_tables(conn, lambda *_: None)
+    return conn
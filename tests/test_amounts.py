@@ -0,0 +1,38 @@
+# tests/test_amounts.py
+import pytest
+
+from main import add_transaction, add_transactions_batch, to_cents, MAX_CENTS
+
+
+@pytest.mark.parametrize("amount, cents", [
+    ("12.34", 1234),
+    ("12.345", 1235),
+    (" 7 ", 700),
+    ("92233720368547758.07", MAX_CENTS),
+])
+def test_to_cents(amount, cents):
+    assert to_cents(amount) == cents
+
+
+@pytest.mark.parametrize("amount", [
+    "abc", "nan", "inf", "1e30", "1e400", "1e20", "-1e20", "92233720368547758.08",
+])
+def test_to_cents_rejects_with_value_error(amount):
+    with pytest.raises(ValueError):
+        to_cents(amount)
+
+
+def test_huge_amount_rejected_by_add_transaction(conn):
+    data = {"date": "2024-01-01", "type": "expense", "amount": "1e20", "category": "x"}
+    with pytest.raises(ValueError):
+        add_transaction(conn, auto=True, auto_data=data)
+    assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 0
+
+
+def test_huge_amounts_rejected_row_by_row_in_batch(conn):
+    rows = [{"date": "2024-01-01", "type": "expense", "amount": amount}
+            for amount in ("1", "1e30", "1e400", "1e20", "2")]
+    result = add_transactions_batch(rows, conn)
+    conn.commit()
+    assert result["inserted"] == 2
+    assert [index for index, _, _ in result["rejected"]] == [1, 2, 3]
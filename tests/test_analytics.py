@@ -0,0 +1,76 @@
+# tests/test_analytics.py
+import numpy as np
+import pytest
+
+from analytics import _sum_by, load_ledger
+from main import add_transactions_batch
+
+
+def seed(conn):
+    rows = [{"date": "2024-01-01", "type": "expense", "amount": "10", "category": "餐饮"},  # 周一
+            {"date": "2024-01-02", "type": "expense", "amount": "20", "category": "交通"},
+            {"date": "2024-02-05", "type": "income", "amount": "100", "category": "薪资"}]
+    add_transactions_batch(rows, conn)
+    conn.commit()
+
+
+def test_checksum_matches_after_load(conn):
+    seed(conn)
+    ledger = load_ledger(conn)
+    assert ledger._local_checksum() == ledger._ledger_checksum(conn)
+    assert ledger.refresh(conn) == 0
+
+
+def test_refresh_sees_date_and_category_edits(conn):
+    seed(conn)
+    ledger = load_ledger(conn)
+    # 金额和类型不变，只改日期和分类
+    conn.execute("UPDATE transactions SET date = '2024-03-06', "
+                 "category_id = (SELECT id FROM categories WHERE name = '交通') "
+                 "WHERE amount = 1000")
+    conn.commit()
+    ledger.refresh(conn)
+    assert ledger.group_by("month") == {
+        "2024-01": {"income": 0.0, "expense": 20.0, "count": 1},
+        "2024-02": {"income": 100.0, "expense": 0.0, "count": 1},
+        "2024-03": {"income": 0.0, "expense": 10.0, "count": 1},
+    }
+    assert ledger.group_by("category")["交通"]["count"] == 2
+    assert "周一" in ledger.group_by("weekday")  # 2024-02-05 仍是周一
+    assert ledger.group_by("weekday")["周三"]["expense"] == 10.0
+
+
+def test_group_by_type(conn):
+    seed(conn)
+    assert load_ledger(conn).group_by("type") == {
+        "expense": {"income": 0.0, "expense": 30.0, "count": 2},
+        "income": {"income": 100.0, "expense": 0.0, "count": 1},
+    }
+
+
+def test_sum_by_is_exact_beyond_float_precision():
+    keys = np.array([0, 0, 1])
+    values = np.array([2 ** 53 + 1, 1, -(2 ** 53 + 1)], np.int64)
+    assert _sum_by(keys, values).tolist() == [2 ** 53 + 2, -(2 ** 53 + 1)]
+
+
+def test_refresh_appends_without_recomputing_whole_checksum(conn, monkeypatch):
+    seed(conn)
+    ledger = load_ledger(conn)
+    add_transactions_batch([{"date": "2024-01-01", "type": "expense", "amount": "5",
+                             "category": "餐饮"}], conn)
+    conn.commit()
+    monkeypatch.setattr(type(ledger), "_local_checksum",
+                        lambda self: pytest.fail("刷新时不应全量重算校验和"))
+    assert ledger.refresh(conn) == 1
+    assert ledger._checksum == ledger._ledger_checksum(conn)
+    assert ledger.group_by("category")["餐饮"] == {"income": 0.0, "expense": 15.0, "count": 2}
+
+
+def test_refresh_reloads_after_delete(conn):
+    seed(conn)
+    ledger = load_ledger(conn)
+    conn.execute("DELETE FROM transactions WHERE amount = 1000")
+    conn.commit()
+    assert ledger.refresh(conn) == 2
+    assert len(ledger) == 2
@@ -0,0 +1,111 @@
+# tests/test_archive.py
+import sqlite3
+
+import os
+
+import pytest
+
+import archive
+from archive import archive_year, verify_archives
+from database import (archive_dir, rebuild_daily_balances, rebuild_monthly_totals,
+                      verify_daily_balances, verify_monthly_totals)
+from main import add_transactions_batch, get_transactions_page, set_budget, summarize
+from writer import DBWriter
+
+
+def seed(conn):
+    rows = [{"date": f"{year}-{month:02d}-15", "type": kind, "amount": str(month), "category": "餐饮"}
+            for year in (2020, 2021, 2024) for month in range(1, 13)
+            for kind in ("income", "expense")]
+    add_transactions_batch(rows, conn)
+    conn.commit()
+
+
+def test_archived_year_reads_like_before(conn):
+    seed(conn)
+    before = (summarize(conn, "2020-03-10", "2024-02-20", ("type",)),
+              get_transactions_page(conn, after=("2021-01-01", 0), limit=5))
+    archive_year(conn, "2020")
+    assert conn.execute("SELECT COUNT(*) FROM transactions WHERE date < '2021'").fetchone()[0] == 0
+    assert (summarize(conn, "2020-03-10", "2024-02-20", ("type",)),
+            get_transactions_page(conn, after=("2021-01-01", 0), limit=5)) == before
+    assert verify_monthly_totals(conn) == []
+    assert verify_daily_balances(conn) == []
+    assert verify_archives(conn) == []
+
+
+def test_batch_rejects_rows_in_archived_years(conn):
+    seed(conn)
+    archive_year(conn, "2020")
+    rows = [{"date": "2024-05-01", "type": "expense", "amount": "1"},
+            {"date": "2020-05-01", "type": "expense", "amount": "1"},
+            {"date": "2019-05-01", "type": "expense", "amount": "1"},
+            {"date": "2021-05-01", "type": "expense", "amount": "1"}]
+    result = add_transactions_batch(rows, conn)
+    conn.commit()
+    assert result["inserted"] == 2
+    assert [index for index, _, _ in result["rejected"]] == [1, 2]
+
+
+def test_trigger_is_backstop_for_direct_writes(conn):
+    seed(conn)
+    archive_year(conn, "2020")
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO transactions(date, type, amount, category_id) "
+                     "VALUES ('2020-06-01', 'expense', 1, 1)")
+    conn.rollback()
+
+
+def test_years_archive_oldest_first(conn):
+    seed(conn)
+    with pytest.raises(ValueError):
+        archive_year(conn, "2021")
+
+
+def test_write_step_runs_on_writer_thread(conn):
+    seed(conn)
+    writer = DBWriter()
+    try:
+        result = archive_year(conn, "2020", writer=writer)
+    finally:
+        writer.stop()
+    assert result["rows"] == 24
+    assert conn.execute("SELECT year FROM archived_years").fetchall() == [("2020",)]
+    assert conn.execute("SELECT COUNT(*) FROM transactions WHERE date < '2021'").fetchone()[0] == 0
+    assert verify_monthly_totals(conn) == []
+    assert verify_archives(conn) == []
+
+
+def test_failed_write_step_keeps_main_db(conn, monkeypatch):
+    seed(conn)
+    copy_year = archive._copy_year
+    # 模拟复制之后、写库之前主库中该年的数据发生变化
+    monkeypatch.setattr(archive, "_copy_year", lambda *args: (copy_year(*args)[0] + 1, 0))
+    writer = DBWriter()
+    try:
+        with pytest.raises(sqlite3.DatabaseError):
+            archive_year(conn, "2020", writer=writer)
+    finally:
+        writer.stop()
+    assert conn.execute("SELECT COUNT(*) FROM transactions WHERE date < '2021'").fetchone()[0] == 24
+    assert conn.execute("SELECT COUNT(*) FROM archived_years").fetchone()[0] == 0
+    assert os.listdir(archive_dir(conn)) == []
+
+
+def test_rebuild_after_archive_keeps_archived_years(conn):
+    seed(conn)
+    before = summarize(conn, group_by=("month",))
+    archive_year(conn, "2020")
+    rebuild_monthly_totals(conn)
+    rebuild_daily_balances(conn)
+    assert verify_monthly_totals(conn) == []
+    assert verify_daily_balances(conn) == []
+    assert summarize(conn, group_by=("month",)) == before
+
+
+def test_weekly_budget_seeds_from_archives(conn):
+    seed(conn)
+    archive_year(conn, "2020")
+    budget_id = set_budget(conn, 100, period="week")
+    assert conn.execute("SELECT COUNT(*) FROM budget_spend WHERE budget_id = ? AND period_key < '2021'",
+                        (budget_id,)).fetchone()[0] == 12
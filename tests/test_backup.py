@@ -0,0 +1,52 @@
+# tests/test_backup.py
+import os
+import shutil
+
+import database
+from archive import archive_year, verify_archives
+from backup import backup_database, read_manifest, restore_snapshot, rotate_snapshots
+from main import add_transactions_batch, summarize
+
+
+def seed(conn):
+    rows = [{"date": f"{year}-{month:02d}-15", "type": "expense", "amount": str(month)}
+            for year in (2020, 2024) for month in range(1, 13)]
+    add_transactions_batch(rows, conn)
+    conn.commit()
+
+
+def test_snapshot_restores_database(conn, db_path, tmp_path):
+    seed(conn)
+    result = backup_database(str(tmp_path / "backups" / "finance-1.db.gz"), compress=True)
+    assert result["integrity"] == "ok"
+    assert result["archives"] == []
+    conn.execute("DELETE FROM transactions")
+    conn.commit()
+    database.close_all_connections()
+
+    restore_snapshot(result["path"])
+    conn = database.get_connection()
+    assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 24
+
+
+def test_archives_are_backed_up_and_restored(conn, db_path, tmp_path):
+    seed(conn)
+    archive_year(conn, "2020")
+    before = summarize(conn, group_by=("month",))
+    backups = tmp_path / "backups"
+    first = backup_database(str(backups / "finance-1.db"))
+    second = backup_database(str(backups / "finance-2.db"))
+    assert first["archives"] == second["archives"] == ["finance-2020.db"]
+    assert read_manifest(first["path"])["archives"][0]["year"] == "2020"
+    assert os.listdir(backups / "archive") == ["finance-2020.db"]
+
+    database.close_all_connections()
+    os.remove(db_path)
+    shutil.rmtree(os.path.join(os.path.dirname(db_path), "archive"))
+    restore_snapshot(second["path"])
+    conn = database.get_connection()
+    assert summarize(conn, group_by=("month",)) == before
+    assert verify_archives(conn) == []
+
+    assert rotate_snapshots(str(backups), keep=1) == [first["path"]]
+    assert not os.path.exists(first["path"] + ".json")
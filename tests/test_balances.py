@@ -0,0 +1,55 @@
+# tests/test_balances.py
+from database import rebuild_daily_balances, verify_daily_balances
+from main import add_transactions_batch, balance_at, balance_series, delete_transaction
+
+
+def seed(conn):
+    rows = [{"date": "2024-01-10", "type": "income", "amount": "100"},
+            {"date": "2024-01-10", "type": "expense", "amount": "30"},
+            {"date": "2024-01-20", "type": "expense", "amount": "20"},
+            {"date": "2024-02-05", "type": "expense", "amount": "5"}]
+    add_transactions_batch(rows, conn)
+    conn.commit()
+
+
+def balances(conn):
+    return conn.execute("SELECT date, net, count, balance FROM daily_balances ORDER BY date").fetchall()
+
+
+def test_inserts_maintain_running_balance(conn):
+    seed(conn)
+    assert balances(conn) == [("2024-01-10", 7000, 2, 7000), ("2024-01-20", -2000, 1, 5000),
+                              ("2024-02-05", -500, 1, 4500)]
+    assert balance_at(conn, "2024-01-09") == 0.0
+    assert balance_at(conn, "2024-01-31") == 50.0
+    assert verify_daily_balances(conn) == []
+
+
+def test_backdated_changes_shift_later_balances(conn):
+    seed(conn)
+    conn.execute("UPDATE transactions SET date = '2024-02-10' WHERE date = '2024-01-20'")
+    add_transactions_batch([{"date": "2024-01-01", "type": "income", "amount": "1"}], conn)
+    conn.commit()
+    assert conn.execute("SELECT 1 FROM daily_balances WHERE date = '2024-01-20'").fetchone() is None
+    assert balance_at(conn, "2024-02-05") == 66.0
+    record_id = conn.execute("SELECT id FROM transactions WHERE date = '2024-01-01'").fetchone()[0]
+    assert delete_transaction(conn, record_id)
+    assert balance_at(conn, "2024-12-31") == 45.0
+    assert verify_daily_balances(conn) == []
+
+
+def test_balance_series_fills_days_without_transactions(conn):
+    seed(conn)
+    assert balance_series(conn, "2024-01-19", "2024-01-22") == \
+        [("2024-01-19", 70.0), ("2024-01-20", 50.0), ("2024-01-21", 50.0)]
+    assert balance_series(conn, "2024-01-01", "2024-03-01", fill=False) == \
+        [("2024-01-10", 70.0), ("2024-01-20", 50.0), ("2024-02-05", 45.0)]
+
+
+def test_verification_reports_drift_and_rebuild_fixes_it(conn):
+    seed(conn)
+    conn.execute("UPDATE daily_balances SET balance = 0 WHERE date = '2024-01-20'")
+    conn.commit()
+    assert verify_daily_balances(conn) == [("2024-01-20", 0, 5000)]
+    rebuild_daily_balances(conn)
+    assert verify_daily_balances(conn) == []
@@ -0,0 +1,46 @@
+# tests/test_batch.py
+import pytest
+
+import database
+from main import add_transactions_batch
+
+
+def rows_then_fail(count):
+    for day in range(1, count + 1):
+        yield {"date": f"2024-01-{day:02d}", "type": "expense", "amount": "1"}
+    raise RuntimeError("读取中断")
+
+
+def test_failure_midway_rolls_back_owned_transaction(conn):
+    with pytest.raises(RuntimeError):
+        add_transactions_batch(rows_then_fail(5), chunk_size=2)
+    assert not conn.in_transaction
+    conn.commit()  # 之后的提交不能保存写了一半的导入
+    assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 0
+    assert database.verify_monthly_totals(conn) == []
+
+
+def test_invalid_rows_are_reported_and_skipped(conn):
+    rows = [{"date": "2024-01-01", "type": "expense", "amount": "12.5", "category": "交通"},
+            {"date": "2024/01/02", "type": "expense", "amount": "1"},
+            {"date": "2024-01-03", "type": "gift", "amount": "1"},
+            {"date": "2024-01-04", "type": "income", "amount": "-3"},
+            {"type": "income", "amount": "3"},
+            {"date": "2024-01-05", "type": "income", "amount": "0.01"}]
+    result = add_transactions_batch(rows, conn, chunk_size=1)
+    conn.commit()
+    assert result["inserted"] == 2
+    assert [(index, data) for index, data, _ in result["rejected"]] == \
+        [(index, rows[index]) for index in (1, 2, 3, 4)]
+    assert all(reason for _, _, reason in result["rejected"])
+    assert conn.execute("SELECT date, type, amount, category_id FROM transactions ORDER BY date").fetchall() == \
+        [("2024-01-01", "expense", 1250, database.get_category_id(conn, "交通")),
+         ("2024-01-05", "income", 1, database.get_category_id(conn, "未分类"))]
+
+
+def test_caller_connection_is_not_committed(conn):
+    result = add_transactions_batch([{"date": "2024-01-01", "type": "expense", "amount": "1"}], conn)
+    assert result == {"inserted": 1, "rejected": []}
+    assert conn.in_transaction
+    conn.rollback()
+    assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 0
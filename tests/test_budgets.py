@@ -0,0 +1,36 @@
+# tests/test_budgets.py
+import datetime
+
+from main import add_transaction, get_budget_alert_status, set_budget_alert, take_pending_alerts
+
+
+def spend(conn, amount):
+    add_transaction(conn, auto=True, auto_data={
+        "date": datetime.date.today().isoformat(), "type": "expense", "amount": amount})
+    conn.commit()
+
+
+def test_over_budget_reported_once_per_period(conn):
+    set_budget_alert(conn, 100)
+    spend(conn, "50")
+    assert get_budget_alert_status(conn)["is_over"] is False
+    spend(conn, "80")
+    first = get_budget_alert_status(conn)
+    assert first["is_over"] is True and first["current"] == 130.0
+    assert get_budget_alert_status(conn)["is_over"] is False
+    spend(conn, "10")
+    assert get_budget_alert_status(conn)["is_over"] is False
+
+
+def test_alert_already_delivered_to_gui_is_not_repeated(conn):
+    set_budget_alert(conn, 100)
+    spend(conn, "150")
+    assert [event["threshold"] for event in take_pending_alerts(conn)] == [80, 100]
+    assert get_budget_alert_status(conn)["is_over"] is False
+
+
+def test_spending_exactly_the_budget_is_reported(conn):
+    set_budget_alert(conn, 100)
+    spend(conn, "100")
+    status = get_budget_alert_status(conn)
+    assert status["is_over"] is True and status["current"] == 100.0
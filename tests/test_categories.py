@@ -0,0 +1,42 @@
+# tests/test_categories.py
+import pytest
+
+import database
+from main import add_transaction, add_transactions_batch, get_transactions_page
+
+
+def test_names_are_stored_once_and_resolved_by_id(conn):
+    rows = [{"date": "2024-01-01", "type": "expense", "amount": "1", "category": "餐饮"},
+            {"date": "2024-01-02", "type": "expense", "amount": "1", "category": "餐饮"},
+            {"date": "2024-01-03", "type": "expense", "amount": "1", "category": ""}]
+    add_transactions_batch(rows, conn)
+    conn.commit()
+    assert conn.execute("SELECT COUNT(*) FROM categories WHERE name = '餐饮'").fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(DISTINCT category_id) FROM transactions").fetchone()[0] == 2
+    assert [row[4] for row in get_transactions_page(conn)] == ["未分类", "餐饮", "餐饮"]
+    # 改名只需改一行，所有记录随之变化
+    conn.execute("UPDATE categories SET name = '吃饭' WHERE name = '餐饮'")
+    conn.commit()
+    database.clear_category_cache()
+    assert [row[4] for row in get_transactions_page(conn)] == ["未分类", "吃饭", "吃饭"]
+
+
+def test_lookup_without_create(conn):
+    assert database.get_category_id(conn, "不存在的分类", create=False) is None
+    assert conn.execute("SELECT 1 FROM categories WHERE name = '不存在的分类'").fetchone() is None
+    assert database.get_category_name(conn, database.get_category_id(conn, None)) == "未分类"
+
+
+def test_rolled_back_category_is_not_cached(conn):
+    conn.execute("CREATE TRIGGER fail_insert BEFORE INSERT ON transactions "
+                 "BEGIN SELECT RAISE(ABORT, '写入失败'); END")
+    conn.commit()
+    with pytest.raises(Exception):
+        add_transaction(auto=True, auto_data={"date": "2024-01-01", "type": "expense",
+                                              "amount": "1", "category": "新分类"})
+    assert database.get_category_id(conn, "新分类", create=False) is None
+    conn.execute("DROP TRIGGER fail_insert")
+    conn.commit()
+    assert add_transaction(auto=True, auto_data={"date": "2024-01-01", "type": "expense",
+                                                 "amount": "1", "category": "新分类"})
+    assert get_transactions_page(conn)[0][4] == "新分类"
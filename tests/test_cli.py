@@ -0,0 +1,48 @@
+# tests/test_cli.py
+import json
+
+from cli import run
+
+
+def records(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_add_then_summary_and_history_as_json(db_path, capsys):
+    assert run(["--quiet", "add", "expense", "12.5", "餐饮", "午饭", "--date", "2024-03-05"]) == 0
+    assert run(["--quiet", "add", "income", "100", "工资", "--date", "2024-03-01"]) == 0
+    assert records(capsys) == [{"added": 1}, {"added": 1}]
+
+    assert run(["--quiet", "summary", "--from", "2024-03-01", "--to", "2024-04-01",
+                "--group-by", "type"]) == 0
+    assert records(capsys) == [
+        {"type": "expense", "income": 0.0, "expense": 12.5, "balance": -12.5, "count": 1},
+        {"type": "income", "income": 100.0, "expense": 0.0, "balance": 100.0, "count": 1}]
+
+    assert run(["--quiet", "history", "--limit", "1"]) == 0
+    assert records(capsys) == [{"id": 1, "date": "2024-03-05", "type": "expense", "amount": 12.5,
+                                "category": "餐饮"}]
+
+
+def test_tsv_output(db_path, capsys):
+    run(["--quiet", "add", "expense", "3", "交通", "地铁\t换乘", "--date", "2024-03-05"])
+    capsys.readouterr()
+    assert run(["--quiet", "--tsv", "balance", "--at", "2024-03-05"]) == 0
+    assert capsys.readouterr().out == "date\tbalance\n2024-03-05\t-3.00\n"
+
+
+def test_import_reports_rejected_rows(db_path, tmp_path, capsys):
+    path = tmp_path / "rows.jsonl"
+    path.write_text('{"date": "2024-01-01", "type": "expense", "amount": "1"}\n'
+                    'not json\n'
+                    '{"date": "2024-01-02", "type": "expense", "amount": "-1"}\n', encoding="utf-8")
+    assert run(["--quiet", "import", str(path)]) == 1
+    captured = capsys.readouterr()
+    assert json.loads(captured.out) == {"inserted": 1, "rejected": 2}
+    assert "第 2 条记录被拒收" in captured.err and "第 3 条记录被拒收" in captured.err
+
+
+def test_errors_go_to_stderr_with_exit_code(db_path, capsys):
+    assert run(["--quiet", "add", "expense", "abc"]) == 1
+    captured = capsys.readouterr()
+    assert captured.out == "" and captured.err.startswith("错误")
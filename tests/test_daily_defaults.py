@@ -0,0 +1,38 @@
+# tests/test_daily_defaults.py
+import database
+from main import add_recurring_rule, apply_daily_defaults
+
+
+def add_lunch(conn, start_date):
+    return add_recurring_rule(conn, "expense", 12, "餐饮", "daily", start_date, description="午餐",
+                              kind="daily_default", skip_existing=True)
+
+
+def lunch_dates(conn):
+    return [row[0] for row in conn.execute("SELECT date FROM transactions ORDER BY date")]
+
+
+def test_catch_up_fills_every_missed_day(conn):
+    add_lunch(conn, "2024-01-29")
+    assert apply_daily_defaults(conn, end_date="2024-02-02") == 5
+    assert lunch_dates(conn) == ["2024-01-29", "2024-01-30", "2024-01-31", "2024-02-01", "2024-02-02"]
+    assert apply_daily_defaults(conn, end_date="2024-02-02") == 0
+
+
+def test_days_with_a_matching_record_are_skipped(conn):
+    add_lunch(conn, "2024-03-01")
+    food = database.get_category_id(conn, "餐饮")
+    conn.execute("INSERT INTO transactions(date, type, amount, category_id, description) "
+                 "VALUES ('2024-03-02', 'expense', 3000, ?, '聚餐')", (food,))
+    conn.commit()
+    assert apply_daily_defaults(conn, end_date="2024-03-03") == 2
+    assert lunch_dates(conn) == ["2024-03-01", "2024-03-02", "2024-03-03"]
+
+
+def test_backfill_from_start_date_does_not_duplicate(conn):
+    add_lunch(conn, "2024-03-01")
+    assert apply_daily_defaults(conn, end_date="2024-03-03") == 3
+    conn.execute("DELETE FROM transactions WHERE date = '2024-03-02'")
+    conn.commit()
+    assert apply_daily_defaults(conn, start_date="2024-03-01", end_date="2024-03-03") == 1
+    assert lunch_dates(conn) == ["2024-03-01", "2024-03-02", "2024-03-03"]
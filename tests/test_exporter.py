@@ -0,0 +1,69 @@
+# tests/test_exporter.py
+import csv
+import json
+
+import pytest
+
+from archive import archive_year
+from exporter import export_transactions, iter_transactions
+from main import add_transactions_batch
+
+
+def seed(conn):
+    rows = [{"date": f"{year}-{month:02d}-01", "type": "income" if month % 2 else "expense",
+             "amount": f"{month}.05", "category": "工资" if month % 2 else "餐饮",
+             "description": f"第{month}月, \"备注\""}
+            for year in (2020, 2024) for month in range(1, 13)]
+    add_transactions_batch(rows, conn)
+    conn.commit()
+
+
+def test_csv_round_trips_in_date_order(conn, tmp_path):
+    seed(conn)
+    path = str(tmp_path / "out.csv")
+    result = export_transactions(conn, path, fetch_size=5)
+    assert result["rows"] == 24 and result["format"] == "csv"
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["date"] for row in rows] == sorted(row["date"] for row in rows)
+    assert rows[0] == {"id": "1", "date": "2020-01-01", "type": "income", "amount": "1.05",
+                       "category": "工资", "description": '第1月, "备注"'}
+
+
+def test_jsonl_filters_and_reads_archives(conn, tmp_path):
+    seed(conn)
+    archive_year(conn, "2020")
+    path = str(tmp_path / "out.jsonl")
+    result = export_transactions(conn, path, start="2020-06-01", end="2024-03-01",
+                                 trans_type="expense")
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    assert result["rows"] == len(rows) == 5
+    assert [row["date"] for row in rows] == ["2020-06-01", "2020-08-01", "2020-10-01", "2020-12-01",
+                                             "2024-02-01"]
+    assert rows[0]["amount"] == 6.05 and rows[0]["category"] == "餐饮"
+
+
+def test_batches_are_bounded_by_fetch_size(conn):
+    seed(conn)
+    assert [len(batch) for batch in iter_transactions(conn, fetch_size=10)] == [10, 10, 4]
+
+
+def test_failed_export_leaves_no_partial_file(conn, tmp_path):
+    seed(conn)
+    with pytest.raises(ValueError):
+        export_transactions(conn, str(tmp_path / "out.xlsx"))
+    path = str(tmp_path / "out.csv")
+    with pytest.raises(ValueError):
+        export_transactions(conn, path, trans_type="refund")
+    assert not [p for p in tmp_path.iterdir() if p.name.startswith("out")]
+
+
+def test_arrow_export(conn, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    seed(conn)
+    path = str(tmp_path / "out.arrow")
+    export_transactions(conn, path, fetch_size=7)
+    table = pa.ipc.open_file(path).read_all()
+    assert table.num_rows == 24
+    assert table.column("amount")[0].as_py() == 1.05
@@ -0,0 +1,64 @@
+# tests/test_instrumentation.py
+import pytest
+
+import instrumentation
+from instrumentation import instrument_methods, snapshot, timed
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    config = instrumentation.configure()
+    instrumentation.reset()
+    yield
+    instrumentation.configure(**config)
+    instrumentation.reset()
+
+
+def test_failed_calls_are_timed_and_counted():
+    @timed("flaky")
+    def flaky(fail):
+        if fail:
+            raise ValueError("boom")
+        return [1, 2]
+
+    assert flaky(False) == [1, 2]
+    with pytest.raises(ValueError):
+        flaky(True)
+    calls = snapshot()["calls"]["flaky"]
+    assert calls["count"] == 2
+    assert calls["errors"] == 1
+    assert calls["rows_returned"] == 2
+
+
+def test_instrument_methods_skips_excluded():
+    class App:
+        def handler(self):
+            return None
+
+        def dialog(self):
+            return None
+
+    original = App.dialog
+    instrument_methods(App, exclude=("dialog",))
+    assert App.dialog is original
+    assert App.handler.__wrapped__ is not None
+    App().handler()
+    App().dialog()
+    assert list(snapshot()["calls"]) == ["App.handler"]
+
+
+def test_only_outermost_call_is_timed():
+    @timed("inner")
+    def inner():
+        return [1]
+
+    @timed("outer")
+    def outer():
+        return inner()
+
+    outer()
+    inner()
+    calls = snapshot()["calls"]
+    assert calls["outer"]["count"] == 1
+    # 嵌套调用的耗时已计入外层，只有直接调用 inner 那一次单独计时
+    assert calls["inner"]["count"] == 1
@@ -0,0 +1,77 @@
+# tests/test_migrations.py
+import sqlite3
+
+import pytest
+
+import database
+
+LEGACY_SCHEMA = """
+    CREATE TABLE transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        type TEXT NOT NULL,
+        amount REAL NOT NULL,
+        category TEXT,
+        description TEXT
+    );
+    CREATE TABLE budget_alert (
+        id INTEGER PRIMARY KEY,
+        monthly_budget REAL,
+        last_alert_month TEXT
+    );
+    INSERT INTO transactions(date, type, amount, category, description) VALUES
+        ('2024-01-10', 'income', 100.5, '工资', ''),
+        ('2024-01-11', 'expense', 0.1, '', '早餐'),
+        ('2024-02-01', 'expense', 19.99, '餐饮', NULL);
+    INSERT INTO budget_alert(id, monthly_budget) VALUES (1, 1500.5);
+"""
+
+
+@pytest.fixture
+def legacy_db(db_path):
+    """ 未记录版本号的旧数据库（金额为 REAL 元，分类为文本列）"""
+    conn = sqlite3.connect(db_path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.close()
+    return db_path
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def test_legacy_database_is_migrated(legacy_db):
+    conn = database.get_connection()
+    assert database.create_tables(conn, lambda *_: None) == database.SCHEMA_VERSION
+    assert schema_version(conn) == database.SCHEMA_VERSION
+    assert database.column_type(conn, "transactions", "amount") == "INTEGER"
+    assert database.column_type(conn, "transactions", "category") is None
+    assert conn.execute("SELECT t.amount, c.name FROM transactions t "
+                        "JOIN categories c ON c.id = t.category_id ORDER BY t.id").fetchall() == \
+        [(10050, "工资"), (10, "未分类"), (1999, "餐饮")]
+    assert database.verify_monthly_totals(conn) == []
+    assert database.verify_daily_balances(conn) == []
+
+
+def test_up_to_date_database_is_left_alone(conn):
+    steps = []
+    conn.execute("INSERT INTO transactions(date, type, amount, category_id) VALUES ('2024-01-01', 'expense', 1, 1)")
+    conn.commit()
+    assert database.create_tables(conn, lambda *args: steps.append(args)) == database.SCHEMA_VERSION
+    assert steps == []
+    assert database.migrate(conn, None) == database.SCHEMA_VERSION
+    assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 1
+
+
+def test_failed_migration_rolls_back(legacy_db, monkeypatch):
+    def broken(conn, progress=None):
+        raise sqlite3.OperationalError("迁移中断")
+
+    monkeypatch.setattr(database, "MIGRATIONS", database.MIGRATIONS + [("中断", broken)])
+    monkeypatch.setattr(database, "SCHEMA_VERSION", len(database.MIGRATIONS))
+    conn = database.get_connection()
+    with pytest.raises(sqlite3.OperationalError):
+        database.create_tables(conn, lambda *_: None)
+    assert schema_version(conn) == 0
+    assert database.column_type(conn, "transactions", "amount") == "REAL"
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'monthly_totals'").fetchone() is None
@@ -0,0 +1,54 @@
+# tests/test_pagination.py
+from archive import archive_year
+from main import add_transactions_batch, get_transactions_page
+
+
+def seed(conn):
+    # 每天 3 条，同一日期内按 id 区分先后
+    rows = [{"date": f"{year}-03-{day:02d}", "type": "expense", "amount": str(day)}
+            for year in (2020, 2024) for day in range(1, 8) for _ in range(3)]
+    add_transactions_batch(rows, conn)
+    conn.commit()
+
+
+def keys(page):
+    return [(date, row_id) for row_id, date, *_ in page]
+
+
+def walk(conn, limit):
+    pages, page = [], get_transactions_page(conn, limit=limit)
+    while page:
+        pages.append(page)
+        page = get_transactions_page(conn, after=keys(page)[-1], limit=limit)
+    return pages
+
+
+def expected(conn):
+    return conn.execute("SELECT date, id FROM all_transactions ORDER BY date DESC, id DESC").fetchall()
+
+
+def test_pages_cover_every_row_once_across_equal_dates(conn):
+    seed(conn)
+    pages = walk(conn, 4)
+    assert [len(page) for page in pages] == [4] * 10 + [2]
+    assert [key for page in pages for key in keys(page)] == \
+        [tuple(row) for row in conn.execute("SELECT date, id FROM transactions "
+                                            "ORDER BY date DESC, id DESC")]
+
+
+def test_paging_back_returns_the_previous_page(conn):
+    seed(conn)
+    first = get_transactions_page(conn, limit=5)
+    second = get_transactions_page(conn, after=keys(first)[-1], limit=5)
+    assert get_transactions_page(conn, before=keys(second)[0], limit=5) == first
+    assert get_transactions_page(conn, before=keys(first)[0], limit=5) == []
+
+
+def test_pages_continue_into_archived_years(conn):
+    seed(conn)
+    archive_year(conn, "2020")
+    pages = walk(conn, 5)
+    assert [key for page in pages for key in keys(page)] == [tuple(row) for row in expected(conn)]
+    assert len(pages[-1]) == 2
+    last = pages[-1]
+    assert get_transactions_page(conn, before=keys(last)[0], limit=5) == pages[-2]
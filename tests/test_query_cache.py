@@ -0,0 +1,118 @@
+# tests/test_query_cache.py
+import datetime
+import sqlite3
+
+import database
+import query_cache
+from query_cache import cached_query, flush_writes, note_write
+from writer import DBWriter
+from main import add_transaction, add_transactions_batch, balance_at, set_budget, show_summary
+
+
+def external_connection(db_path):
+    """ 模拟另一个进程：独立连接，不经数据层（不调用 note_write / flush_writes）"""
+    return database.configure_connection(sqlite3.connect(db_path))
+
+
+def add_expense_today(conn, amount):
+    conn.execute("INSERT INTO transactions(date, type, amount, category_id) VALUES (?, 'expense', ?, ?)",
+                 (datetime.date.today().isoformat(), amount, database.get_category_id(conn, "餐饮")))
+
+
+def test_local_write_sees_its_own_commit(conn):
+    assert show_summary(conn, gui_mode=True)["expense"] == 0.0
+    add_transaction(auto=True, auto_data={"date": datetime.date.today().isoformat(),
+                                          "type": "expense", "amount": "3"})
+    assert show_summary(conn, gui_mode=True)["expense"] == 3.0
+
+
+def test_external_commit_not_hidden_by_local_commit(conn, db_path):
+    assert show_summary(conn, gui_mode=True)["expense"] == 0.0
+    other = external_connection(db_path)
+    try:
+        add_expense_today(other, 500)
+        other.commit()
+    finally:
+        other.close()
+    # 本进程随后提交了一次无关的写入，不能掩盖外部提交
+    set_budget(conn, 100)
+    assert show_summary(conn, gui_mode=True)["expense"] == 5.0
+
+
+def test_external_commit_flushes_cache(conn, db_path):
+    assert show_summary(conn, gui_mode=True)["expense"] == 0.0
+    other = external_connection(db_path)
+    try:
+        add_expense_today(other, 700)
+        other.commit()
+    finally:
+        other.close()
+    assert show_summary(conn, gui_mode=True)["expense"] == 7.0
+
+
+COUNT_SQL = "SELECT COUNT(*) FROM transactions"
+
+
+def test_committed_write_invalidates_dependent_entries(conn):
+    database.get_category_id(conn, "餐饮")
+    conn.commit()
+    flush_writes()
+    query_cache.invalidate()
+    categories = cached_query(conn, "SELECT COUNT(*) FROM categories", (), ("categories",))
+    assert cached_query(conn, COUNT_SQL, (), ("transactions",)) == [(0,)]
+    add_expense_today(conn, 100)
+    note_write("transactions")
+    # 未提交的写入：依赖表已写过，绕过缓存直接查询
+    assert cached_query(conn, COUNT_SQL, (), ("transactions",)) == [(1,)]
+    conn.commit()
+    flush_writes()
+    hits = query_cache.cache_stats()["hits"]
+    assert cached_query(conn, COUNT_SQL, (), ("transactions",)) == [(1,)]
+    assert cached_query(conn, "SELECT COUNT(*) FROM categories", (), ("categories",)) == categories
+    # 只有未写过的 categories 条目命中
+    assert query_cache.cache_stats()["hits"] == hits + 1
+
+
+def test_rolled_back_write_is_not_cached(conn):
+    query_cache.invalidate()
+    add_expense_today(conn, 100)
+    note_write("transactions")
+    assert cached_query(conn, COUNT_SQL, (), ("transactions",)) == [(1,)]
+    conn.rollback()
+    flush_writes()
+    assert cached_query(conn, COUNT_SQL, (), ("transactions",)) == [(0,)]
+
+
+def test_rebuilds_invalidate_cached_rollups(conn):
+    add_expense_today(conn, 2400)
+    conn.commit()
+    today = datetime.date.today().isoformat()
+    assert balance_at(conn, today) == -24.0
+    assert show_summary(conn, gui_mode=True)["expense"] == 24.0
+    # 修复不一致：直接改写交易表（不经触发器维护的路径）后重建汇总表
+    conn.execute("DROP TRIGGER trg_daily_balances_update")
+    conn.execute("DROP TRIGGER trg_monthly_totals_update")
+    conn.execute("UPDATE transactions SET amount = 120000")
+    conn.commit()
+    database.rebuild_daily_balances(conn)
+    database.rebuild_monthly_totals(conn)
+    assert balance_at(conn, today) == -1200.0
+    assert show_summary(conn, gui_mode=True)["expense"] == 1200.0
+
+
+def test_writer_commits_invalidate_only_their_tables(conn):
+    """ GUI 的路径：写线程在另一个连接上提交，主线程的缓存只按表失效，不整体清空 """
+    assert show_summary(conn, gui_mode=True)["expense"] == 0.0
+    budgets = cached_query(conn, "SELECT COUNT(*) FROM budgets", (), ("budgets",))
+    writer = DBWriter()
+    try:
+        rows = [{"date": datetime.date.today().isoformat(), "type": "expense", "amount": "4"}]
+        writer.call(lambda writer_conn: add_transactions_batch(rows, writer_conn))
+    finally:
+        writer.stop()
+    flushes = query_cache.cache_stats()["external_flushes"]
+    hits = query_cache.cache_stats()["hits"]
+    assert show_summary(conn, gui_mode=True)["expense"] == 4.0
+    assert cached_query(conn, "SELECT COUNT(*) FROM budgets", (), ("budgets",)) == budgets
+    assert query_cache.cache_stats()["hits"] == hits + 1
+    assert query_cache.cache_stats()["external_flushes"] == flushes
@@ -0,0 +1,6 @@
+# tests/test_query_plans.py
+from main import verify_query_plans
+
+
+def test_hot_queries_use_indexes(conn):
+    assert verify_query_plans(conn)
@@ -0,0 +1,122 @@
+# tests/test_recurrence.py
+import datetime
+import sqlite3
+from itertools import islice
+
+import database
+from main import add_recurring_rule, get_recurring_rules, materialize_due
+from recurrence import iter_occurrences, next_occurrence
+
+
+def rule(freq, start_date, every=1, day=None, nth=None, month=None, end_date=None):
+    return {"freq": freq, "every": every, "day": day, "nth": nth, "month": month,
+            "start_date": start_date, "end_date": end_date}
+
+
+def dates(rule, count, after=None):
+    return [day.isoformat() for day in islice(iter_occurrences(rule, after), count)]
+
+
+def test_month_end_is_clamped():
+    payday_31 = rule("monthly", "2023-12-31", day=31)
+    assert dates(payday_31, 4) == ["2023-12-31", "2024-01-31", "2024-02-29", "2024-03-31"]
+    assert next_occurrence(payday_31, "2025-01-31") == "2025-02-28"
+    assert dates(rule("monthly", "2024-01-01", day=-1), 2) == ["2024-01-31", "2024-02-29"]
+    assert dates(rule("yearly", "2024-02-29", day=29, month=2), 2) == ["2024-02-29", "2025-02-28"]
+
+
+def test_nth_weekday():
+    second_tuesday = rule("nth_weekday", "2024-01-01", day=1, nth=2)
+    assert dates(second_tuesday, 3) == ["2024-01-09", "2024-02-13", "2024-03-12"]
+    last_friday = rule("nth_weekday", "2024-01-01", day=4, nth=-1)
+    assert dates(last_friday, 3) == ["2024-01-26", "2024-02-23", "2024-03-29"]
+
+
+def test_every_skips_periods():
+    assert dates(rule("daily", "2024-01-01", every=3), 3) == ["2024-01-01", "2024-01-04", "2024-01-07"]
+    assert dates(rule("weekly", "2024-01-01", every=2, day=2), 3) == \
+        ["2024-01-03", "2024-01-17", "2024-01-31"]
+    every_other_month = rule("monthly", "2024-01-15", every=2, day=15)
+    assert dates(every_other_month, 3) == ["2024-01-15", "2024-03-15", "2024-05-15"]
+    # 从中途推算时仍按起始周期对齐
+    assert next_occurrence(every_other_month, "2024-02-01") == "2024-03-15"
+    assert next_occurrence(rule("monthly", "2024-01-15", every=2, day=15, end_date="2024-04-30"),
+                           "2024-03-15") is None
+
+
+def weekly_rent(conn):
+    return add_recurring_rule(conn, "expense", 10, "房租", "weekly", "2024-01-01")
+
+
+def test_weekly_catch_up_and_rerun_is_idempotent(conn):
+    rule_id = weekly_rent(conn)
+    assert materialize_due(conn, "2024-01-29") == 5
+    assert [row[0] for row in conn.execute("SELECT date FROM transactions ORDER BY date")] == \
+        ["2024-01-01", "2024-01-08", "2024-01-15", "2024-01-22", "2024-01-29"]
+    assert get_recurring_rules(conn)[0]["next_due"] == "2024-02-05"
+    assert materialize_due(conn, "2024-01-29") == 0
+    assert materialize_due(conn, "2024-02-05") == 1
+    assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 6
+    assert conn.execute("SELECT next_due FROM recurring_rules WHERE id = ?",
+                        (rule_id,)).fetchone()[0] == "2024-02-12"
+
+
+def test_skip_existing_rules_do_not_duplicate_backfill(conn):
+    add_recurring_rule(conn, "expense", 15, "餐饮", "daily", "2024-01-01", kind="daily_default",
+                       skip_existing=True)
+    conn.execute("INSERT INTO transactions(date, type, amount, category_id) VALUES (?, 'expense', 2000, ?)",
+                 ("2024-01-02", database.get_category_id(conn, "餐饮")))
+    conn.commit()
+    assert materialize_due(conn, "2024-01-03") == 2
+    assert materialize_due(conn, "2024-01-03", since="2024-01-01") == 0
+    assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 3
+
+
+LEGACY_SALARY = """
+    CREATE TABLE transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL, type TEXT NOT NULL, amount REAL NOT NULL,
+        category TEXT, description TEXT
+    );
+    CREATE TABLE salary_settings (
+        id INTEGER PRIMARY KEY,
+        payday INTEGER NOT NULL CHECK(payday BETWEEN 1 AND 31),
+        amount REAL NOT NULL,
+        start_date TEXT NOT NULL,
+        is_active BOOLEAN DEFAULT 1
+    );
+    CREATE TABLE daily_defaults (
+        id INTEGER PRIMARY KEY,
+        type TEXT CHECK(type IN ('income', 'expense')),
+        amount REAL NOT NULL,
+        category TEXT, description TEXT,
+        is_active BOOLEAN DEFAULT 1
+    );
+"""
+
+
+def test_legacy_salary_and_defaults_become_rules(db_path):
+    today = datetime.date.today()
+    legacy = sqlite3.connect(db_path)
+    legacy.executescript(LEGACY_SALARY)
+    legacy.execute("INSERT INTO salary_settings(payday, amount, start_date, is_active) "
+                   "VALUES (1, 8000.5, '2020-01-01', 1)")
+    # 本月的工资已经发过（旧版录入的薪资收入）
+    legacy.execute("INSERT INTO transactions(date, type, amount, category, description) "
+                   "VALUES (?, 'income', 8000.5, '薪资', '月度工资')", (today.replace(day=1).isoformat(),))
+    legacy.execute("INSERT INTO daily_defaults(type, amount, category, description, is_active) "
+                   "VALUES ('expense', 12.5, '餐饮', '午餐', 1), ('expense', 3, '交通', '', 0)")
+    legacy.commit()
+    legacy.close()
+
+    conn = database.get_connection()
+    database.create_tables(conn, lambda *_: None)
+    salary, lunch = get_recurring_rules(conn)
+    assert (salary["kind"], salary["day"], salary["amount"]) == ("salary", 1, 8000.5)
+    assert salary["next_due"] > today.isoformat()
+    assert (lunch["kind"], lunch["amount"], lunch["next_due"]) == ("daily_default", 12.5, today.isoformat())
+
+    materialize_due(conn)
+    assert conn.execute("SELECT COUNT(*) FROM transactions WHERE type = 'income'").fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM transactions WHERE description = '午餐'").fetchone()[0] == 1
+    assert database.column_type(conn, "salary_settings", "payday") is None
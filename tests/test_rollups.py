@@ -0,0 +1,63 @@
+# tests/test_rollups.py
+import datetime
+
+from database import get_category_id, rebuild_monthly_totals, verify_monthly_totals
+from main import add_transactions_batch, delete_transaction, show_summary
+
+
+def seed(conn):
+    rows = [{"date": "2024-01-10", "type": "income", "amount": "100", "category": "工资"},
+            {"date": "2024-01-10", "type": "expense", "amount": "30", "category": "餐饮"},
+            {"date": "2024-01-20", "type": "expense", "amount": "20", "category": "餐饮"},
+            {"date": "2024-02-05", "type": "expense", "amount": "5", "category": "交通"}]
+    add_transactions_batch(rows, conn)
+    conn.commit()
+
+
+def month_totals(conn):
+    return conn.execute("SELECT month, type, category_id, total, count FROM monthly_totals "
+                        "ORDER BY 1, 2, 3").fetchall()
+
+
+def test_inserts_maintain_rollups(conn):
+    seed(conn)
+    food = get_category_id(conn, "餐饮")
+    assert ("2024-01", "expense", food, 5000, 2) in month_totals(conn)
+    assert len(month_totals(conn)) == 3
+    assert verify_monthly_totals(conn) == []
+
+
+def test_update_moves_amount_between_months_and_categories(conn):
+    seed(conn)
+    transport = get_category_id(conn, "交通")
+    conn.execute("UPDATE transactions SET date = '2024-02-10', category_id = ? WHERE amount = 2000",
+                 (transport,))
+    conn.commit()
+    assert ("2024-02", "expense", transport, 2500, 2) in month_totals(conn)
+    assert verify_monthly_totals(conn) == []
+
+
+def test_delete_removes_empty_rows(conn):
+    seed(conn)
+    record_id = conn.execute("SELECT id FROM transactions WHERE date = '2024-02-05'").fetchone()[0]
+    assert delete_transaction(conn, record_id)
+    assert not any(month == "2024-02" for month, *_ in month_totals(conn))
+    assert verify_monthly_totals(conn) == []
+
+
+def test_verification_reports_drift_and_rebuild_fixes_it(conn):
+    seed(conn)
+    conn.execute("UPDATE monthly_totals SET total = total + 1 WHERE month = '2024-02'")
+    conn.commit()
+    assert [row[0] for row in verify_monthly_totals(conn)] == ["2024-02"]
+    rebuild_monthly_totals(conn)
+    assert verify_monthly_totals(conn) == []
+
+
+def test_summary_reads_current_month_from_rollup(conn):
+    today = datetime.date.today().isoformat()
+    add_transactions_batch([{"date": today, "type": "income", "amount": "8"},
+                            {"date": today, "type": "expense", "amount": "3"}], conn)
+    conn.commit()
+    summary = show_summary(conn, gui_mode=True)
+    assert (summary["income"], summary["expense"]) == (8.0, 3.0)
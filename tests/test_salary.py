@@ -0,0 +1,30 @@
+# tests/test_salary.py
+import datetime
+
+from main import add_recurring_rule, auto_add_salary
+
+
+def add_salary(conn, amount, payday, start_date, end_date=None):
+    return add_recurring_rule(conn, "income", amount, "薪资", "monthly", start_date, end_date,
+                              day=payday, description="月度工资", kind="salary")
+
+
+def payments(conn):
+    return conn.execute("SELECT date, amount FROM transactions WHERE type = 'income' "
+                        "ORDER BY date").fetchall()
+
+
+def test_missed_months_are_backfilled_once(conn):
+    add_salary(conn, 5000, 31, "2024-01-01")
+    assert auto_add_salary(conn, datetime.date(2024, 4, 15)) == 3
+    assert payments(conn) == [("2024-01-31", 500000), ("2024-02-29", 500000), ("2024-03-31", 500000)]
+    assert auto_add_salary(conn, datetime.date(2024, 4, 15)) == 0
+    assert auto_add_salary(conn, datetime.date(2024, 4, 30)) == 1
+
+
+def test_backfill_follows_the_settings_history(conn):
+    add_salary(conn, 5000, 10, "2024-01-01", "2024-02-29")
+    add_salary(conn, 6000, 20, "2024-03-01")
+    assert auto_add_salary(conn, datetime.date(2024, 4, 25)) == 4
+    assert payments(conn) == [("2024-01-10", 500000), ("2024-02-10", 500000),
+                              ("2024-03-20", 600000), ("2024-04-20", 600000)]
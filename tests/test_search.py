@@ -0,0 +1,47 @@
+# tests/test_search.py
+from main import add_transactions_batch, delete_transaction, search_transactions
+
+
+def seed(conn):
+    rows = [{"date": "2024-01-05", "type": "expense", "amount": "300", "category": "医疗",
+             "description": "牙医复诊"},
+            {"date": "2024-02-10", "type": "expense", "amount": "45", "category": "餐饮",
+             "description": "Dentist lunch"},
+            {"date": "2024-03-15", "type": "expense", "amount": "12", "category": "交通",
+             "description": "地铁"},
+            {"date": "2024-04-01", "type": "expense", "amount": "80", "category": "医疗",
+             "description": "买药"}]
+    add_transactions_batch(rows, conn)
+    conn.commit()
+
+
+def descriptions(rows):
+    return sorted(row[5] for row in rows)
+
+
+def test_chinese_substrings_and_english_prefixes(conn):
+    seed(conn)
+    assert descriptions(search_transactions(conn, "牙医")) == ["牙医复诊"]
+    assert descriptions(search_transactions(conn, "复诊")) == ["牙医复诊"]
+    assert descriptions(search_transactions(conn, "dent")) == ["Dentist lunch"]
+    assert descriptions(search_transactions(conn, "医疗")) == ["买药", "牙医复诊"]
+    assert descriptions(search_transactions(conn, "医疗 药")) == ["买药"]
+    assert search_transactions(conn, "  ") == []
+
+
+def test_filters_by_date_and_amount(conn):
+    seed(conn)
+    assert descriptions(search_transactions(conn, "医疗", start="2024-02-01")) == ["买药"]
+    assert descriptions(search_transactions(conn, "医疗", end="2024-04-01")) == ["牙医复诊"]
+    assert descriptions(search_transactions(conn, "医疗", min_amount=100)) == ["牙医复诊"]
+    assert descriptions(search_transactions(conn, "医疗", max_amount="80")) == ["买药"]
+
+
+def test_index_follows_updates_and_deletes(conn):
+    seed(conn)
+    conn.execute("UPDATE transactions SET description = '洗牙' WHERE description = '地铁'")
+    conn.commit()
+    assert search_transactions(conn, "地铁") == []
+    [(record_id, *_)] = search_transactions(conn, "洗牙")
+    assert delete_transaction(conn, record_id)
+    assert search_transactions(conn, "洗牙") == []
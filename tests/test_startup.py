@@ -0,0 +1,20 @@
+# tests/test_startup.py
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytest.importorskip("tkinter")
+
+
+def test_gui_import_defers_heavy_modules():
+    """ 导入界面模块时不应带入导出、备份、归档模块（以及经由它们的 pyarrow/numpy） """
+    code = ("import sys, GUI; "
+            "print(','.join(m for m in ('exporter', 'backup', 'archive', 'pyarrow', 'numpy') "
+            "if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True,
+                            text=True, check=True)
+    assert result.stdout.strip() == ""
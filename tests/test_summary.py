@@ -0,0 +1,51 @@
+# tests/test_summary.py
+import pytest
+
+from main import add_transactions_batch, summarize
+
+CATEGORIES = ("餐饮", "交通", "工资")
+
+
+def seed(conn):
+    rows = [{"date": f"2024-{month:02d}-{day:02d}", "type": "income" if day == 28 else "expense",
+             "amount": f"{month}.{day:02d}", "category": CATEGORIES[(month + day) % 3]}
+            for month in range(1, 13) for day in (1, 9, 15, 28)]
+    add_transactions_batch(rows, conn)
+    conn.commit()
+
+
+def brute_force(conn, start, end):
+    """ 直接扫描交易表的参照结果：{(month, category, type): (金额分, 笔数)} """
+    rows = conn.execute("""SELECT substr(t.date, 1, 7), c.name, t.type, SUM(t.amount), COUNT(*)
+                           FROM transactions t JOIN categories c ON c.id = t.category_id
+                           WHERE t.date >= ? AND t.date < ? GROUP BY 1, 2, 3""", (start, end))
+    return {(month, category, kind): (total, count) for month, category, kind, total, count in rows}
+
+
+@pytest.mark.parametrize("start, end", [
+    ("2024-01-01", "2025-01-01"),   # 整月
+    ("2024-02-09", "2024-07-15"),   # 首尾都是零头
+    ("2024-03-02", "2024-03-28"),   # 区间不含完整月份
+    ("2024-05-01", "2024-05-01"),   # 空区间
+])
+def test_ranges_match_a_full_scan(conn, start, end):
+    seed(conn)
+    expected = brute_force(conn, start, end)
+    result = summarize(conn, start, end, ("month", "category", "type"))
+    assert {(row["month"], row["category"], row["type"]):
+            (round((row["income"] or row["expense"]) * 100), row["count"]) for row in result} == expected
+    total = summarize(conn, start, end)
+    assert sum(row["count"] for row in total) == sum(count for _, count in expected.values())
+
+
+def test_dimensions_are_sorted_and_balanced(conn):
+    seed(conn)
+    by_category = summarize(conn, "2024-01-01", "2024-02-01", ("category",))
+    assert [row["category"] for row in by_category] == sorted(row["category"] for row in by_category)
+    for row in by_category:
+        assert row["balance"] == round(row["income"] - row["expense"], 2)
+
+
+def test_unknown_dimension_is_rejected(conn):
+    with pytest.raises(ValueError):
+        summarize(conn, group_by=("week",))
@@ -0,0 +1,36 @@
+# tests/test_writer.py
+import sqlite3
+
+import pytest
+
+import main
+from main import get_active_salary, set_salary
+from writer import DBWriter
+
+
+@pytest.fixture
+def writer(conn):
+    writer = DBWriter()
+    yield writer
+    writer.stop()
+
+
+def test_failed_task_does_not_affect_others(conn, writer):
+    assert writer.call(set_salary, 10, 5000, commit=False)
+    with pytest.raises(sqlite3.DatabaseError):
+        writer.call(set_salary, 40, 6000, commit=False)  # 发薪日无效
+    assert get_active_salary(conn) == (10, 5000.0)
+
+
+def test_failed_salary_update_keeps_current_rule(conn, writer, monkeypatch):
+    assert set_salary(conn, 10, 5000)
+
+    def broken(*args, **kwargs):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(main, "add_recurring_rule", broken)
+    with pytest.raises(sqlite3.DatabaseError):
+        writer.call(set_salary, 15, 6000, commit=False)
+    assert get_active_salary(conn) == (10, 5000.0)
+    assert not set_salary(conn, 15, 6000)
+    assert get_active_salary(conn) == (10, 5000.0)
@@ -0,0 +1,118 @@
+# writer.py
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from database import get_connection, close_connection, clear_category_cache, attach_archives
+from query_cache import flush_writes
+from budget_events import collect_events, pending_mark, discard_events, publish_events
+
+
+class DBWriter:
+    """
+    单一写线程：GUI 的所有写操作经队列交给同一个长期线程执行
+    - 队列中积压的多个写操作合并为一个事务提交（group commit），减少 fsync
+    - 每个操作用 SAVEPOINT 隔离，单个失败只回滚它自己
+    - 完成回调通过 dispatch（GUI 中为 root.after）交回主线程执行
+    - 写入触发的预算告警在提交后发布（回滚的操作不产生告警），界面用 drain_events 取走
+    """
+    MAX_BATCH = 64  # 单次合并提交的最大操作数
+
+    def __init__(self, dispatch=None, max_batch=MAX_BATCH):
+        self.dispatch = dispatch or (lambda fn: fn())
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self._callbacks_enabled = True
+        self.thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, func, *args, callback=None, errback=None, **kwargs):
+        """
+        提交写操作，在写线程中以 func(conn, *args, **kwargs) 调用
+        func 不应自行提交事务（带 commit 参数的函数需传入 commit=False）
+        callback(result) / errback(错误信息) 在主线程中执行
+        """
+        self.queue.put((func, args, kwargs, callback, errback, True))
+
+    def call(self, func, *args, **kwargs):
+        """
+        提交写操作并阻塞等待其提交，返回 func 的结果；失败时抛出 sqlite3.DatabaseError
+        供后台工作线程把写库步骤交给写线程执行（不能在主线程或写线程中调用）
+        """
+        future = Future()
+        self.queue.put((func, args, kwargs, future.set_result,
+                        lambda error: future.set_exception(sqlite3.DatabaseError(error)), False))
+        return future.result()
+
+    def stop(self, timeout=5):
+        """ 执行完已排队的写操作后停止（退出时调用，不再触发回调）"""
+        self._callbacks_enabled = False
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def _run(self):
+        conn = get_connection()
+        collect_events()
+        running = True
+        while running:
+            task = self.queue.get()
+            if task is None:
+                break
+
+            # 合并同一时刻积压的写操作
+            batch = [task]
+            while len(batch) < self.max_batch:
+                try:
+                    task = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if task is None:
+                    running = False
+                    break
+                batch.append(task)
+
+            for callback, value, dispatch in self._execute(conn, batch):
+                if callback and not dispatch:
+                    callback(value)  # call() 的等待方，不经主线程
+                elif callback and self._callbacks_enabled:
+                    self.dispatch(lambda cb=callback, v=value: cb(v))
+        close_connection()
+
+    def _execute(self, conn, batch):
+        """ 在一个事务中执行一批写操作，返回 [(回调, 参数, 是否经 dispatch), ...] """
+        outcomes = []
+        try:
+            # 新建周预算等需要读取归档库，ATTACH 不能在事务中执行，先打开全部归档库
+            attach_archives(conn)
+        except sqlite3.Error:
+            pass  # 归档库文件缺失时只影响需要读取归档的操作，由它们各自报错
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for func, args, kwargs, callback, errback, dispatch in batch:
+                conn.execute("SAVEPOINT task")
+                mark = pending_mark()
+                try:
+                    result = func(conn, *args, **kwargs)
+                    conn.execute("RELEASE task")
+                    outcomes.append((callback, result, errback, None, dispatch))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO task")
+                    conn.execute("RELEASE task")
+                    clear_category_cache()
+                    discard_events(mark)
+                    outcomes.append((callback, None, errback, str(e), dispatch))
+            conn.commit()
+            # 提交后再使缓存失效，避免其他线程在提交前读到旧数据并以新版本号缓存
+            flush_writes()
+            publish_events()
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.rollback()
+            clear_category_cache()
+            discard_events()
+            flush_writes()
+            # 提交失败时整批视为失败
+            return [(errback, f"数据库错误: {e}", dispatch) for *_, errback, dispatch in batch]
+
+        return [(errback, error, dispatch) if error is not None else (callback, result, dispatch)
+                for callback, result, errback, error, dispatch in outcomes]